@@ -1,192 +1,945 @@
-from flask import Flask, jsonify, send_from_directory
+from flask import Blueprint, Flask, Response, current_app, g, jsonify, request, send_from_directory
+import functools
 import json
 from flask_cors import CORS
 import os
-import geopandas as gpd
-import networkx as nx
 import math
+import socket
+import time
 
 from database import db
-from utils import dijkstra_with_steps, astar_with_steps, bellman_ford_with_steps, euclidean_heuristic, manhattan_heuristic, floyd_warshall_with_steps, calculate_total_weight
+from utils import dijkstra_with_steps, astar_with_steps, bellman_ford_with_steps, euclidean_heuristic, manhattan_heuristic, floyd_warshall_with_steps, calculate_total_weight, TRACE_MODES, iter_best_first_search, iter_bellman_ford, bidirectional_dijkstra_with_steps, bidirectional_astar_with_steps, contraction_hierarchy_with_steps
 from database_manager import DatabaseManager
+from graph_registry import GraphRegistry
+from graph_responses import GraphResponseCache
+from graph_builder import build_csr_graph, read_lines
+from chain_contraction import contract_chains
+from contraction_hierarchy import load_contraction_hierarchy
+from build_ch import ch_path
+from landmarks import build_landmark_heuristic, load_landmark_heuristic
+from build_landmarks import landmarks_path
+from distance_matrix import distances_between, load_distance_matrix, open_distance_matrix
+from build_matrix import matrix_path
+from build_bundle import bundle_path
+from graph_bundle import load_graph_bundle, open_graph_bundle
+from batch_routing import iter_batch_routes
+from route_cache import RouteCache, decode_result, encode_result, route_key
+from result_writer import ResultWriter
+from preload import GraphPreloader, preload_graph_ids
+from search_executor import Cancelled, DeadlineExceeded, Overloaded, SearchExecutor, parse_deadlines
+import metrics
+from metrics import phase
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-app = Flask(__name__, static_folder='../frontend', static_url_path='')
-
-# Configure the database URI
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(basedir, "data/performance.db")}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db.init_app(app)
-CORS(app)
-
-@app.route('/favicon.ico')
+api = Blueprint('api', __name__)
+
+# Shared by the requests of the app made by create_app, one per process
+graph_registry = None
+result_writer = None
+route_cache = None
+graph_responses = None
+search_executor = None
+preloader = None
+
+def configure(app):
+    """Sets the defaults of every setting, most read from the environment."""
+    # Configure the database URI
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(basedir, "data/performance.db")}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # Graphs are built once per process and shared between requests
+    app.config['GRAPH_CACHE_MAX_BYTES'] = int(os.environ.get('GRAPH_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+    # Compile missing or stale bundles on first use, so every worker process
+    # maps the same arrays instead of building its own copy of the graph
+    app.config['GRAPH_BUNDLE_COMPILE'] = os.environ.get('GRAPH_BUNDLE_COMPILE', '1') != '0'
+    # Single route searches run on the graph with its chains of degree-2
+    # nodes collapsed into single edges, so they settle junctions only
+    app.config['CONTRACT_CHAINS'] = os.environ.get('CONTRACT_CHAINS', '1') != '0'
+
+    # Distance-matrix requests are answered from the all-pairs matrix that
+    # build_matrix.py saved for a graph. Without one, graphs up to this many
+    # nodes get theirs built in process (about 12 bytes per pair), larger
+    # ones are answered with one search per distinct source or target
+    app.config['DISTANCE_MATRIX_MAX_NODES'] = int(os.environ.get('DISTANCE_MATRIX_MAX_NODES', 2000))
+    app.config['DISTANCE_MATRIX_MAX_CELLS'] = int(os.environ.get('DISTANCE_MATRIX_MAX_CELLS', 1000000))
+
+    # History rows are written in bulk by a background thread once this many
+    # are queued or the oldest has waited this many seconds
+    app.config['RESULT_WRITER_BATCH'] = int(os.environ.get('RESULT_WRITER_BATCH', 500))
+    app.config['RESULT_WRITER_DELAY'] = float(os.environ.get('RESULT_WRITER_DELAY', 1.0))
+
+    # Route results are memoized in memory and, when ROUTE_CACHE_DB names a
+    # SQLite file, on disk as well
+    app.config['ROUTE_CACHE_MAX_BYTES'] = int(os.environ.get('ROUTE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    app.config['ROUTE_CACHE_DB'] = os.environ.get('ROUTE_CACHE_DB', '')
+
+    # Requested coordinates snap to the nearest node up to this far away
+    app.config['SNAP_MAX_DISTANCE'] = float(os.environ.get('SNAP_MAX_DISTANCE', 100.0))
+    app.config['SNAP_MAX_POINTS'] = int(os.environ.get('SNAP_MAX_POINTS', 100000))
+
+    # /api/statistics?wait= holds a request at most this many seconds for new results
+    app.config['STATISTICS_MAX_WAIT'] = float(os.environ.get('STATISTICS_MAX_WAIT', 30.0))
+
+    # Memory budget of the serialized and precompressed /api/graph responses
+    app.config['GRAPH_RESPONSE_CACHE_MAX_BYTES'] = int(os.environ.get('GRAPH_RESPONSE_CACHE_MAX_BYTES', 128 * 1024 * 1024))
+
+    # Batch routing spreads source groups over this many forked processes
+    app.config['BATCH_ROUTING_PROCESSES'] = int(os.environ.get('BATCH_ROUTING_PROCESSES', os.cpu_count() or 1))
+    app.config['BATCH_ROUTING_MAX_PAIRS'] = int(os.environ.get('BATCH_ROUTING_MAX_PAIRS', 100000))
+
+    # Searches by these algorithms run in forked processes, at most
+    # SEARCH_PROCESSES at a time with up to SEARCH_QUEUE more waiting; further
+    # requests get a 429. Searches and streams are stopped after their
+    # deadline, SEARCH_DEADLINE seconds unless SEARCH_DEADLINES ("Name=seconds,...")
+    # gives one for the algorithm
+    app.config['SEARCH_OFFLOAD'] = os.environ.get('SEARCH_OFFLOAD', 'BellmanFord')
+    app.config['SEARCH_PROCESSES'] = int(os.environ.get('SEARCH_PROCESSES', os.cpu_count() or 1))
+    app.config['SEARCH_QUEUE'] = int(os.environ.get('SEARCH_QUEUE', 16))
+    app.config['SEARCH_DEADLINE'] = float(os.environ.get('SEARCH_DEADLINE', 30.0))
+    app.config['SEARCH_DEADLINES'] = parse_deadlines(os.environ.get('SEARCH_DEADLINES', 'BellmanFord=120'))
+
+    # Graph ids warmed by a background thread at startup, comma separated,
+    # or * for every graph; /api/ready reports when they are done
+    app.config['GRAPH_PRELOAD'] = os.environ.get('GRAPH_PRELOAD', '')
+
+def load_timed_graph(path, compile_bundle=True):
+    """Loads a graph from its compiled bundle, compiling the bundle or building
+    the graph from its GeoJSON file when it is missing or stale, timing each phase."""
+    graph_id = os.path.splitext(os.path.basename(path))[0]
+    with phase('load'):
+        graph = load_graph_bundle(bundle_path(graph_id), path)
+    if graph is not None:
+        return graph
+    if compile_bundle:
+        print(f"No current bundle for {graph_id}, compiling it")
+        try:
+            with phase('build'):
+                graph = open_graph_bundle(bundle_path(graph_id), path)
+        except OSError as e:
+            print(f"Could not compile the bundle of {graph_id}: {e}")
+        if graph is not None:
+            return graph
+    print(f"No current bundle for {graph_id}, building it from GeoJSON")
+    with phase('load'):
+        coords, line_offsets, _ = read_lines(path)
+    with phase('build'):
+        return build_csr_graph(coords, line_offsets)
+
+def create_app(config=None):
+    """Creates the app, its database tables and caches, and starts preloading graphs.
+
+    ``config`` overrides the settings of ``configure``. Graphs, indexes and
+    geometry libraries are only loaded by the requests that need them or
+    by the preload thread, so the app serves requests right away.
+    """
+    global graph_registry, result_writer, route_cache, graph_responses, search_executor, preloader
+
+    app = Flask(__name__, static_folder='../frontend', static_url_path='')
+    configure(app)
+    if config:
+        app.config.update(config)
+
+    db.init_app(app)
+    CORS(app)
+
+    graph_registry = GraphRegistry(
+        os.path.join(basedir, 'data/graph'),
+        functools.partial(load_timed_graph, compile_bundle=app.config['GRAPH_BUNDLE_COMPILE']),
+        max_bytes=app.config['GRAPH_CACHE_MAX_BYTES']
+    )
+
+    result_writer = ResultWriter(
+        app, db,
+        max_batch=app.config['RESULT_WRITER_BATCH'],
+        max_delay=app.config['RESULT_WRITER_DELAY']
+    )
+
+    route_cache = RouteCache(
+        max_bytes=app.config['ROUTE_CACHE_MAX_BYTES'],
+        db_path=app.config['ROUTE_CACHE_DB'] or None
+    )
+
+    graph_responses = GraphResponseCache(
+        os.path.join(basedir, 'data/graph'),
+        max_bytes=app.config['GRAPH_RESPONSE_CACHE_MAX_BYTES']
+    )
+
+    search_executor = SearchExecutor(
+        processes=app.config['SEARCH_PROCESSES'],
+        max_queue=app.config['SEARCH_QUEUE']
+    )
+
+    metrics.register_cache_collector(graph_registry, route_cache, result_writer, graph_responses, search_executor)
+
+    app.register_blueprint(api)
+    create_tables(app)
+
+    preloader = GraphPreloader(
+        preload_graph_ids(app.config['GRAPH_PRELOAD'], graph_registry.graph_dir),
+        functools.partial(warm_graph, contract=app.config['CONTRACT_CHAINS'])
+    )
+    preloader.start()
+    return app
+
+def warm_graph(graph_id, contract=False):
+    """Loads a graph, its spatial index, its chain contraction when
+    ``contract`` is set and its slim /api/graph response."""
+    G = graph_registry.get(graph_id)
+    G.spatial_index()
+    if contract:
+        get_chain_contraction(graph_id, G)
+    graph_responses.get(graph_id, slim=True)
+
+# Every request times its phases (load, build, snap, search, ...) and
+# reports them in a Server-Timing header and the /metrics histograms
+@api.before_app_request
+def start_phase_timer():
+    g.phase_timer_token = metrics.start_request()
+
+@api.after_app_request
+def add_server_timing(response):
+    timer = metrics.current_timer()
+    if timer is not None and timer.phases:
+        response.headers['Server-Timing'] = timer.server_timing()
+        metrics.observe_phases(request.endpoint, timer)
+    return response
+
+@api.teardown_app_request
+def end_phase_timer(exc):
+    token = g.pop('phase_timer_token', None)
+    if token is not None:
+        metrics.end_request(token)
+
+@api.route('/favicon.ico')
 def favicon():
-    return send_from_directory(os.path.join(app.root_path, ''), 'favicon.ico', mimetype='image/vnd.microsoft.icon')
+    return send_from_directory(os.path.join(current_app.root_path, ''), 'favicon.ico', mimetype='image/vnd.microsoft.icon')
 
-@app.route('/')
+@api.route('/')
 def serve_index():
-    return send_from_directory(app.static_folder, 'index.html')
-
-@app.route('/api/graph', methods=['GET'])
+    return send_from_directory(current_app.static_folder, 'index.html')
+
+def send_encoded(encoded):
+    """Sends a cached response in the best encoding the client accepts,
+    or 304 when its ETag or Last-Modified validators still match."""
+    accepted = request.accept_encodings
+    encoding = next((name for name in ('br', 'gzip') if name in encoded.bodies and accepted[name]), 'identity')
+    response = Response(encoded.bodies[encoding], mimetype='application/json')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.set_etag(encoded.etag_for(encoding))
+    response.last_modified = encoded.last_modified
+    # Cached by the browser but revalidated on every use
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@api.route('/api/graph', methods=['GET'])
 def get_all_graphs():
-    graph_files = os.listdir('data/graph')
-    graph_ids = [os.path.splitext(filename)[0] for filename in graph_files if filename.endswith('.geojson')]
-    return jsonify(graph_ids)
+    return send_encoded(graph_responses.graph_list())
 
-@app.route('/api/graph/<graph_id>', methods=['GET'])
+@api.route('/api/graph/<graph_id>', methods=['GET'])
 def get_graph(graph_id):
+    # slim=1 returns only the LineString coordinates, rounded, without properties
+    slim = request.args.get('slim', '0') not in ('0', 'false', '')
     try:
-        with open(f'data/graph/{graph_id}.geojson') as f:
-            graph = json.load(f)
-        return jsonify(graph)
+        encoded = graph_responses.get(graph_id, slim)
     except FileNotFoundError:
         return jsonify({'error': 'Graph not found'}), 404
+    return send_encoded(encoded)
 
-@app.route('/api/algorithms', methods=['GET'])
-def get_all_algorithms():
-    algorithms = ['Dijkstra', 'A* (Manhattan)', 'A* (Euclidean)', 'BellmanFord']
-    return jsonify(algorithms)
+ALGORITHMS = ['Dijkstra', 'A* (Manhattan)', 'A* (Euclidean)', 'A* (ALT)', 'BellmanFord', 'Bidirectional Dijkstra', 'Bidirectional A*', 'Contraction Hierarchies']
 
-@app.route('/api/shortest-path/<string:graph>/<string:algorithm>/<string:source>/<string:target>')
+@api.route('/api/algorithms', methods=['GET'])
+def get_all_algorithms():
+    return jsonify(ALGORITHMS)
+
+def get_graph_index(kind, graph_id, G, load, build):
+    """Returns a precomputed index of a cached graph, kept with it in the graph registry.
+
+    ``load`` returns the index saved on disk, or None when there is no
+    file matching the graph, in which case ``build`` computes it in process.
+    Without ``build`` such an index is None.
+    """
+    def compute():
+        index = load()
+        if index is None and build is not None:
+            print(f"No current {kind} index for {graph_id}, building it in process")
+            index = build()
+        return index
+    return graph_registry.get_index(graph_id, G, kind, compute)
+
+def get_contraction_hierarchy(graph_id, G):
+    """Returns the Contraction Hierarchy of a graph precomputed by build_ch.py,
+    or None when there is none for the current version of the graph.
+
+    Building one takes too long to do in a request, so it is never built here.
+    """
+    return get_graph_index(
+        'contraction hierarchy', graph_id, G,
+        lambda: load_contraction_hierarchy(ch_path(graph_id), G),
+        None
+    )
+
+def get_landmark_heuristic(graph_id, G):
+    """Returns the ALT heuristic of a graph, precomputed by build_landmarks.py when current."""
+    return get_graph_index(
+        'landmark', graph_id, G,
+        lambda: load_landmark_heuristic(landmarks_path(graph_id), G),
+        lambda: build_landmark_heuristic(G)
+    )
+
+def get_chain_contraction(graph_id, G):
+    """Returns a graph with its chains of degree-2 nodes collapsed, computed in
+    process once per cached graph and then looked up without taking a lock."""
+    return graph_registry.get_index(graph_id, G, 'chain contraction', lambda: contract_chains(G))
+
+# Contraction Hierarchies already shortcut chains in their own preprocessing
+CONTRACTED_ALGORITHMS = ['Dijkstra', 'A* (Manhattan)', 'A* (Euclidean)', 'A* (ALT)', 'BellmanFord', 'Bidirectional Dijkstra', 'Bidirectional A*']
+
+def search_index(graph_id, G, algorithm):
+    """Returns the precomputed index ``algorithm`` searches G with: the ALT
+    heuristic, the Contraction Hierarchy (None until build_ch.py has run)
+    or None for algorithms without one."""
+    if algorithm == 'A* (ALT)':
+        return get_landmark_heuristic(graph_id, G)
+    if algorithm == 'Contraction Hierarchies':
+        return get_contraction_hierarchy(graph_id, G)
+    return None
+
+def run_algorithm(G, algorithm, source, target, trace, index=None, contraction=None):
+    """Runs a shortest path algorithm by name.
+
+    ``index`` is the ``search_index`` of the algorithm on G. With the
+    ``contraction`` of G the algorithms that support it search its query
+    graph instead, and the path and step trace are expanded back to the
+    nodes of G. Returns the name the result is stored under along with the
+    step trace, path, total weight and time taken.
+    """
+    if contraction is None or algorithm not in CONTRACTED_ALGORITHMS:
+        return search_graph(G, G, algorithm, source, target, trace, index)
+    query = contraction.query_graph(G.index_of(source), G.index_of(target))
+    name, steps, path, total_weight, time_taken = search_graph(G, query, algorithm, source, target, trace, index)
+    steps, path = contraction.expand_result(steps, path, relaxations=algorithm == 'BellmanFord')
+    return name, steps, path, total_weight, time_taken
+
+def search_graph(G, graph, algorithm, source, target, trace, index=None):
+    """Runs an algorithm on ``graph``, either G or a query graph of its
+    contraction with the same node ids; ``index`` is that of G."""
+    if algorithm == 'Dijkstra':
+        steps, path, time_taken = dijkstra_with_steps(graph, source, target, trace=trace)
+        return 'Dijkstra', steps, path, calculate_total_weight(graph, path), time_taken
+
+    if algorithm == 'A* (Euclidean)':
+        steps, path, time_taken = astar_with_steps(graph, source, target, heuristic=euclidean_heuristic, trace=trace)
+        return 'A* (Euclidean)', steps, path, calculate_total_weight(graph, path), time_taken
+
+    if algorithm == 'A* (Manhattan)':
+        steps, path, time_taken = astar_with_steps(graph, source, target, heuristic=manhattan_heuristic, trace=trace)
+        return 'A* (Manhattan)', steps, path, calculate_total_weight(graph, path), time_taken
+
+    if algorithm == 'A* (ALT)':
+        steps, path, time_taken = astar_with_steps(graph, source, target, heuristic=index, trace=trace)
+        return 'A* (ALT)', steps, path, calculate_total_weight(graph, path), time_taken
+
+    if algorithm == 'BellmanFord':
+        steps, path, total_weight, time_taken = bellman_ford_with_steps(graph, source, target, trace=trace)
+        return 'Bellman-Ford', steps, path, total_weight, time_taken
+
+    if algorithm == 'Bidirectional Dijkstra':
+        steps, path, time_taken = bidirectional_dijkstra_with_steps(graph, source, target, trace=trace)
+        return 'Bidirectional Dijkstra', steps, path, calculate_total_weight(graph, path), time_taken
+
+    if algorithm == 'Bidirectional A*':
+        steps, path, time_taken = bidirectional_astar_with_steps(graph, source, target, heuristic=euclidean_heuristic, trace=trace)
+        return 'Bidirectional A*', steps, path, calculate_total_weight(graph, path), time_taken
+
+    if algorithm == 'Contraction Hierarchies':
+        steps, path, time_taken = contraction_hierarchy_with_steps(G, index, source, target, trace=trace)
+        return 'Contraction Hierarchies', steps, path, calculate_total_weight(graph, path), time_taken
+
+    raise ValueError("Unsupported algorithm selected!")
+
+def search_deadline(algorithm):
+    """Returns the seconds a search by ``algorithm`` may take."""
+    return current_app.config['SEARCH_DEADLINES'].get(algorithm, current_app.config['SEARCH_DEADLINE'])
+
+def client_disconnected(environ):
+    """Returns a check for whether the client of a request has closed its connection.
+
+    Peeks at the socket the dev server or gunicorn exposes in the WSGI
+    environ; other servers do not expose it and the check is always false.
+    """
+    sock = environ.get('werkzeug.socket') or environ.get('gunicorn.socket')
+    if sock is None:
+        return lambda: False
+
+    def closed():
+        try:
+            return sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b''
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+    return closed
+
+def search(G, algorithm, source, target, trace, index=None, contraction=None):
+    """Runs ``run_algorithm``, in a forked process of the search executor for
+    the algorithms in SEARCH_OFFLOAD.
+
+    ``index`` and ``contraction`` are resolved by the caller, so a forked
+    process never takes a lock another thread may have held when it forked.
+    Raises Overloaded, DeadlineExceeded or Cancelled for offloaded searches
+    that were rejected, ran out of time or lost their client.
+    """
+    offloaded = [name.strip() for name in current_app.config['SEARCH_OFFLOAD'].split(',')]
+    if algorithm not in offloaded:
+        return run_algorithm(G, algorithm, source, target, trace, index, contraction)
+    blob = search_executor.run(
+        lambda: encode_result(run_algorithm(G, algorithm, source, target, trace, index, contraction)),
+        deadline=search_deadline(algorithm),
+        cancelled=client_disconnected(request.environ)
+    )
+    return decode_result(blob)
+
+def get_distance_matrix(graph_id, G, build=True):
+    """Returns the all-pairs distance matrix of a graph, precomputed by build_matrix.py
+    when current. Otherwise it is built in process, or None without ``build``."""
+    return get_graph_index(
+        'distance matrix', graph_id, G,
+        lambda: load_distance_matrix(matrix_path(graph_id), G),
+        (lambda: open_distance_matrix(G, matrix_path(graph_id))) if build else None
+    )
+
+def parse_point(coords):
+    """Returns a JSON ``[x, y]`` list as an (x, y) tuple of floats.
+
+    Raises ValueError unless it holds exactly two finite numbers.
+    """
+    if not (isinstance(coords, list) and len(coords) == 2 and all(
+            isinstance(coord, (int, float)) and not isinstance(coord, bool) and math.isfinite(coord)
+            for coord in coords)):
+        raise ValueError(f"Expected a point as [x, y], got {json.dumps(coords)}")
+    return float(coords[0]), float(coords[1])
+
+def parse_text_point(text):
+    """Parses an "x,y" string into an (x, y) tuple of floats, raising ValueError unless it holds two finite numbers."""
+    try:
+        return parse_point([float(coord) for coord in text.split(',')])
+    except ValueError:
+        raise ValueError(f"Expected a point as x,y, got {text!r}") from None
+
+def round_node(point):
+    """Rounds a point like the coordinates of the graph nodes."""
+    return round(point[0], 3), round(point[1], 3)
+
+def parse_node(text):
+    """Parses an "x,y" path segment into a coordinate tuple rounded like the graph nodes."""
+    return round_node(parse_text_point(text))
+
+def snap_distance():
+    """Returns how far a requested coordinate may be from the node it snaps to.
+
+    Raises ValueError unless the snap_distance parameter, when given, is a
+    finite number of at least zero.
+    """
+    text = request.args.get('snap_distance')
+    if text is None:
+        return current_app.config['SNAP_MAX_DISTANCE']
+    try:
+        distance = float(text)
+    except ValueError:
+        distance = math.nan
+    if not (math.isfinite(distance) and distance >= 0):
+        raise ValueError(f"Expected snap_distance as a finite number of at least 0, got {text!r}")
+    return distance
+
+def resolve_nodes(G, nodes, max_distance):
+    """Returns the id of the node each coordinate snaps to, or None if none is within ``max_distance``."""
+    if not nodes:
+        return []
+    with phase('snap'):
+        ids, _ = G.spatial_index().nearest_nodes(nodes, max_distance)
+    return [None if i < 0 else i for i in ids.tolist()]
+
+@api.route('/api/shortest-path/<string:graph>/<string:algorithm>/<string:source>/<string:target>')
 def get_shortest_path(graph, algorithm, source, target):
-    # Load the graph from the geojson file
+    # Only record as much of the search as the caller asks for
+    trace = request.args.get('trace', 'visited')
+    if trace not in TRACE_MODES:
+        return jsonify({'error': 'Unknown trace mode', 'trace': trace, 'modes': TRACE_MODES}), 400
+    if algorithm not in ALGORITHMS:
+        return jsonify({'error': 'Unsupported algorithm', 'algorithm': algorithm}), 400
+
+    # Reuse the cached graph, rebuilding it only when the geojson file changed
     try:
-        gdf = gpd.read_file(f'./data/graph/{graph}.geojson')
+        G = graph_registry.get(graph)
     except FileNotFoundError:
         return jsonify({'error': 'Graph not found'}), 404
 
-    # Create a directed graph
-    G = nx.DiGraph()
-    edges = []
-
-    for _, row in gdf.iterrows():
-        geom = row.geometry
-        if geom.geom_type == 'LineString':
-            # Iterate over each pair of consecutive coordinates
-            coords = list(geom.coords)
-            for i in range(len(coords) - 1):
-                start_node = tuple(round(coord, 3) for coord in coords[i])
-                end_node = tuple(round(coord, 3) for coord in coords[i + 1])
-                length = math.dist(start_node, end_node)  # Calculate the distance between points
-                edges.append((start_node, end_node, length))
-                edges.append((end_node, start_node, length))
-                fid = row['fid']
-                #print(f"Added edge from {start_node} to {end_node} with length {length}")
-
-    G.add_weighted_edges_from(edges)
-
-    # Convert source and target to tuples
-    source = tuple(map(float, source.split(',')))
-    target = tuple(map(float, target.split(',')))
-
-    # Normalize source and target coordinates
-    source = tuple(round(coord, 3) for coord in source)
-    target = tuple(round(coord, 3) for coord in target)
+    try:
+        source = parse_node(source)
+        target = parse_node(target)
+        max_distance = snap_distance()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     print(f"Source: {source}, Target: {target}")
-    #print(f"Graph nodes: {G.nodes}")
-    # Check if source and target exist in the graph
-    if source not in G or target not in G:
-        return jsonify({'error': 'Source or target not found', 'source': source, 'target': target, 'nodes': list(G.nodes)}), 400
-    db_manager = DatabaseManager(db)
-    if algorithm == 'Dijkstra':
-        steps, path, time_taken = dijkstra_with_steps(G, source, target)
-        total_weight = calculate_total_weight(G, path)
-
-        source_str = json.dumps(source)  
-        target_str = json.dumps(target)  
-        path_str = json.dumps(path)     
-
-        db_manager.add_shortest_path_result(
-            algorithm="Dijkstra",
-            start_node_id=source_str,
-            end_node_id=target_str,
-            path=path_str,
-            total_weight=total_weight,
-            steps=len(steps),
-            time=time_taken
-        )
-
-    elif algorithm == 'A* (Euclidean)':
-        steps, path, time_taken = astar_with_steps(G, source, target, heuristic=euclidean_heuristic)
-        total_weight = calculate_total_weight(G, path)
-
-        source_str = json.dumps(source)
-        target_str = json.dumps(target)
-        path_str = json.dumps(path)
-
-        db_manager.add_shortest_path_result(
-            algorithm="A* (Euclidean)",
-            start_node_id=source_str,
-            end_node_id=target_str,
-            path=path_str,
-            total_weight=total_weight,
-            steps=len(steps),
-            time=time_taken
-        )
-
-    elif algorithm == 'A* (Manhattan)':
-        steps, path, time_taken = astar_with_steps(G, source, target, heuristic=manhattan_heuristic)
-        total_weight = calculate_total_weight(G, path)
-
-        source_str = json.dumps(source)
-        target_str = json.dumps(target)
-        path_str = json.dumps(path)
-
-        db_manager.add_shortest_path_result(
-            algorithm="A* (Manhattan)",
-            start_node_id=source_str,
-            end_node_id=target_str,
-            path=path_str,
-            total_weight=total_weight,
-            steps=len(steps),
-            time=time_taken
-        )
-
-    elif algorithm == 'BellmanFord':
-        steps, path, total_weight, time_taken = bellman_ford_with_steps(G, source, target)
-
-        source_str = json.dumps(source)
-        target_str = json.dumps(target)
-        path_str = json.dumps(path)
-
-        db_manager.add_shortest_path_result(
-            algorithm="Bellman-Ford",
-            start_node_id=source_str,
-            end_node_id=target_str,
-            path=path_str,
-            total_weight=total_weight,
-            steps=len(steps),
-            time=time_taken
-        )
+    # Snap source and target to their nearest nodes
+    source_id, target_id = resolve_nodes(G, [source, target], max_distance)
+    if source_id is None or target_id is None:
+        return jsonify({'error': 'Source or target not found', 'source': source, 'target': target, 'snap_distance': max_distance}), 400
+    source, target = G.node(source_id), G.node(target_id)
+
+    contraction = None
+    if current_app.config['CONTRACT_CHAINS']:
+        with phase('build'):
+            contraction = get_chain_contraction(graph, G)
+
+    # Serve repeated routes on the same version of the graph from the cache;
+    # only fresh searches are recorded, so statistics keep measuring searches.
+    # Contracted searches settle fewer nodes, so they are cached apart.
+    key = route_key((G if contraction is None else contraction.core).fingerprint(), algorithm, source, target, trace)
+    with phase('cache'):
+        result = route_cache.get(key) if request.args.get('cache', '1') != '0' else None
+    cached = result is not None
+    if not cached:
+        with phase('load'):
+            index = search_index(graph, G, algorithm)
+        if algorithm == 'Contraction Hierarchies' and index is None:
+            return jsonify({'error': 'No Contraction Hierarchy for this graph, build it with build_ch.py', 'graph': graph}), 503
+        try:
+            with phase('search'):
+                result = search(G, algorithm, source, target, trace, index, contraction)
+        except Overloaded:
+            return jsonify({'error': 'Too many searches in progress'}), 429, {'Retry-After': '1'}
+        except DeadlineExceeded:
+            return jsonify({'error': 'Search timed out', 'deadline': search_deadline(algorithm)}), 504
+        except Cancelled:
+            # Nobody reads this, the client has gone
+            return jsonify({'error': 'Client disconnected'}), 499
+        with phase('cache'):
+            route_cache.put(key, result)
+    name, steps, path, total_weight, time_taken = result
+
+    if not cached:
+        metrics.observe_search(name, graph, time_taken, steps.settled)
+        with phase('persist'):
+            result_writer.submit(
+                algorithm=name,
+                start_node_id=json.dumps(source),
+                end_node_id=json.dumps(target),
+                path=path,
+                total_weight=total_weight,
+                steps=steps.settled,
+                time=time_taken,
+                forward_steps=steps.forward_settled,
+                backward_steps=steps.backward_settled,
+                graph=graph
+            )
 
+    # Return all information
+    with phase('serialize'):
+        return jsonify({
+            'source': source,
+            'target': target,
+            'steps': steps,
+            'settled': steps.settled,
+            'forward_settled': steps.forward_settled,
+            'backward_settled': steps.backward_settled,
+            'path': path,
+            'total_weight': round(total_weight,3),
+            'time_taken': round(time_taken*1000,3),
+            'cached': cached
+        })
+
+# Number of events encoded into each chunk written to a streaming response
+STREAM_CHUNK_EVENTS = 256
+
+STREAM_ALGORITHMS = ['Dijkstra', 'A* (Manhattan)', 'A* (Euclidean)', 'A* (ALT)', 'BellmanFord']
+
+def iter_algorithm_events(G, algorithm, source, target, relaxations, graph_id=None):
+    """Returns the event generator of a streamable algorithm, see ``iter_best_first_search``."""
+    if algorithm == 'Dijkstra':
+        return iter_best_first_search(G, source, target, relaxations=relaxations)
+    if algorithm == 'A* (Euclidean)':
+        return iter_best_first_search(G, source, target, heuristic=euclidean_heuristic, relaxations=relaxations)
+    if algorithm == 'A* (Manhattan)':
+        return iter_best_first_search(G, source, target, heuristic=manhattan_heuristic, relaxations=relaxations)
+    if algorithm == 'A* (ALT)':
+        heuristic = get_landmark_heuristic(graph_id, G)
+        return iter_best_first_search(G, source, target, heuristic=heuristic, relaxations=relaxations)
+    if algorithm == 'BellmanFord':
+        return iter_bellman_ford(G, source, target)
+    raise ValueError("Unsupported algorithm selected!")
+
+def encode_event(event, elapsed, sse):
+    """Encodes a search event as one NDJSON line or one Server-Sent Event."""
+    kind = event[0]
+    if kind == 'settle':
+        payload = {'type': kind, 'node': event[1], 'cost': event[2]}
+    elif kind == 'relax':
+        payload = {'type': kind, 'from': event[1], 'node': event[2], 'cost': event[3]}
     else:
-        raise ValueError("Unsupported algorithm selected!")
+        total_weight = event[2]
+        payload = {
+            'type': kind,
+            'path': event[1],
+            'total_weight': round(total_weight, 3) if total_weight < math.inf else None,
+            'settled': event[3],
+            'time_taken': round(elapsed * 1000, 3)
+        }
+    data = json.dumps(payload)
+    if sse:
+        return f'event: {kind}\ndata: {data}\n\n'
+    return data + '\n'
+
+def encode_timeout(deadline, sse):
+    """Encodes the event ending a stream whose search ran past its deadline."""
+    data = json.dumps({'type': 'timeout', 'deadline': deadline})
+    if sse:
+        return f'event: timeout\ndata: {data}\n\n'
+    return data + '\n'
+
+@api.route('/api/shortest-path-stream/<string:graph>/<string:algorithm>/<string:source>/<string:target>')
+def stream_shortest_path(graph, algorithm, source, target):
+    stream_format = request.args.get('format', 'ndjson')
+    if stream_format not in ('ndjson', 'sse'):
+        return jsonify({'error': 'Unknown stream format', 'format': stream_format}), 400
+    if algorithm not in STREAM_ALGORITHMS:
+        return jsonify({'error': 'Unsupported algorithm', 'algorithm': algorithm}), 400
+    relaxations = request.args.get('relaxations', '0') == '1'
+    sse = stream_format == 'sse'
 
+    try:
+        G = graph_registry.get(graph)
+    except FileNotFoundError:
+        return jsonify({'error': 'Graph not found'}), 404
 
-    # Return all information
-    return jsonify({
-        'steps': steps,
-        'path': path,
-        'total_weight': round(total_weight,3),
-        'time_taken': round(time_taken*1000,3)
-    })
-
-@app.route('/api/statistics', methods=['GET'])
+    try:
+        source = parse_node(source)
+        target = parse_node(target)
+        max_distance = snap_distance()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    source_id, target_id = resolve_nodes(G, [source, target], max_distance)
+    if source_id is None or target_id is None:
+        return jsonify({'error': 'Source or target not found', 'source': source, 'target': target, 'snap_distance': max_distance}), 400
+    source, target = G.node(source_id), G.node(target_id)
+
+    events = iter_algorithm_events(G, algorithm, source, target, relaxations, graph_id=graph)
+    deadline = search_deadline(algorithm)
+
+    def generate():
+        # The WSGI server asks for the next chunk only once the previous one
+        # has been written, so a slow client pauses the search instead of
+        # piling events up in memory. If the client disconnects the server
+        # closes this generator, which closes the search with it.
+        start_time = time.perf_counter()
+        chunk = []
+        try:
+            for event in events:
+                chunk.append(encode_event(event, time.perf_counter() - start_time, sse))
+                if len(chunk) >= STREAM_CHUNK_EVENTS:
+                    yield ''.join(chunk)
+                    chunk = []
+                    if time.perf_counter() - start_time > deadline:
+                        yield encode_timeout(deadline, sse)
+                        return
+            if chunk:
+                yield ''.join(chunk)
+        finally:
+            events.close()
+
+    return Response(
+        generate(),
+        mimetype='text/event-stream' if sse else 'application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# Long polls also re-check the rollup this often, to see results
+# written by other processes
+STATISTICS_POLL_INTERVAL = 1.0
+
+@api.route('/api/statistics', methods=['GET'])
 def get_algorithm_statistics():
-    db_manager = DatabaseManager(db) 
-    with app.app_context():  
-        statistics = db_manager.get_statistics()  
-    return jsonify(statistics)  
+    by_graph = request.args.get('by') == 'graph'
+    wait = min(request.args.get('wait', 0.0, type=float), current_app.config['STATISTICS_MAX_WAIT'])
+    # Include the results still waiting in the writer queue
+    result_writer.flush()
+    db_manager = DatabaseManager(db)
 
-def create_tables():
+    def current_etag():
+        return f"{db_manager.get_statistics_version()}-{'graph' if by_graph else 'algorithm'}"
+
+    # With ?wait= a client that already has the current statistics is only
+    # answered once new results are written or the wait is over
+    batches = result_writer.batches
+    etag = current_etag()
+    deadline = time.monotonic() + wait
+    while request.if_none_match.contains(etag) and time.monotonic() < deadline:
+        result_writer.wait_for_batch(batches, min(STATISTICS_POLL_INTERVAL, deadline - time.monotonic()))
+        # End the read transaction so the next query sees new commits
+        db.session.rollback()
+        batches = result_writer.batches
+        etag = current_etag()
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(db_manager.get_statistics(by_graph))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def encode_route(G, index, total_weight, path):
+    """Returns the JSON-ready result of one pair of a batch."""
+    return {
+        'index': index,
+        'total_weight': round(total_weight, 3) if total_weight < math.inf else None,
+        'path': None if path is None else G.nodes_of(path)
+    }
+
+def parse_pairs(pairs):
+    """Returns the ``pairs`` of a batch request as ((x, y), (x, y)) tuples rounded like the graph nodes.
+
+    Raises ValueError naming the index of the first pair that is not two
+    nodes of two finite numeric coordinates.
+    """
+    if not isinstance(pairs, list):
+        raise ValueError("Expected pairs as a list of [[x, y], [x, y]] pairs")
+    parsed = []
+    for index, pair in enumerate(pairs):
+        try:
+            if not (isinstance(pair, list) and len(pair) == 2):
+                raise ValueError()
+            parsed.append(tuple(round_node(parse_point(node)) for node in pair))
+        except ValueError:
+            raise ValueError(f"Pair {index} is not [[x, y], [x, y]]") from None
+    return parsed
+
+@api.route('/api/shortest-path-batch/<string:graph>', methods=['POST'])
+def get_shortest_path_batch(graph):
+    stream_format = request.args.get('format', 'json')
+    if stream_format not in ('json', 'ndjson'):
+        return jsonify({'error': 'Unknown format', 'format': stream_format}), 400
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or 'pairs' not in body:
+        return jsonify({'error': 'Expected pairs as [[x, y], [x, y]] lists'}), 400
+    try:
+        pairs = parse_pairs(body['pairs'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if len(pairs) > current_app.config['BATCH_ROUTING_MAX_PAIRS']:
+        return jsonify({'error': 'Too many pairs', 'max_pairs': current_app.config['BATCH_ROUTING_MAX_PAIRS']}), 400
+    include_paths = bool(body.get('paths', True))
+
+    try:
+        max_distance = snap_distance()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        G = graph_registry.get(graph)
+    except FileNotFoundError:
+        return jsonify({'error': 'Graph not found'}), 404
+
+    ids = resolve_nodes(G, [node for pair in pairs for node in pair], max_distance)
+    id_pairs = list(zip(ids[0::2], ids[1::2]))
+    missing = sorted({node for pair, ids in zip(pairs, id_pairs) for node, i in zip(pair, ids) if i is None})
+    if missing:
+        return jsonify({'error': 'Nodes not found', 'nodes': missing}), 400
+
+    start_time = time.perf_counter()
+    groups = iter_batch_routes(G, id_pairs, current_app.config['BATCH_ROUTING_PROCESSES'], include_paths)
+
+    if stream_format == 'json':
+        results = [None] * len(pairs)
+        for routes in groups:
+            for index, total_weight, path in routes:
+                results[index] = encode_route(G, index, total_weight, path)
+        return jsonify({
+            'results': results,
+            'sources': len({source for source, _ in id_pairs}),
+            'time_taken': round((time.perf_counter() - start_time) * 1000, 3)
+        })
+
+    def generate():
+        # One chunk per source group, in the order groups complete
+        try:
+            for routes in groups:
+                yield ''.join(json.dumps({'type': 'route', **encode_route(G, *route)}) + '\n' for route in routes)
+            yield json.dumps({'type': 'done', 'routes': len(pairs),
+                              'time_taken': round((time.perf_counter() - start_time) * 1000, 3)}) + '\n'
+        finally:
+            groups.close()
+
+    return Response(generate(), mimetype='application/x-ndjson', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def read_node_lists():
+    """Returns the (sources, targets) coordinate lists of a distance-matrix request.
+
+    Accepts a JSON body or query parameters with either ``nodes`` for a
+    square matrix or both ``sources`` and ``targets``. Query parameters hold
+    "x,y" nodes separated by semicolons. Raises ValueError for a missing
+    list or a node that is not two finite numbers.
+    """
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            raise ValueError("Expected a JSON object with nodes, or sources and targets")
+        lists = {}
+        for key in ('nodes', 'sources', 'targets'):
+            if key in body:
+                if not isinstance(body[key], list):
+                    raise ValueError(f"Expected {key} as a list of [x, y] nodes")
+                lists[key] = [round_node(parse_point(node)) for node in body[key]]
+    else:
+        lists = {key: [parse_node(node) for node in request.args[key].split(';') if node]
+                 for key in ('nodes', 'sources', 'targets') if key in request.args}
+    if 'nodes' in lists:
+        return lists['nodes'], lists['nodes']
+    if 'sources' in lists and 'targets' in lists:
+        return lists['sources'], lists['targets']
+    raise ValueError("Expected nodes, or sources and targets")
+
+@api.route('/api/distance-matrix/<string:graph>', methods=['GET', 'POST'])
+def get_distance_submatrix(graph):
+    try:
+        sources, targets = read_node_lists()
+        max_distance = snap_distance()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if len(sources) * len(targets) > current_app.config['DISTANCE_MATRIX_MAX_CELLS']:
+        return jsonify({'error': 'Too many distances requested', 'max_cells': current_app.config['DISTANCE_MATRIX_MAX_CELLS']}), 400
+
+    try:
+        G = graph_registry.get(graph)
+    except FileNotFoundError:
+        return jsonify({'error': 'Graph not found'}), 404
+
+    source_ids = resolve_nodes(G, sources, max_distance)
+    target_ids = resolve_nodes(G, targets, max_distance)
+    missing = [node for node, i in zip(sources + targets, source_ids + target_ids) if i is None]
+    if missing:
+        return jsonify({'error': 'Nodes not found', 'nodes': missing}), 400
+
+    with phase('load'):
+        matrix = get_distance_matrix(graph, G, build=len(G) <= current_app.config['DISTANCE_MATRIX_MAX_NODES'])
+    start_time = time.perf_counter()
+    with phase('search'):
+        if matrix is not None:
+            method = 'matrix'
+            distances = matrix.submatrix(source_ids, target_ids)
+        else:
+            method = 'dijkstra'
+            distances = distances_between(G, source_ids, target_ids)
+    time_taken = time.perf_counter() - start_time
+
+    with phase('serialize'):
+        return jsonify({
+            'sources': sources,
+            'targets': targets,
+            'distances': [[round(d, 3) if d < math.inf else None for d in row] for row in distances.tolist()],
+            'method': method,
+            'time_taken': round(time_taken*1000,3)
+        })
+
+@api.route('/api/snap/<string:graph>', methods=['GET', 'POST'])
+def snap_points(graph):
+    """Snaps coordinates to their nearest node, or nearest point on an edge with ``mode=edge``."""
+    mode = request.args.get('mode', 'node')
+    if mode not in ('node', 'edge'):
+        return jsonify({'error': 'Unknown snap mode', 'mode': mode}), 400
+    try:
+        if request.method == 'POST':
+            body = request.get_json(silent=True)
+            if not isinstance(body, dict) or not isinstance(body.get('points'), list):
+                raise ValueError("Expected points as a list of [x, y] points")
+            points = [parse_point(point) for point in body['points']]
+        else:
+            if 'points' not in request.args:
+                raise ValueError("Expected points as x,y coordinates separated by ;")
+            points = [parse_text_point(point) for point in request.args['points'].split(';') if point]
+        max_distance = snap_distance()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if len(points) > current_app.config['SNAP_MAX_POINTS']:
+        return jsonify({'error': 'Too many points', 'max_points': current_app.config['SNAP_MAX_POINTS']}), 400
+
+    try:
+        G = graph_registry.get(graph)
+    except FileNotFoundError:
+        return jsonify({'error': 'Graph not found'}), 404
+
+    index = G.spatial_index()
+    results = []
+    if mode == 'node':
+        with phase('snap'):
+            ids, distances = index.nearest_nodes(points, max_distance) if points else ([], [])
+        for i, distance in zip(list(ids), list(distances)):
+            found = i >= 0
+            results.append({
+                'node': G.node(i) if found else None,
+                'distance': round(float(distance), 3) if found else None
+            })
+    else:
+        with phase('snap'):
+            u, v, snapped, distances = index.nearest_edges(points, max_distance)
+        for point, a, b, position, distance in zip(points, u.tolist(), v.tolist(), snapped.tolist(), distances.tolist()):
+            if a < 0:
+                results.append({'node': None, 'edge': None, 'point': None, 'distance': None})
+                continue
+            # The end of the edge closer to the snapped point, to route from
+            nearer = a if math.dist(position, G.node(a)) <= math.dist(position, G.node(b)) else b
+            results.append({
+                'node': G.node(nearer),
+                'edge': [G.node(a), G.node(b)],
+                'point': [round(position[0], 3), round(position[1], 3)],
+                'distance': round(distance, 3)
+            })
+
+    return jsonify({'results': results, 'mode': mode, 'snap_distance': max_distance})
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    body, content_type = metrics.latest()
+    return Response(body, content_type=content_type)
+
+@api.route('/api/graph-cache', methods=['GET'])
+def get_graph_cache_statistics():
+    return jsonify(graph_registry.stats())
+
+@api.route('/api/result-writer', methods=['GET'])
+def get_result_writer_statistics():
+    return jsonify(result_writer.stats())
+
+@api.route('/api/route-cache', methods=['GET', 'DELETE'])
+def route_cache_statistics():
+    if request.method == 'DELETE':
+        route_cache.clear()
+    return jsonify(route_cache.stats())
+
+@api.route('/api/search-executor', methods=['GET'])
+def get_search_executor_statistics():
+    return jsonify(search_executor.stats())
+
+@api.route('/api/ready', methods=['GET'])
+def readiness():
+    """Answers 503 until the graphs in GRAPH_PRELOAD are loaded, then 200."""
+    status = preloader.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+def create_tables(app):
     """Create database tables."""
     with app.app_context():
         db.create_all()
+        if DatabaseManager(db).migrate_node_coordinates():
+            print('Added X/Y columns to the node table.')
+        if DatabaseManager(db).migrate_statistics():
+            print('Migrated the algorithm statistics rollup.')
     print('Database tables created.')
 
 
 if __name__ == '__main__':
-    create_tables()  
-    app.run(debug=True, host='0.0.0.0', port=5001)
+    create_app().run(debug=True, host='0.0.0.0', port=5001)
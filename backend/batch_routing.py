@@ -0,0 +1,71 @@
+import math
+import multiprocessing
+
+from utils import reconstruct_path, shortest_path_tree
+
+# Batches with fewer source groups than this are routed in process, where
+# forking workers would cost more than it saves
+MIN_PARALLEL_GROUPS = 8
+
+# Graph inherited by forked workers, shared copy-on-write with the server
+_worker_graph = None
+
+
+def group_by_source(pairs):
+    """Groups (source id, target id) pairs as {source: [(pair index, target), ...]}."""
+    groups = {}
+    for index, (source, target) in enumerate(pairs):
+        groups.setdefault(source, []).append((index, target))
+    return groups
+
+
+def route_group(graph, source, indexed_targets, paths=True):
+    """Answers every pair of one source with a single shortest path tree.
+
+    Returns ``(pair index, total weight, node id path)`` per pair, with an
+    infinite weight and an empty path when the target is unreachable and
+    None as path when ``paths`` is off.
+    """
+    dist, predecessor, _ = shortest_path_tree(graph, source, [target for _, target in indexed_targets])
+    routes = []
+    for index, target in indexed_targets:
+        if not paths:
+            path = None
+        elif dist[target] < math.inf:
+            path = reconstruct_path(predecessor, target)
+        else:
+            path = []
+        routes.append((index, dist[target], path))
+    return routes
+
+
+def _init_worker(graph):
+    global _worker_graph
+    _worker_graph = graph
+
+
+def _route_group_task(task):
+    source, indexed_targets, paths = task
+    return route_group(_worker_graph, source, indexed_targets, paths)
+
+
+def iter_batch_routes(graph, pairs, processes=1, paths=True):
+    """Yields the routes of each source group of ``pairs`` as they complete.
+
+    Groups are spread over ``processes`` forked workers, which inherit the
+    graph instead of receiving a copy. Batches with few groups, or
+    platforms without fork, are routed in process. Closing the generator
+    early terminates the workers.
+    """
+    groups = group_by_source(pairs)
+    tasks = [(source, indexed_targets, paths) for source, indexed_targets in groups.items()]
+
+    if processes <= 1 or len(tasks) < MIN_PARALLEL_GROUPS or 'fork' not in multiprocessing.get_all_start_methods():
+        for source, indexed_targets, _ in tasks:
+            yield route_group(graph, source, indexed_targets, paths)
+        return
+
+    context = multiprocessing.get_context('fork')
+    chunksize = max(1, len(tasks) // (processes * 4))
+    with context.Pool(processes, initializer=_init_worker, initargs=(graph,)) as pool:
+        yield from pool.imap_unordered(_route_group_task, tasks, chunksize)
@@ -0,0 +1,279 @@
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+from contraction_hierarchy import build_contraction_hierarchy
+from graph_builder import build_csr_graph, load_graph
+from landmarks import build_landmark_heuristic
+from utils import (astar_with_steps, bellman_ford_with_steps, bidirectional_astar_with_steps,
+                   bidirectional_dijkstra_with_steps, calculate_total_weight, contraction_hierarchy_with_steps,
+                   dijkstra_with_steps, euclidean_heuristic, manhattan_heuristic)
+
+# Bump when the layout of the JSON report changes
+BENCHMARK_FORMAT_VERSION = 3
+
+# Distance between neighbouring nodes of the synthetic graphs, in map units
+GRID_SPACING = 100.0
+
+PERCENTILES = (50, 95, 99)
+
+
+def grid_graph(n_nodes, seed=0, jitter=0.25, drop=0.1):
+    """Returns a CSRGraph of a jittered square grid of about ``n_nodes`` nodes.
+
+    Every node is moved by up to ``jitter`` times the spacing and a
+    ``drop`` fraction of the street segments is removed, so that searches
+    have to go around blocks like on a road network.
+    """
+    rng = np.random.default_rng(seed)
+    side = max(2, math.isqrt(n_nodes - 1) + 1)
+    ys, xs = np.divmod(np.arange(side * side), side)
+    points = np.stack((xs, ys), axis=1) * GRID_SPACING
+    points += rng.uniform(-jitter, jitter, points.shape) * GRID_SPACING
+
+    ids = np.arange(side * side).reshape(side, side)
+    pairs = np.concatenate((
+        np.stack((ids[:, :-1].ravel(), ids[:, 1:].ravel()), axis=1),
+        np.stack((ids[:-1, :].ravel(), ids[1:, :].ravel()), axis=1),
+    ))
+    pairs = pairs[rng.random(len(pairs)) >= drop]
+    return _segments_graph(points, pairs)
+
+
+def geometric_graph(n_nodes, seed=0, neighbors=3):
+    """Returns a CSRGraph of ``n_nodes`` uniform random points joined to their nearest neighbours.
+
+    Points are spread with the density of the grid graphs and each is
+    joined to its ``neighbors`` nearest points, giving irregular blocks
+    and some disconnected islands.
+    """
+    from scipy.spatial import cKDTree
+
+    rng = np.random.default_rng(seed)
+    side = math.sqrt(n_nodes) * GRID_SPACING
+    points = rng.uniform(0.0, side, (n_nodes, 2))
+    _, nearest = cKDTree(points).query(points, k=neighbors + 1)
+    pairs = np.stack((np.repeat(np.arange(n_nodes), neighbors), nearest[:, 1:].ravel()), axis=1)
+    return _segments_graph(points, pairs)
+
+
+def _segments_graph(points, pairs):
+    # Each pair becomes a two-vertex line, built like a GeoJSON road network
+    coords = points[pairs].reshape(-1, 2)
+    line_offsets = np.arange(0, len(coords) + 1, 2)
+    return build_csr_graph(coords, line_offsets)
+
+
+GENERATORS = {'grid': grid_graph, 'geometric': geometric_graph}
+
+
+def load_benchmark_graph(spec, seed):
+    """Builds the graph named by ``spec``: ``grid:<nodes>``, ``geometric:<nodes>`` or a GeoJSON path."""
+    kind, _, size = spec.partition(':')
+    if kind in GENERATORS and size:
+        return GENERATORS[kind](int(float(size)), seed)
+    return load_graph(spec)
+
+
+def largest_component(graph):
+    """Returns the node ids of the largest weakly connected component."""
+    from scipy.sparse.csgraph import connected_components
+
+    _, labels = connected_components(graph.to_scipy(), directed=True, connection='weak')
+    return np.flatnonzero(labels == np.bincount(labels).argmax())
+
+
+def random_pairs(graph, count, seed):
+    """Returns ``count`` seeded (source, target) coordinate pairs of distinct connected nodes."""
+    rng = np.random.default_rng(seed)
+    nodes = largest_component(graph)
+    if len(nodes) < 2:
+        raise ValueError("Graph has no two connected nodes to route between")
+    pairs = []
+    while len(pairs) < count:
+        source, target = rng.choice(nodes, 2, replace=False).tolist()
+        pairs.append((graph.node(source), graph.node(target)))
+    return pairs
+
+
+def _unprepared(graph):
+    return None
+
+
+# (prepare, query) per algorithm: ``prepare(graph)`` builds what the
+# algorithm needs before answering queries and ``query(graph, index,
+# source, target)`` runs one search like the ``*_with_steps`` functions,
+# whose results start with the step trace and path.
+BENCHMARK_ALGORITHMS = {
+    'Dijkstra': (_unprepared, lambda G, _, s, t: dijkstra_with_steps(G, s, t, trace='none')),
+    'A* (Euclidean)': (_unprepared, lambda G, _, s, t: astar_with_steps(G, s, t, heuristic=euclidean_heuristic, trace='none')),
+    'A* (Manhattan)': (_unprepared, lambda G, _, s, t: astar_with_steps(G, s, t, heuristic=manhattan_heuristic, trace='none')),
+    'A* (ALT)': (build_landmark_heuristic, lambda G, index, s, t: astar_with_steps(G, s, t, heuristic=index, trace='none')),
+    'Bidirectional Dijkstra': (_unprepared, lambda G, _, s, t: bidirectional_dijkstra_with_steps(G, s, t, trace='none')),
+    'Bidirectional A*': (_unprepared, lambda G, _, s, t: bidirectional_astar_with_steps(G, s, t, heuristic=euclidean_heuristic, trace='none')),
+    'Contraction Hierarchies': (build_contraction_hierarchy, lambda G, index, s, t: contraction_hierarchy_with_steps(G, index, s, t, trace='none')),
+    'BellmanFord': (_unprepared, lambda G, _, s, t: bellman_ford_with_steps(G, s, t, trace='none')),
+}
+
+
+def summarize(values, digits):
+    """Returns the mean, min, max and percentiles of a sequence of numbers."""
+    values = np.asarray(values, dtype=np.float64)
+    summary = {'mean': round(float(values.mean()), digits), 'min': round(float(values.min()), digits),
+               'max': round(float(values.max()), digits)}
+    for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES).tolist()):
+        summary[f'p{percentile}'] = round(value, digits)
+    return summary
+
+
+def run_benchmark(graph, algorithms, pairs, warmup=3, memory_queries=5):
+    """Times every algorithm on the same pairs and returns one result dict per algorithm.
+
+    Each algorithm first answers the first ``warmup`` pairs untimed. Latency is
+    measured with ``perf_counter_ns`` around each query, without tracing
+    allocations; peak memory is then measured with ``tracemalloc`` over
+    the first ``memory_queries`` pairs, as the largest peak of a single
+    query. Total weights are compared with those of the first algorithm.
+    """
+    results = []
+    reference = None
+    for name in algorithms:
+        prepare, query = BENCHMARK_ALGORITHMS[name]
+        start = time.perf_counter_ns()
+        index = prepare(graph)
+        prepare_seconds = (time.perf_counter_ns() - start) / 1e9
+
+        for source, target in pairs[:warmup]:
+            query(graph, index, source, target)
+
+        latencies = []
+        settled = []
+        weights = []
+        for source, target in pairs:
+            start = time.perf_counter_ns()
+            steps, path = query(graph, index, source, target)[:2]
+            latencies.append(time.perf_counter_ns() - start)
+            settled.append(steps.settled)
+            weights.append(calculate_total_weight(graph, path) if path else math.inf)
+
+        peak_memory = 0
+        tracemalloc.start()
+        try:
+            for source, target in pairs[:memory_queries]:
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                query(graph, index, source, target)
+                peak_memory = max(peak_memory, tracemalloc.get_traced_memory()[1] - baseline)
+        finally:
+            tracemalloc.stop()
+
+        if reference is None:
+            reference = weights
+        mismatches = sum(not math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6) for a, b in zip(weights, reference))
+
+        result = {
+            'algorithm': name,
+            'queries': len(pairs),
+            'prepare_seconds': round(prepare_seconds, 3),
+            'latency_ms': summarize(np.array(latencies) / 1e6, 4),
+            'settled': summarize(settled, 1),
+            'peak_memory_bytes': peak_memory,
+            'weight_mismatches': mismatches,
+        }
+        results.append(result)
+        print(f"  {name}: p50 {result['latency_ms']['p50']} ms, p99 {result['latency_ms']['p99']} ms, "
+              f"{result['settled']['mean']} settled, peak {peak_memory / 1024:.0f} KiB"
+              + (f", {mismatches} weight mismatches" if mismatches else ''), file=sys.stderr)
+    return results
+
+
+def environment():
+    """Returns what a report needs to be compared with one from another machine."""
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare_reports(report, baseline, tolerance):
+    """Returns a message for every p50 latency more than ``tolerance`` slower than in ``baseline``."""
+    # Version 2 reports could also time Dijkstra and A* with other priority
+    # queues than heapq, which is the only one searches use now
+    previous = {
+        (graph['graph'], result['algorithm']): result
+        for graph in baseline['graphs'] for result in graph['results']
+        if result.get('queue', 'heap') == 'heap'
+    }
+    regressions = []
+    for graph in report['graphs']:
+        for result in graph['results']:
+            before = previous.get((graph['graph'], result['algorithm']))
+            if before is None:
+                continue
+            old, new = before['latency_ms']['p50'], result['latency_ms']['p50']
+            if old > 0 and new > old * (1 + tolerance):
+                regressions.append(f"{graph['graph']} {result['algorithm']}: p50 {old} ms -> {new} ms")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the shortest path algorithms on seeded synthetic or GeoJSON graphs.')
+    parser.add_argument('graphs', nargs='*', default=['grid:1000', 'geometric:1000', 'grid:10000', 'geometric:10000'],
+                        help='grid:<nodes>, geometric:<nodes> or a GeoJSON file (default: 1k and 10k node grid and geometric graphs)')
+    parser.add_argument('--algorithms', nargs='+', choices=list(BENCHMARK_ALGORITHMS),
+                        default=[name for name in BENCHMARK_ALGORITHMS if name != 'BellmanFord'], help='algorithms to run, the first is the weight reference')
+    parser.add_argument('--queries', type=int, default=100, help='timed queries per algorithm and graph')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed queries before timing each algorithm')
+    parser.add_argument('--memory-queries', type=int, default=5, help='queries run under tracemalloc for peak memory')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic graphs and query pairs')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    parser.add_argument('--compare', help='JSON report to compare p50 latencies with')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='p50 slowdown over --compare reported as a regression')
+    args = parser.parse_args()
+
+    report = {
+        'format_version': BENCHMARK_FORMAT_VERSION,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'seed': args.seed,
+        'environment': environment(),
+        'graphs': [],
+    }
+    for spec in args.graphs:
+        start = time.perf_counter()
+        graph = load_benchmark_graph(spec, args.seed)
+        build_seconds = time.perf_counter() - start
+        print(f"{spec}: {len(graph)} nodes, {graph.number_of_edges()} edges, built in {build_seconds:.2f}s", file=sys.stderr)
+        pairs = random_pairs(graph, args.queries, args.seed)
+        report['graphs'].append({
+            'graph': spec,
+            'nodes': len(graph),
+            'edges': graph.number_of_edges(),
+            'build_seconds': round(build_seconds, 3),
+            'results': run_benchmark(graph, args.algorithms, pairs, args.warmup, args.memory_queries),
+        })
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_reports(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
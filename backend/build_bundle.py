@@ -0,0 +1,44 @@
+import argparse
+import os
+import time
+
+from graph_builder import load_graph
+from graph_bundle import compile_graph_bundle, load_graph_bundle
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+GRAPH_DIR = os.path.join(basedir, 'data/graph')
+BUNDLE_DIR = os.path.join(basedir, 'data/bundle')
+
+
+def bundle_path(graph_id):
+    """Returns where the compiled bundle of a graph is stored, without extension."""
+    return os.path.join(BUNDLE_DIR, graph_id)
+
+
+def load_compiled_graph(source_path):
+    """Returns the graph of a GeoJSON file, memory-mapped from its bundle when that is current."""
+    graph_id = os.path.splitext(os.path.basename(source_path))[0]
+    graph = load_graph_bundle(bundle_path(graph_id), source_path)
+    if graph is None:
+        return load_graph(source_path)
+    return graph
+
+
+def build(graph_id):
+    """Compiles one graph into a bundle."""
+    start_time = time.perf_counter()
+    graph = compile_graph_bundle(os.path.join(GRAPH_DIR, f'{graph_id}.geojson'), bundle_path(graph_id))
+    print(f"{graph_id}: {len(graph)} nodes, {graph.number_of_edges()} edges "
+          f"in {time.perf_counter() - start_time:.2f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile the graphs in data/graph into memory-mappable bundles.')
+    parser.add_argument('graphs', nargs='*', help='graph ids to compile, all graphs when omitted')
+    args = parser.parse_args()
+
+    graph_ids = args.graphs or sorted(
+        os.path.splitext(filename)[0] for filename in os.listdir(GRAPH_DIR) if filename.endswith('.geojson')
+    )
+    for graph_id in graph_ids:
+        build(graph_id)
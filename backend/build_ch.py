@@ -0,0 +1,38 @@
+import argparse
+import os
+import time
+
+from contraction_hierarchy import build_contraction_hierarchy
+from build_bundle import load_compiled_graph
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+GRAPH_DIR = os.path.join(basedir, 'data/graph')
+CH_DIR = os.path.join(basedir, 'data/ch')
+
+
+def ch_path(graph_id):
+    """Returns where the Contraction Hierarchy of a graph is stored."""
+    return os.path.join(CH_DIR, f'{graph_id}.ch.npz')
+
+
+def build(graph_id):
+    """Builds and saves the Contraction Hierarchy of one graph."""
+    start_time = time.perf_counter()
+    graph = load_compiled_graph(os.path.join(GRAPH_DIR, f'{graph_id}.geojson'))
+    hierarchy = build_contraction_hierarchy(graph)
+    hierarchy.save(ch_path(graph_id))
+    shortcuts = int((hierarchy.up_middle != -1).sum() + (hierarchy.down_middle != -1).sum())
+    print(f"{graph_id}: {len(graph)} nodes, {graph.number_of_edges()} edges, "
+          f"{shortcuts} shortcuts in {time.perf_counter() - start_time:.2f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompute Contraction Hierarchies for the graphs in data/graph.')
+    parser.add_argument('graphs', nargs='*', help='graph ids to build, all graphs when omitted')
+    args = parser.parse_args()
+
+    graph_ids = args.graphs or sorted(
+        os.path.splitext(filename)[0] for filename in os.listdir(GRAPH_DIR) if filename.endswith('.geojson')
+    )
+    for graph_id in graph_ids:
+        build(graph_id)
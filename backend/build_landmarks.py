@@ -0,0 +1,38 @@
+import argparse
+import os
+import time
+
+from build_bundle import load_compiled_graph
+from landmarks import DEFAULT_LANDMARK_COUNT, build_landmark_heuristic
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+GRAPH_DIR = os.path.join(basedir, 'data/graph')
+LANDMARK_DIR = os.path.join(basedir, 'data/landmarks')
+
+
+def landmarks_path(graph_id):
+    """Returns where the landmark table of a graph is stored, without extension."""
+    return os.path.join(LANDMARK_DIR, f'{graph_id}.alt')
+
+
+def build(graph_id, count):
+    """Selects landmarks for one graph and saves their distance table."""
+    start_time = time.perf_counter()
+    graph = load_compiled_graph(os.path.join(GRAPH_DIR, f'{graph_id}.geojson'))
+    heuristic = build_landmark_heuristic(graph, count)
+    heuristic.save(landmarks_path(graph_id))
+    print(f"{graph_id}: {len(heuristic.landmarks)} landmarks over {len(graph)} nodes "
+          f"in {time.perf_counter() - start_time:.2f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompute ALT landmark distance tables for the graphs in data/graph.')
+    parser.add_argument('graphs', nargs='*', help='graph ids to build, all graphs when omitted')
+    parser.add_argument('--count', type=int, default=DEFAULT_LANDMARK_COUNT, help='number of landmarks per graph')
+    args = parser.parse_args()
+
+    graph_ids = args.graphs or sorted(
+        os.path.splitext(filename)[0] for filename in os.listdir(GRAPH_DIR) if filename.endswith('.geojson')
+    )
+    for graph_id in graph_ids:
+        build(graph_id, args.count)
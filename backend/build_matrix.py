@@ -0,0 +1,37 @@
+import argparse
+import os
+import time
+
+from build_bundle import load_compiled_graph
+from distance_matrix import build_distance_matrix
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+GRAPH_DIR = os.path.join(basedir, 'data/graph')
+MATRIX_DIR = os.path.join(basedir, 'data/matrix')
+
+
+def matrix_path(graph_id):
+    """Returns where the distance matrix of a graph is stored, without extension."""
+    return os.path.join(MATRIX_DIR, f'{graph_id}.dm')
+
+
+def build(graph_id, method):
+    """Computes and saves the all-pairs distance matrix of one graph."""
+    start_time = time.perf_counter()
+    graph = load_compiled_graph(os.path.join(GRAPH_DIR, f'{graph_id}.geojson'))
+    matrix = build_distance_matrix(graph, matrix_path(graph_id), method)
+    print(f"{graph_id}: {len(matrix)}x{len(matrix)} by {matrix.method} "
+          f"({matrix.nbytes / 1e6:.1f} MB) in {time.perf_counter() - start_time:.2f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompute all-pairs distance matrices for the graphs in data/graph.')
+    parser.add_argument('graphs', nargs='*', help='graph ids to build, all graphs when omitted')
+    parser.add_argument('--method', choices=['floyd-warshall', 'dijkstra'], help='defaults to Floyd-Warshall for small dense graphs only')
+    args = parser.parse_args()
+
+    graph_ids = args.graphs or sorted(
+        os.path.splitext(filename)[0] for filename in os.listdir(GRAPH_DIR) if filename.endswith('.geojson')
+    )
+    for graph_id in graph_ids:
+        build(graph_id, args.method)
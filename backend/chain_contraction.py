@@ -0,0 +1,399 @@
+import numpy as np
+
+from csr_graph import CSRGraph
+from utils import StepTrace
+
+
+def interior_mask(graph):
+    """Returns which nodes are interior points of a chain.
+
+    A node is interior when its only edges lead to and come from the same
+    two other nodes, as every intermediate vertex of a LineString does.
+    All other nodes are junctions: crossings, dead ends and nodes with
+    one-way edges.
+    """
+    reverse = graph.reverse()
+    candidates = np.flatnonzero((np.diff(graph.offsets) == 2) & (np.diff(reverse.offsets) == 2))
+    out_first = graph.targets[graph.offsets[candidates]]
+    out_second = graph.targets[graph.offsets[candidates] + 1]
+    in_first = reverse.targets[reverse.offsets[candidates]]
+    in_second = reverse.targets[reverse.offsets[candidates] + 1]
+    same = ((out_first == in_first) & (out_second == in_second)) | ((out_first == in_second) & (out_second == in_first))
+    interior = np.zeros(len(graph), dtype=bool)
+    interior[candidates[same & (out_first != out_second) & (out_first != candidates) & (out_second != candidates)]] = True
+    return interior
+
+
+def _walk_chains(graph, interior):
+    """Returns every chain as a list of node ids from one junction to another.
+
+    Rings made of interior nodes only get one of their nodes turned into a
+    junction, in ``interior`` too, and become a chain from and to it.
+    """
+    offsets = graph.offsets.tolist()
+    targets = graph.targets.tolist()
+    is_interior = interior.tolist()
+    visited = bytearray(len(graph))
+    chains = []
+
+    def follow(start, node):
+        chain = [start]
+        previous = start
+        while is_interior[node]:
+            visited[node] = 1
+            chain.append(node)
+            lo = offsets[node]
+            following = targets[lo] if targets[lo] != previous else targets[lo + 1]
+            previous, node = node, following
+        chain.append(node)
+        return chain
+
+    sources = graph.edge_sources()
+    starts = np.flatnonzero(~interior[sources] & interior[graph.targets])
+    for start, node in zip(sources[starts].tolist(), graph.targets[starts].tolist()):
+        if not visited[node]:
+            chains.append(follow(start, node))
+
+    for ring_node in np.flatnonzero(interior).tolist():
+        if visited[ring_node]:
+            continue
+        is_interior[ring_node] = False
+        interior[ring_node] = False
+        for node in graph.neighbors(ring_node)[0]:
+            if not visited[node]:
+                chains.append(follow(ring_node, node))
+    return chains
+
+
+def _conflicting_chains(graph, interior, chains):
+    """Returns the middle node of every chain that cannot become a single edge.
+
+    Those are loops, chains between junctions already joined by an edge
+    and chains running parallel to another chain between the same pair.
+    """
+    n = len(graph)
+    first = np.array([chain[0] for chain in chains], dtype=np.int64)
+    last = np.array([chain[-1] for chain in chains], dtype=np.int64)
+    keys = np.minimum(first, last) * n + np.maximum(first, last)
+
+    sources = graph.edge_sources().astype(np.int64)
+    targets = graph.targets.astype(np.int64)
+    direct = ~interior[sources] & ~interior[targets]
+    direct_keys = np.minimum(sources[direct], targets[direct]) * n + np.maximum(sources[direct], targets[direct])
+
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    conflicting = (first == last) | (counts[inverse] > 1) | np.isin(keys, direct_keys)
+    return [chains[i][len(chains[i]) // 2] for i in np.flatnonzero(conflicting).tolist()]
+
+
+def _chain_edge_weights(graph, interior, sources, targets):
+    """Returns the weights of edges that have an interior node at one end."""
+    weights = np.empty(len(sources), dtype=np.float64)
+    # Interior nodes have exactly two out-edges and two in-edges
+    from_interior = interior[sources]
+    for mask, g, ends, others in ((from_interior, graph, sources, targets),
+                                  (~from_interior, graph.reverse(), targets, sources)):
+        lo = g.offsets[ends[mask]]
+        first = g.targets[lo] == others[mask]
+        weights[mask] = np.where(first, g.weights[lo], g.weights[lo + 1])
+    return weights
+
+
+def contract_chains(graph):
+    """Collapses the chains of interior nodes of a CSRGraph into single edges.
+
+    Returns a ChainContraction whose core graph keeps the node ids of
+    ``graph`` and only the edges between junctions.
+    """
+    n = len(graph)
+    interior = interior_mask(graph)
+    while True:
+        chains = _walk_chains(graph, interior)
+        split = _conflicting_chains(graph, interior, chains) if chains else []
+        if not split:
+            break
+        interior[split] = False
+
+    lengths = np.array([len(chain) for chain in chains], dtype=np.int64)
+    chain_offsets = np.zeros(len(chains) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=chain_offsets[1:])
+    chain_nodes = np.array([node for chain in chains for node in chain], dtype=np.int32)
+
+    # Cumulative costs along each chain, from its first node and back to it
+    steps = np.ones(len(chain_nodes), dtype=bool)
+    steps[chain_offsets[1:] - 1] = False
+    step_from = np.flatnonzero(steps)
+    step_to = step_from + 1
+    forward_steps = np.zeros(len(chain_nodes))
+    backward_steps = np.zeros(len(chain_nodes))
+    forward_steps[step_to] = _chain_edge_weights(graph, interior, chain_nodes[step_from], chain_nodes[step_to])
+    backward_steps[step_to] = _chain_edge_weights(graph, interior, chain_nodes[step_to], chain_nodes[step_from])
+    forward_cost = np.cumsum(forward_steps)
+    forward_cost -= np.repeat(forward_cost[chain_offsets[:-1]], lengths)
+    backward_cost = np.cumsum(backward_steps)
+    backward_cost -= np.repeat(backward_cost[chain_offsets[:-1]], lengths)
+
+    chain_ids = np.repeat(np.arange(len(chains), dtype=np.int32), lengths)
+    positions = np.arange(len(chain_nodes)) - np.repeat(chain_offsets[:-1], lengths)
+    inner = interior[chain_nodes]
+    chain_of = np.full(n, -1, dtype=np.int32)
+    chain_of[chain_nodes[inner]] = chain_ids[inner]
+    position_of = np.zeros(n, dtype=np.int32)
+    position_of[chain_nodes[inner]] = positions[inner]
+
+    # Core edges: the original edges between junctions and one edge each
+    # way along every chain
+    first = chain_nodes[chain_offsets[:-1]].astype(np.int64)
+    last = chain_nodes[chain_offsets[1:] - 1].astype(np.int64)
+    sources = graph.edge_sources()
+    direct = ~interior[sources] & ~interior[graph.targets]
+    core = CSRGraph.from_edges(
+        graph.coords,
+        np.concatenate((sources[direct], first, last)),
+        np.concatenate((graph.targets[direct], last, first)),
+        np.concatenate((graph.weights[direct], forward_cost[chain_offsets[1:] - 1], backward_cost[chain_offsets[1:] - 1]))
+    )
+
+    # The chain behind each core edge, times two plus one if it runs backwards
+    keys = np.concatenate((first * n + last, last * n + first))
+    references = np.concatenate((np.arange(len(chains)) * 2, np.arange(len(chains)) * 2 + 1))
+    order = np.argsort(keys)
+    return ChainContraction(graph, core, chain_offsets, chain_nodes, forward_cost, backward_cost,
+                            chain_of, position_of, keys[order], references[order])
+
+
+def _with_edges(graph, sources, targets, weights):
+    """Returns a copy of a CSRGraph with extra edges appended to their source's edges."""
+    sources = np.asarray(sources, dtype=np.int64)
+    order = np.argsort(sources, kind='stable')
+    counts = np.bincount(sources, minlength=len(graph))
+    offsets = graph.offsets.copy()
+    offsets[1:] += np.cumsum(counts)
+    positions = graph.offsets[sources[order] + 1]
+    return CSRGraph(
+        graph.coords, offsets,
+        np.insert(graph.targets, positions, np.asarray(targets)[order]),
+        np.insert(graph.weights, positions, np.asarray(weights)[order])
+    )
+
+
+class ChainContraction:
+    """A graph with its chains of interior nodes collapsed into single edges.
+
+    Searches on the core graph settle junctions only, so their size scales
+    with the number of junctions rather than with the resolution of the
+    geometry. Each chain keeps its nodes and cumulative costs, which
+    connect endpoints inside a chain to the core and expand paths and step
+    traces back to every node of the original graph.
+    """
+
+    def __init__(self, graph, core, chain_offsets, chain_nodes, forward_cost, backward_cost,
+                 chain_of, position_of, chain_keys, chain_references):
+        self.graph = graph
+        self.core = core
+        self.chain_offsets = chain_offsets
+        self.chain_nodes = chain_nodes
+        self.forward_cost = forward_cost
+        self.backward_cost = backward_cost
+        self.chain_of = chain_of
+        self.position_of = position_of
+        self.chain_keys = chain_keys
+        self.chain_references = chain_references
+
+    @property
+    def nbytes(self):
+        arrays = (self.chain_offsets, self.chain_nodes, self.forward_cost, self.backward_cost,
+                  self.chain_of, self.position_of, self.chain_keys, self.chain_references)
+        return self.core.nbytes + sum(array.nbytes for array in arrays)
+
+    @property
+    def junctions(self):
+        return int(np.count_nonzero(self.chain_of < 0))
+
+    def _position(self, chain, node):
+        if self.chain_of[node] == chain:
+            return int(self.position_of[node])
+        lo, hi = self.chain_offsets[chain], self.chain_offsets[chain + 1]
+        return 0 if self.chain_nodes[lo] == node else int(hi - lo - 1)
+
+    def _cost(self, chain, i, j):
+        lo = self.chain_offsets[chain]
+        if i <= j:
+            return float(self.forward_cost[lo + j] - self.forward_cost[lo + i])
+        return float(self.backward_cost[lo + i] - self.backward_cost[lo + j])
+
+    def query_graph(self, source, target):
+        """Returns the core graph with edges joining ``source`` and ``target`` to it.
+
+        An endpoint inside a chain gets edges to (or from) both ends of its
+        chain, and two endpoints inside the same chain an edge between them,
+        so distances are the same as in the original graph.
+        """
+        extra = []
+        source_chain = int(self.chain_of[source])
+        target_chain = int(self.chain_of[target])
+        if source_chain >= 0:
+            i = int(self.position_of[source])
+            for end in (0, int(self.chain_offsets[source_chain + 1] - self.chain_offsets[source_chain] - 1)):
+                extra.append((source, int(self.chain_nodes[self.chain_offsets[source_chain] + end]), self._cost(source_chain, i, end)))
+        if target_chain >= 0:
+            j = int(self.position_of[target])
+            for end in (0, int(self.chain_offsets[target_chain + 1] - self.chain_offsets[target_chain] - 1)):
+                extra.append((int(self.chain_nodes[self.chain_offsets[target_chain] + end]), target, self._cost(target_chain, end, j)))
+        if source_chain >= 0 and source_chain == target_chain and source != target:
+            extra.append((source, target, self._cost(source_chain, i, j)))
+        if not extra:
+            return self.core
+
+        sources, targets, weights = zip(*extra)
+        query = _with_edges(self.core, sources, targets, weights)
+        reverse = _with_edges(self.core.reverse(), targets, sources, weights)
+        return CSRGraph(query.coords, query.offsets, query.targets, query.weights, reverse=reverse)
+
+    def segment(self, u, v):
+        """Returns the interior nodes passed going along the edge ``u -> v``
+        of a query graph, and the costs from ``u`` to each of them and to ``v``.
+
+        Both are empty for edges that are original edges.
+        """
+        chain = int(self.chain_of[u])
+        if chain < 0:
+            chain = int(self.chain_of[v])
+        if chain >= 0:
+            i, j = self._position(chain, u), self._position(chain, v)
+        else:
+            key = u * len(self.graph) + v
+            k = int(np.searchsorted(self.chain_keys, key))
+            if k == len(self.chain_keys) or self.chain_keys[k] != key:
+                return [], []
+            chain, backwards = divmod(int(self.chain_references[k]), 2)
+            end = int(self.chain_offsets[chain + 1] - self.chain_offsets[chain] - 1)
+            i, j = (end, 0) if backwards else (0, end)
+
+        lo = self.chain_offsets[chain]
+        if i < j:
+            nodes = self.chain_nodes[lo + i + 1:lo + j]
+            costs = self.forward_cost[lo + i + 1:lo + j + 1] - self.forward_cost[lo + i]
+        else:
+            nodes = self.chain_nodes[lo + j + 1:lo + i][::-1]
+            costs = self.backward_cost[lo + i] - self.backward_cost[lo + j:lo + i][::-1]
+        return nodes.tolist(), costs.tolist()
+
+    def expand_path(self, path):
+        """Returns a path of node ids on a query graph with every node it passes."""
+        expanded = list(path[:1])
+        for u, v in zip(path, path[1:]):
+            expanded.extend(self.segment(u, v)[0])
+            expanded.append(v)
+        return expanded
+
+    def expand_result(self, steps, path, relaxations=False):
+        """Expands the formatted step trace and path of a search on a query graph.
+
+        ``relaxations`` marks Bellman-Ford traces, whose records are
+        ``(node, neighbor, cost)`` improvements. Other traces get a record
+        for each interior node of a chain once both of its ends are
+        settled, with the cost of reaching it from the nearer one.
+        """
+        graph = self.graph
+        path = graph.nodes_of(self.expand_path(graph.indices_of(path).tolist()))
+        if steps.mode == 'none' or not steps:
+            return steps, path
+
+        if relaxations:
+            records = []
+            for (u, v, cost), (u_id, v_id) in zip(steps, graph.indices_of([record[:2] for record in steps]).reshape(-1, 2).tolist()):
+                nodes, costs = self.segment(u_id, v_id)
+                if not nodes:
+                    records.append((u, v, cost))
+                    continue
+                chain = graph.nodes_of([u_id] + nodes + [v_id])
+                start = cost - costs[-1]
+                records.extend((a, b, start + c) for a, b, c in zip(chain, chain[1:], costs))
+            expanded = StepTrace(steps.mode, records)
+        else:
+            expanded = self._expand_settled(steps)
+        expanded.settled = steps.settled
+        expanded.forward_settled = steps.forward_settled
+        expanded.backward_settled = steps.backward_settled
+        return expanded, path
+
+    def _interior_records(self, ids, costs):
+        """Returns the interior nodes lying between settled nodes of their chain.
+
+        For each it returns the node id, the cost of reaching it from the
+        nearer settled node, the index of the later record of the two and
+        the chain position of the nearer one.
+        """
+        n = len(self.graph)
+        record_of = np.full(n, -1, dtype=np.int64)
+        record_of[ids[::-1]] = np.arange(len(ids) - 1, -1, -1)
+        cost_of = np.full(n, np.inf)
+        cost_of[ids[::-1]] = costs[::-1]
+
+        lengths = np.diff(self.chain_offsets)
+        starts = np.repeat(self.chain_offsets[:-1], lengths)
+        stops = np.repeat(self.chain_offsets[1:], lengths)
+        positions = np.arange(len(self.chain_nodes))
+        settled = record_of[self.chain_nodes] >= 0
+        # The nearest settled position at or before and at or after each one
+        left = np.maximum.accumulate(np.where(settled, positions, -1))
+        right = np.minimum.accumulate(np.where(settled, positions, len(positions))[::-1])[::-1]
+
+        k = np.flatnonzero(~settled & (left >= starts) & (right < stops))
+        l, r = left[k], right[k]
+        from_left = cost_of[self.chain_nodes[l]] + self.forward_cost[k] - self.forward_cost[l]
+        from_right = cost_of[self.chain_nodes[r]] + self.backward_cost[r] - self.backward_cost[k]
+        near_left = from_left <= from_right
+        after = np.maximum(record_of[self.chain_nodes[l]], record_of[self.chain_nodes[r]])
+        return self.chain_nodes[k], np.where(near_left, from_left, from_right), after, np.where(near_left, l, r)
+
+    def _expand_settled(self, steps):
+        graph = self.graph
+        mode = steps.mode
+        ids = graph.indices_of([record[0] for record in steps])
+        costs = np.array([record[1] for record in steps], dtype=np.float64)
+        interior, interior_costs, after, anchors = self._interior_records(ids, costs)
+        # Each interior node follows the later record of the nodes around it
+        order = np.argsort(np.concatenate((np.arange(len(ids)) * 2, after * 2 + 1)), kind='stable')
+
+        if mode == 'visited':
+            coords = graph.coords[np.concatenate((ids, interior))[order]].tolist()
+            return StepTrace(mode, zip(map(tuple, coords), np.concatenate((costs, interior_costs))[order].tolist()))
+
+        ids = ids.tolist()
+        if mode == 'frontier':
+            neighbors = graph.indices_of([neighbor for record in steps for neighbor in record[2]]).tolist()
+            records = []
+            start = 0
+            for record, node in zip(steps, ids):
+                frontier = []
+                for neighbor in neighbors[start:start + len(record[2])]:
+                    frontier.extend(self.segment(node, neighbor)[0])
+                    frontier.append(neighbor)
+                start += len(record[2])
+                records.append((node, record[1], frontier))
+            records.extend((node, cost, []) for node, cost in zip(interior.tolist(), interior_costs.tolist()))
+        else:
+            records = [(node, record[1], self.expand_path(graph.indices_of(record[2]).tolist()))
+                       for record, node in zip(steps, ids)]
+            paths = {}
+            for record in records:
+                paths.setdefault(record[0], record[2])
+            for node, cost, anchor in zip(interior.tolist(), interior_costs.tolist(), anchors.tolist()):
+                position = self.chain_offsets[self.chain_of[node]] + self.position_of[node]
+                if anchor < position:
+                    via = self.chain_nodes[anchor + 1:position + 1].tolist()
+                else:
+                    via = self.chain_nodes[position:anchor][::-1].tolist()
+                records.append((node, cost, paths[int(self.chain_nodes[anchor])] + via))
+
+        # Format like ``format_steps``, looking up the coordinates of each node once
+        used = {record[0] for record in records}
+        for record in records:
+            used.update(record[2])
+        used = np.fromiter(used, dtype=np.int64, count=len(used))
+        coords = dict(zip(used.tolist(), map(tuple, graph.coords[used].tolist())))
+        return StepTrace(mode, [
+            (coords[records[i][0]], records[i][1], [coords[node] for node in records[i][2]]) for i in order.tolist()
+        ])
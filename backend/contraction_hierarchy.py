@@ -0,0 +1,325 @@
+import heapq
+import math
+import os
+
+import numpy as np
+
+# Bump when the arrays stored in a hierarchy file change meaning
+CH_FORMAT_VERSION = 1
+
+# Witness searches give up after settling this many nodes and add the
+# shortcut, which keeps contraction fast at the cost of a few extra edges.
+WITNESS_SETTLE_LIMIT = 60
+
+
+def _csr(num_nodes, sources, targets, weights, middles):
+    sources = np.asarray(sources, dtype=np.int64)
+    order = np.argsort(sources, kind='stable')
+    offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=num_nodes), out=offsets[1:])
+    return (
+        offsets,
+        np.asarray(targets, dtype=np.int32)[order],
+        np.asarray(weights, dtype=np.float64)[order],
+        np.asarray(middles, dtype=np.int32)[order],
+    )
+
+
+class ContractionHierarchy:
+    """Contraction Hierarchy over the node ids of a CSRGraph.
+
+    ``up_*`` arrays hold, per node, the edges to higher ranked nodes used by
+    the forward search. ``down_*`` arrays hold, per node, the edges arriving
+    from higher ranked nodes, reversed for the backward search. ``middle``
+    is the contracted node a shortcut bypasses, or -1 for an original edge.
+    ``edge_keys``/``edge_middle`` map every hierarchy edge ``u * n + v`` to
+    its middle node so shortcuts can be unpacked.
+    """
+
+    def __init__(self, rank, up, down, edge_keys, edge_middle, fingerprint):
+        self.rank = rank
+        self.up_offsets, self.up_targets, self.up_weights, self.up_middle = up
+        self.down_offsets, self.down_targets, self.down_weights, self.down_middle = down
+        self.edge_keys = edge_keys
+        self.edge_middle = edge_middle
+        self.fingerprint = fingerprint
+
+    def __len__(self):
+        return len(self.rank)
+
+    @property
+    def nbytes(self):
+        arrays = (
+            self.rank, self.up_offsets, self.up_targets, self.up_weights, self.up_middle,
+            self.down_offsets, self.down_targets, self.down_weights, self.down_middle,
+            self.edge_keys, self.edge_middle,
+        )
+        return sum(array.nbytes for array in arrays)
+
+    def save(self, path):
+        """Writes the hierarchy to a versioned ``.npz`` file."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.tmp.npz'
+        np.savez(
+            tmp_path,
+            format_version=np.array(CH_FORMAT_VERSION),
+            fingerprint=np.array(self.fingerprint),
+            rank=self.rank,
+            up_offsets=self.up_offsets, up_targets=self.up_targets,
+            up_weights=self.up_weights, up_middle=self.up_middle,
+            down_offsets=self.down_offsets, down_targets=self.down_targets,
+            down_weights=self.down_weights, down_middle=self.down_middle,
+            edge_keys=self.edge_keys, edge_middle=self.edge_middle,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Reads a hierarchy file, raising ValueError for other format versions."""
+        with np.load(path) as data:
+            version = int(data['format_version'])
+            if version != CH_FORMAT_VERSION:
+                raise ValueError(f"Unsupported contraction hierarchy format version {version}")
+            return cls(
+                data['rank'],
+                (data['up_offsets'], data['up_targets'], data['up_weights'], data['up_middle']),
+                (data['down_offsets'], data['down_targets'], data['down_weights'], data['down_middle']),
+                data['edge_keys'],
+                data['edge_middle'],
+                str(data['fingerprint']),
+            )
+
+    def middle_of(self, u, v):
+        """Returns the node bypassed by hierarchy edge ``u -> v``, or -1."""
+        key = u * len(self.rank) + v
+        i = int(np.searchsorted(self.edge_keys, key))
+        if i < len(self.edge_keys) and self.edge_keys[i] == key:
+            return int(self.edge_middle[i])
+        raise KeyError((u, v))
+
+    def unpack(self, path):
+        """Expands the shortcuts of a hierarchy path into original edges."""
+        if not path:
+            return []
+        result = [path[0]]
+        for u, v in zip(path, path[1:]):
+            stack = [(u, v)]
+            while stack:
+                a, b = stack.pop()
+                middle = self.middle_of(a, b)
+                if middle == -1:
+                    result.append(b)
+                else:
+                    stack.append((middle, b))
+                    stack.append((a, middle))
+        return result
+
+    def query(self, source, target, settled_nodes=None):
+        """Returns (distance, node path) between two node ids.
+
+        Runs a forward search over upward edges from ``source`` and a
+        backward search over downward edges from ``target``, each stopping
+        once its smallest key reaches the best meeting distance. Settled
+        nodes are appended to ``settled_nodes`` as (node, cost, side) when
+        given.
+        """
+        if source == target:
+            return 0.0, [source]
+
+        offsets = (self.up_offsets, self.down_offsets)
+        targets = (self.up_targets, self.down_targets)
+        weights = (self.up_weights, self.down_weights)
+        dist = ({source: 0.0}, {target: 0.0})
+        predecessor = ({source: -1}, {target: -1})
+        settled = (set(), set())
+        queues = ([(0.0, source)], [(0.0, target)])
+        best = math.inf
+        meeting_node = -1
+        side = 1
+
+        while queues[0] or queues[1]:
+            # Alternate sides, skipping a side that is exhausted or done
+            side = 1 - side
+            queue = queues[side]
+            if not queue or queue[0][0] >= best:
+                queue.clear()
+                side = 1 - side
+                queue = queues[side]
+                if not queue or queue[0][0] >= best:
+                    break
+
+            cost, node = heapq.heappop(queue)
+            if node in settled[side]:
+                continue
+            settled[side].add(node)
+            if settled_nodes is not None:
+                settled_nodes.append((node, cost, side))
+
+            other_cost = dist[1 - side].get(node)
+            if other_cost is not None and cost + other_cost < best:
+                best = cost + other_cost
+                meeting_node = node
+
+            side_dist = dist[side]
+            lo, hi = offsets[side][node], offsets[side][node + 1]
+            for neighbor, weight in zip(targets[side][lo:hi].tolist(), weights[side][lo:hi].tolist()):
+                new_cost = cost + weight
+                if new_cost < side_dist.get(neighbor, math.inf):
+                    side_dist[neighbor] = new_cost
+                    predecessor[side][neighbor] = node
+                    heapq.heappush(queue, (new_cost, neighbor))
+
+        if meeting_node == -1:
+            return math.inf, []
+
+        path = []
+        node = meeting_node
+        while node != -1:
+            path.append(node)
+            node = predecessor[0][node]
+        path.reverse()
+        node = predecessor[1][meeting_node]
+        while node != -1:
+            path.append(node)
+            node = predecessor[1][node]
+        return best, self.unpack(path)
+
+
+def load_contraction_hierarchy(path, graph):
+    """Loads the hierarchy stored at ``path`` if it was built from ``graph``.
+
+    Returns None when the file is missing, has another format version or
+    was built from a different version of the graph.
+    """
+    try:
+        hierarchy = ContractionHierarchy.load(path)
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+    if hierarchy.fingerprint != graph.fingerprint():
+        return None
+    return hierarchy
+
+
+def _witness_distances(out_adj, source, skipped, max_cost, wanted):
+    """Runs a bounded Dijkstra from ``source`` that avoids ``skipped``."""
+    dist = {source: 0.0}
+    queue = [(0.0, source)]
+    settled = 0
+    remaining = len(wanted)
+    while queue and settled < WITNESS_SETTLE_LIMIT:
+        cost, node = heapq.heappop(queue)
+        if cost > dist.get(node, math.inf):
+            continue
+        if cost > max_cost:
+            break
+        settled += 1
+        if node in wanted:
+            remaining -= 1
+            if remaining == 0:
+                break
+        for neighbor, weight in out_adj[node].items():
+            if neighbor == skipped:
+                continue
+            new_cost = cost + weight
+            if new_cost < dist.get(neighbor, math.inf):
+                dist[neighbor] = new_cost
+                heapq.heappush(queue, (new_cost, neighbor))
+    return dist
+
+
+def _needed_shortcuts(out_adj, in_adj, node):
+    """Returns the shortcuts (u, x, weight) that contracting ``node`` requires."""
+    shortcuts = []
+    outgoing = out_adj[node]
+    for u, in_weight in in_adj[node].items():
+        wanted = {x for x in outgoing if x != u}
+        if not wanted:
+            continue
+        max_cost = in_weight + max(outgoing[x] for x in wanted)
+        dist = _witness_distances(out_adj, u, node, max_cost, wanted)
+        for x in wanted:
+            via = in_weight + outgoing[x]
+            if dist.get(x, math.inf) > via:
+                shortcuts.append((u, x, via))
+    return shortcuts
+
+
+def build_contraction_hierarchy(graph):
+    """Contracts every node of a CSRGraph and returns the hierarchy.
+
+    Nodes are contracted in order of edge difference plus the number of
+    already contracted neighbors, with priorities refreshed lazily when a
+    node reaches the top of the queue.
+    """
+    n = len(graph)
+    out_adj = [dict() for _ in range(n)]
+    in_adj = [dict() for _ in range(n)]
+    middle = {}
+    sources = graph.edge_sources().tolist()
+    for u, v, w in zip(sources, graph.targets.tolist(), graph.weights.tolist()):
+        if u != v and w < out_adj[u].get(v, math.inf):
+            out_adj[u][v] = w
+            in_adj[v][u] = w
+            middle[(u, v)] = -1
+
+    contracted_neighbors = [0] * n
+
+    def priority(node, shortcuts):
+        removed = len(out_adj[node]) + len(in_adj[node])
+        return len(shortcuts) - removed + contracted_neighbors[node]
+
+    queue = [(priority(node, _needed_shortcuts(out_adj, in_adj, node)), node) for node in range(n)]
+    heapq.heapify(queue)
+
+    rank = np.zeros(n, dtype=np.int32)
+    up = ([], [], [], [])
+    down = ([], [], [], [])
+    next_rank = 0
+
+    while queue:
+        _, node = heapq.heappop(queue)
+        # Lazy update: re-queue the node if its priority got worse
+        shortcuts = _needed_shortcuts(out_adj, in_adj, node)
+        current = priority(node, shortcuts)
+        if queue and current > queue[0][0]:
+            heapq.heappush(queue, (current, node))
+            continue
+
+        for u, x, weight in shortcuts:
+            if weight < out_adj[u].get(x, math.inf):
+                out_adj[u][x] = weight
+                in_adj[x][u] = weight
+                middle[(u, x)] = node
+
+        rank[node] = next_rank
+        next_rank += 1
+
+        for x, weight in out_adj[node].items():
+            for array, value in zip(up, (node, x, weight, middle[(node, x)])):
+                array.append(value)
+            del in_adj[x][node]
+            contracted_neighbors[x] += 1
+        for u, weight in in_adj[node].items():
+            for array, value in zip(down, (node, u, weight, middle[(u, node)])):
+                array.append(value)
+            del out_adj[u][node]
+            contracted_neighbors[u] += 1
+        out_adj[node] = {}
+        in_adj[node] = {}
+
+    # Every hierarchy edge u -> v with its middle node, for unpacking
+    keys = np.concatenate((
+        np.asarray(up[0], dtype=np.int64) * n + np.asarray(up[1], dtype=np.int64),
+        np.asarray(down[1], dtype=np.int64) * n + np.asarray(down[0], dtype=np.int64),
+    ))
+    middles = np.concatenate((np.asarray(up[3], dtype=np.int32), np.asarray(down[3], dtype=np.int32)))
+    order = np.argsort(keys, kind='stable')
+
+    return ContractionHierarchy(
+        rank,
+        _csr(n, *up),
+        _csr(n, *down),
+        keys[order],
+        middles[order],
+        graph.fingerprint(),
+    )
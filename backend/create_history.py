@@ -1,32 +1,12 @@
-import networkx as nx
-import geopandas as gpd
 from utils import generate_random_point_pairs, calculate_total_weight, dijkstra_with_steps, astar_with_steps, manhattan_heuristic, euclidean_heuristic, bellman_ford_with_steps, floyd_warshall_with_steps
 from database_manager import DatabaseManager
+from graph_builder import build_csr_graph, line_endpoints, read_lines
 
-G = nx.DiGraph()
-edges = []
+coords, line_offsets, _ = read_lines('./data/graph/complete_graph.geojson')
 
-starts = []
-ends = []
-
-gdf = gpd.read_file('./data/graph/complete_graph.geojson')
-
-for _, row in gdf.iterrows():
-    geom = row.geometry
-
-    if geom.geom_type == 'LineString':
-        start_node = tuple(geom.coords[0])
-        end_node = tuple(geom.coords[-1])
-        length = geom.length
-        edges.append((start_node, end_node, length))
-        edges.append((end_node, start_node, length))
-
-        starts.append(start_node)
-        ends.append(end_node)
-    else:
-        raise ValueError(f"Unexpected geometry type: {geom.geom_type}")
-    
-G.add_weighted_edges_from(edges)
+# One edge per LineString between its end points, weighted by its length
+G = build_csr_graph(coords, line_offsets, precision=None, endpoints_only=True)
+starts, ends = line_endpoints(coords, line_offsets)
 
 start_pairs, end_pairs = generate_random_point_pairs(starts,ends)
 
@@ -36,7 +16,8 @@ end_node = (463122.297, 88799.614)
 '''
 
 import json
-from app import app, db
+from app import create_app, db
+app = create_app()
 with app.app_context():
     db_manager = DatabaseManager(db)
     for i in range(1000):
@@ -53,7 +34,7 @@ with app.app_context():
         end_node_id = end_node_record.NodeID
         
         # Dijkstra
-        dijkstra_steps, dijkstra_path, dijkstra_time = dijkstra_with_steps(G, start_node, end_node)
+        dijkstra_steps, dijkstra_path, dijkstra_time = dijkstra_with_steps(G, start_node, end_node, trace='none')
         dijkstra_total_weight = calculate_total_weight(G, dijkstra_path)
         db_manager.add_shortest_path_result(
             algorithm="Dijkstra",
@@ -61,12 +42,13 @@ with app.app_context():
             end_node_id=end_node_id,
             path=dijkstra_path,
             total_weight=dijkstra_total_weight,
-            steps=len(dijkstra_steps),
-            time=dijkstra_time
+            steps=dijkstra_steps.settled,
+            time=dijkstra_time,
+            graph="complete_graph"
         )
 
         # A* (Manhattan)
-        astar_steps, astar_path, astar_time = astar_with_steps(G, start_node, end_node, heuristic=manhattan_heuristic)
+        astar_steps, astar_path, astar_time = astar_with_steps(G, start_node, end_node, heuristic=manhattan_heuristic, trace='none')
         astar_total_weight = calculate_total_weight(G, astar_path)
         db_manager.add_shortest_path_result(
             algorithm="A* (Manhattan)",
@@ -74,12 +56,13 @@ with app.app_context():
             end_node_id=end_node_id,
             path=astar_path,
             total_weight=astar_total_weight,
-            steps=len(astar_steps),
-            time=astar_time
+            steps=astar_steps.settled,
+            time=astar_time,
+            graph="complete_graph"
         )
 
         # A* (Euclidean)
-        astar_steps2, astar_path2, astar_time2 = astar_with_steps(G, start_node, end_node, heuristic=euclidean_heuristic)
+        astar_steps2, astar_path2, astar_time2 = astar_with_steps(G, start_node, end_node, heuristic=euclidean_heuristic, trace='none')
         astar_total_weight2 = calculate_total_weight(G, astar_path2)
         db_manager.add_shortest_path_result(
             algorithm="A* (Euclidean)",
@@ -87,7 +70,20 @@ with app.app_context():
             end_node_id=end_node_id,
             path=astar_path2,
             total_weight=astar_total_weight2,
-            steps=len(astar_steps2),
-            time=astar_time2
+            steps=astar_steps2.settled,
+            time=astar_time2,
+            graph="complete_graph"
         )
 
+        # Bellman-Ford
+        bellman_ford_steps, bellman_ford_path, bellman_ford_total_weight, bellman_ford_time = bellman_ford_with_steps(G, start_node, end_node, trace='none')
+        db_manager.add_shortest_path_result(
+            algorithm="Bellman-Ford",
+            start_node_id=start_node_id,
+            end_node_id=end_node_id,
+            path=bellman_ford_path,
+            total_weight=bellman_ford_total_weight,
+            steps=bellman_ford_steps.settled,
+            time=bellman_ford_time,
+            graph="complete_graph"
+        )
@@ -0,0 +1,175 @@
+import hashlib
+
+import numpy as np
+
+
+class CSRGraph:
+    """Directed weighted graph stored as compressed sparse row arrays.
+
+    Nodes are identified by dense integer ids ordered lexicographically by
+    their (x, y) coordinates, so comparing ids orders nodes the same way as
+    comparing coordinate tuples. The out-edges of node ``i`` are
+    ``targets[offsets[i]:offsets[i + 1]]`` with matching ``weights``.
+    """
+
+    def __init__(self, coords, offsets, targets, weights, fingerprint=None, reverse=None):
+        self.coords = np.ascontiguousarray(coords, dtype=np.float64).reshape(-1, 2)
+        self.offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+        self.targets = np.ascontiguousarray(targets, dtype=np.int32)
+        self.weights = np.ascontiguousarray(weights, dtype=np.float64)
+        # Graphs loaded from a compiled bundle come with their reverse and fingerprint
+        self._reverse = reverse
+        if reverse is not None:
+            reverse._reverse = self
+        self._fingerprint = fingerprint
+        self._spatial_index = None
+
+    @classmethod
+    def from_edges(cls, coords, sources, targets, weights):
+        """Builds a graph from parallel edge arrays over sorted ``coords``.
+
+        Edges keep their given order within each source node.
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        order = np.argsort(sources, kind='stable')
+        counts = np.bincount(sources, minlength=len(coords))
+        offsets = np.zeros(len(coords) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return cls(coords, offsets, np.asarray(targets)[order], np.asarray(weights)[order])
+
+    @classmethod
+    def from_networkx(cls, G, weight='weight'):
+        """Converts a networkx graph whose nodes are (x, y) tuples."""
+        nodes = sorted(G.nodes)
+        index = {node: i for i, node in enumerate(nodes)}
+        sources = []
+        targets = []
+        weights = []
+        for node in nodes:
+            u = index[node]
+            for neighbor, data in G[node].items():
+                sources.append(u)
+                targets.append(index[neighbor])
+                weights.append(data[weight])
+        coords = np.array(nodes, dtype=np.float64).reshape(-1, 2)
+        return cls.from_edges(coords, sources, targets, weights)
+
+    def to_networkx(self):
+        """Returns the graph as a networkx DiGraph keyed by coordinate tuples."""
+        import networkx as nx
+
+        G = nx.DiGraph()
+        nodes = [tuple(xy) for xy in self.coords.tolist()]
+        G.add_nodes_from(nodes)
+        sources = np.repeat(np.arange(len(nodes)), np.diff(self.offsets))
+        G.add_weighted_edges_from(
+            (nodes[u], nodes[v], w)
+            for u, v, w in zip(sources.tolist(), self.targets.tolist(), self.weights.tolist())
+        )
+        return G
+
+    def __len__(self):
+        return len(self.coords)
+
+    def __contains__(self, coord):
+        return self.index_of(coord) is not None
+
+    def __iter__(self):
+        return iter(range(len(self.coords)))
+
+    def number_of_nodes(self):
+        return len(self.coords)
+
+    def number_of_edges(self):
+        return len(self.targets)
+
+    @property
+    def nbytes(self):
+        return self.coords.nbytes + self.offsets.nbytes + self.targets.nbytes + self.weights.nbytes
+
+    def index_of(self, coord):
+        """Returns the id of the node at ``coord``, or None if there is none."""
+        x, y = coord
+        xs = self.coords[:, 0]
+        lo = int(np.searchsorted(xs, x, side='left'))
+        hi = int(np.searchsorted(xs, x, side='right'))
+        if lo == hi:
+            return None
+        i = lo + int(np.searchsorted(self.coords[lo:hi, 1], y, side='left'))
+        if i < hi and self.coords[i, 1] == y:
+            return i
+        return None
+
+    def indices_of(self, coords):
+        """Returns the ids of the nodes at each of ``coords``, -1 where there is none."""
+        # Complex numbers sort by real then imaginary part, the order of the nodes
+        keys = self.coords.view(np.complex128).ravel()
+        wanted = np.ascontiguousarray(coords, dtype=np.float64).reshape(-1, 2).view(np.complex128).ravel()
+        ids = np.searchsorted(keys, wanted)
+        found = ids < len(keys)
+        found[found] = keys[ids[found]] == wanted[found]
+        return np.where(found, ids, -1)
+
+    def node(self, i):
+        """Returns the coordinate tuple of node ``i``."""
+        return tuple(self.coords[i].tolist())
+
+    def nodes_of(self, ids):
+        """Returns the coordinate tuples of a sequence of node ids."""
+        return [tuple(xy) for xy in self.coords[list(ids)].tolist()]
+
+    def neighbors(self, i):
+        """Returns the (target ids, weights) of the out-edges of node ``i``."""
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        return self.targets[start:stop].tolist(), self.weights[start:stop].tolist()
+
+    def edge_weight(self, u, v):
+        """Returns the weight of edge ``u -> v`` between node ids."""
+        start, stop = self.offsets[u], self.offsets[u + 1]
+        matches = np.flatnonzero(self.targets[start:stop] == v)
+        if len(matches) == 0:
+            raise KeyError((u, v))
+        return float(self.weights[start + matches[0]])
+
+    def reverse(self):
+        """Returns the graph with every edge reversed, built once and cached."""
+        if self._reverse is None:
+            reverse = CSRGraph.from_edges(self.coords, self.targets, self.edge_sources(), self.weights)
+            reverse._reverse = self
+            self._reverse = reverse
+        return self._reverse
+
+    def spatial_index(self):
+        """Returns the nearest node and edge index of the graph, built once and cached."""
+        if self._spatial_index is None:
+            from spatial_index import SpatialIndex
+
+            self._spatial_index = SpatialIndex(self)
+        return self._spatial_index
+
+    def fingerprint(self):
+        """Returns a hash of the nodes, edges and weights, computed once."""
+        if self._fingerprint is None:
+            digest = hashlib.sha1()
+            for array in (self.coords, self.offsets, self.targets, self.weights):
+                digest.update(array.tobytes())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def to_scipy(self):
+        """Returns the adjacency as a scipy.sparse CSR matrix sharing the arrays."""
+        from scipy.sparse import csr_matrix
+
+        n = len(self.coords)
+        return csr_matrix((self.weights, self.targets, self.offsets), shape=(n, n))
+
+    def edge_sources(self):
+        """Returns the source id of every edge, aligned with ``targets``."""
+        return np.repeat(np.arange(len(self.coords), dtype=np.int32), np.diff(self.offsets))
+
+
+def as_csr_graph(graph):
+    """Returns ``graph`` as a CSRGraph, converting networkx graphs."""
+    if isinstance(graph, CSRGraph):
+        return graph
+    return CSRGraph.from_networkx(graph)
@@ -1,13 +1,31 @@
+import sqlite3
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 db = SQLAlchemy()
 
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_wal(dbapi_connection, connection_record):
+    """Lets readers run alongside the result writer and makes commits cheaper."""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
 class Node(db.Model):
     __tablename__ = 'node'
     
     NodeID = db.Column(db.Integer, primary_key=True, autoincrement=True)
     Name = db.Column(db.String(255), nullable=False)
     Coordinates = db.Column(db.String(255), nullable=False) 
+    # Numeric copy of Coordinates for indexed lookups
+    X = db.Column(db.Float, nullable=True)
+    Y = db.Column(db.Float, nullable=True)
+
+    __table_args__ = (db.Index('ix_node_xy', 'X', 'Y', unique=True),)
 
     def __repr__(self):
         return f'<Node {self.Name}>'
@@ -40,9 +58,51 @@ class ShortestPathResult(db.Model):
     TotalWeight = db.Column(db.Float, nullable=False)
     Steps = db.Column(db.Integer, nullable=False)
     Time = db.Column(db.Float, nullable=False)
+    # Only set by bidirectional algorithms
+    ForwardSteps = db.Column(db.Integer, nullable=True)
+    BackwardSteps = db.Column(db.Integer, nullable=True)
+    # Graph the result was computed on, unset for older results
+    Graph = db.Column(db.String(255), nullable=True)
 
     start_node = db.relationship('Node', foreign_keys=[StartNodeID])
     end_node = db.relationship('Node', foreign_keys=[EndNodeID])
 
     def __repr__(self):
         return f"<ShortestPathResult {self.Algorithm} from {self.StartNodeID} to {self.EndNodeID}>"
+
+
+class AlgorithmStatistics(db.Model):
+    """Rollup of the shortest path results of one algorithm on one graph.
+
+    Updated in the transaction that inserts the results, so reading the
+    statistics never scans the result table. Columns are read and written
+    through ``statistics_rollup.ResultSummary``.
+    """
+    __tablename__ = 'algorithm_statistics'
+
+    Algorithm = db.Column(db.String(255), primary_key=True)
+    # Empty for results recorded without their graph
+    Graph = db.Column(db.String(255), primary_key=True, default='')
+    Count = db.Column(db.Integer, nullable=False, default=0)
+    StepsSum = db.Column(db.Float, nullable=False, default=0.0)
+    StepsMin = db.Column(db.Float, nullable=True)
+    StepsMax = db.Column(db.Float, nullable=True)
+    TimeSum = db.Column(db.Float, nullable=False, default=0.0)
+    TimeMin = db.Column(db.Float, nullable=True)
+    TimeMax = db.Column(db.Float, nullable=True)
+    TotalWeightSum = db.Column(db.Float, nullable=False, default=0.0)
+    TotalWeightMin = db.Column(db.Float, nullable=True)
+    TotalWeightMax = db.Column(db.Float, nullable=True)
+    PathLengthSum = db.Column(db.Float, nullable=False, default=0.0)
+    PathLengthMin = db.Column(db.Float, nullable=True)
+    PathLengthMax = db.Column(db.Float, nullable=True)
+    ForwardStepsSum = db.Column(db.Float, nullable=False, default=0.0)
+    ForwardStepsCount = db.Column(db.Integer, nullable=False, default=0)
+    BackwardStepsSum = db.Column(db.Float, nullable=False, default=0.0)
+    BackwardStepsCount = db.Column(db.Integer, nullable=False, default=0)
+    # Serialized statistics_rollup.QuantileSketch of each column
+    StepsSketch = db.Column(db.Text, nullable=True)
+    TimeSketch = db.Column(db.Text, nullable=True)
+
+    def __repr__(self):
+        return f'<AlgorithmStatistics {self.Algorithm} on {self.Graph}>'
@@ -1,6 +1,15 @@
-from database import Node, Edge, ShortestPathResult
+from database import Node, Edge, ShortestPathResult, AlgorithmStatistics
 from utils import insert_network_data
+from statistics_rollup import ResultSummary
 import json
+from itertools import chain
+
+import numpy as np
+from sqlalchemy import func, select
+
+def encode_path(path):
+    """Encodes a path of coordinate pairs as compact JSON."""
+    return json.dumps(path, separators=(',', ':'))
 
 class DatabaseManager:
     def __init__(self, db):
@@ -8,7 +17,8 @@ class DatabaseManager:
 
     def add_node(self, name, coordinates):
         """Adds a new node to the database."""
-        node = Node(Name=name, Coordinates=coordinates)
+        x, y = (float(value) for value in coordinates.split(','))
+        node = Node(Name=name, Coordinates=coordinates, X=x, Y=y)
         self.db.session.add(node)
         self.db.session.commit()
         return node
@@ -39,78 +49,304 @@ class DatabaseManager:
     
     def get_node_by_coordinates(self, coordinates):
         """Fetches a node by its coordinates."""
-        coord_str = f"{coordinates[0]},{coordinates[1]}"
-        return Node.query.filter_by(Coordinates=coord_str).first()
+        return Node.query.filter_by(X=float(coordinates[0]), Y=float(coordinates[1])).first()
+
+    def get_node_ids(self):
+        """Returns a {(x, y): NodeID} dict of every node."""
+        rows = self.db.session.connection().exec_driver_sql('SELECT "X", "Y", "NodeID" FROM node').fetchall()
+        return {(x, y): node_id for x, y, node_id in rows}
+
+    def import_network(self, coords, line_offsets, lengths=None, batch_size=10000):
+        """Bulk-inserts the vertices and segments of lines as nodes and edges.
+
+        Line ``i`` spans ``coords[line_offsets[i]:line_offsets[i + 1]]``.
+        Every distinct vertex becomes a node unless one with the same X/Y
+        already exists, and every pair of consecutive vertices a
+        bidirectional edge weighted by ``lengths[i]``, or by the segment
+        length where that is None or NaN. Everything is inserted in one transaction with
+        executemany batches of ``batch_size`` rows. Returns the number of
+        new nodes and of edges.
+        """
+        from graph_builder import unique_rows
+
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        line_offsets = np.asarray(line_offsets, dtype=np.int64)
+        points, inverse = unique_rows(coords)
+
+        # Resolve vertices to existing nodes first, then number the new ones
+        known = self.get_node_ids()
+        next_id = (self.db.session.execute(select(func.max(Node.NodeID))).scalar() or 0) + 1
+        point_ids = np.empty(len(points), dtype=np.int64)
+        node_rows = []
+        for i, (x, y) in enumerate(points.tolist()):
+            node_id = known.get((x, y))
+            if node_id is None:
+                node_id = next_id
+                next_id += 1
+                node_rows.append((node_id, f'Node_{node_id}', f'{x},{y}', x, y))
+            point_ids[i] = node_id
+        vertex_ids = point_ids[inverse]
+
+        # Segment i joins vertex i and i + 1 unless vertex i ends a line
+        segment_mask = np.ones(max(len(coords) - 1, 0), dtype=bool)
+        line_ends = line_offsets[1:-1] - 1
+        segment_mask[line_ends[(line_ends >= 0) & (line_ends < len(segment_mask))]] = False
+        first = np.flatnonzero(segment_mask)
+        distances = np.hypot(*(coords[first + 1] - coords[first]).T)
+        if lengths is not None:
+            line_of_vertex = np.repeat(np.arange(len(line_offsets) - 1), np.diff(line_offsets))
+            line_lengths = np.asarray(lengths, dtype=np.float64)[line_of_vertex[first]]
+            distances = np.where(np.isnan(line_lengths), distances, line_lengths)
+        edge_rows = list(zip(vertex_ids[first].tolist(), vertex_ids[first + 1].tolist(), distances.tolist(), [True] * len(first)))
+
+        # Plain DB-API executemany, the ORM would build an object per row
+        connection = self.db.session.connection()
+        statements = (
+            ('INSERT INTO node ("NodeID", "Name", "Coordinates", "X", "Y") VALUES (?, ?, ?, ?, ?)', node_rows),
+            ('INSERT INTO edge ("SourceNodeID", "DestinationNodeID", "Distance", "Bidirectional") VALUES (?, ?, ?, ?)', edge_rows),
+        )
+        for statement, rows in statements:
+            for start in range(0, len(rows), batch_size):
+                connection.exec_driver_sql(statement, rows[start:start + batch_size])
+        self.db.session.commit()
+        return len(node_rows), len(edge_rows)
+
+    def load_csr_graph(self):
+        """Builds a CSRGraph of the node and edge tables, one query per table.
+
+        Bidirectional edges are added in both directions.
+        """
+        from csr_graph import CSRGraph
+
+        connection = self.db.session.connection()
+
+        def fetch_array(statement, width):
+            # np.array is slow on result rows, flattening them first is not
+            rows = connection.exec_driver_sql(statement).fetchall()
+            return np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=width * len(rows)).reshape(-1, width)
+
+        nodes = fetch_array('SELECT "NodeID", "X", "Y" FROM node', 3)
+        edges = fetch_array('SELECT "SourceNodeID", "DestinationNodeID", "Distance", "Bidirectional" FROM edge', 4)
+
+        # CSRGraph ids follow the lexicographic order of the coordinates
+        order = np.lexsort((nodes[:, 2], nodes[:, 1]))
+        node_ids = nodes[order, 0].astype(np.int64)
+        index_of = np.empty(int(node_ids.max()) + 1 if len(node_ids) else 0, dtype=np.int64)
+        index_of[node_ids] = np.arange(len(node_ids))
+
+        sources = index_of[edges[:, 0].astype(np.int64)]
+        targets = index_of[edges[:, 1].astype(np.int64)]
+        weights = edges[:, 2]
+        both = edges[:, 3] != 0
+        return CSRGraph.from_edges(
+            nodes[order, 1:],
+            np.concatenate((sources, targets[both])),
+            np.concatenate((targets, sources[both])),
+            np.concatenate((weights, weights[both]))
+        )
+
+    def migrate_node_coordinates(self):
+        """Adds and fills the X/Y columns of a node table created before they existed.
+
+        Old tables may hold several nodes at the same coordinates, which the
+        unique X/Y index does not allow: each such group is merged into its
+        lowest NodeID, with the edges and results pointing at the others
+        moved over to it, before the index is created. Also finishes a
+        migration that added the columns but stopped short of the index.
+        """
+        connection = self.db.session.connection()
+        columns = {row[1] for row in connection.exec_driver_sql('PRAGMA table_info(node)')}
+        indexes = {row[1] for row in connection.exec_driver_sql('PRAGMA index_list(node)')}
+        if 'X' in columns and 'ix_node_xy' in indexes:
+            return False
+        if 'X' not in columns:
+            connection.exec_driver_sql('ALTER TABLE node ADD COLUMN X FLOAT')
+            connection.exec_driver_sql('ALTER TABLE node ADD COLUMN Y FLOAT')
+        connection.exec_driver_sql(
+            "UPDATE node SET X = CAST(substr(Coordinates, 1, instr(Coordinates, ',') - 1) AS REAL), "
+            "Y = CAST(substr(Coordinates, instr(Coordinates, ',') + 1) AS REAL) WHERE X IS NULL OR Y IS NULL"
+        )
+
+        connection.exec_driver_sql('DROP TABLE IF EXISTS temp.node_duplicate')
+        connection.exec_driver_sql(
+            'CREATE TEMP TABLE node_duplicate AS '
+            'SELECT node."NodeID" AS "NodeID", kept."KeptID" AS "KeptID" FROM node JOIN ('
+            '    SELECT "X", "Y", min("NodeID") AS "KeptID" FROM node WHERE "X" IS NOT NULL AND "Y" IS NOT NULL '
+            '    GROUP BY "X", "Y" HAVING count(*) > 1'
+            ') AS kept ON node."X" = kept."X" AND node."Y" = kept."Y" '
+            'WHERE node."NodeID" != kept."KeptID"'
+        )
+        for table, column in (('edge', 'SourceNodeID'), ('edge', 'DestinationNodeID'),
+                              ('shortest_path_result', 'StartNodeID'), ('shortest_path_result', 'EndNodeID')):
+            connection.exec_driver_sql(
+                f'UPDATE {table} SET "{column}" = '
+                f'(SELECT "KeptID" FROM node_duplicate WHERE node_duplicate."NodeID" = {table}."{column}") '
+                f'WHERE "{column}" IN (SELECT "NodeID" FROM node_duplicate)'
+            )
+        connection.exec_driver_sql('DELETE FROM node WHERE "NodeID" IN (SELECT "NodeID" FROM node_duplicate)')
+        connection.exec_driver_sql('DROP TABLE node_duplicate')
+
+        connection.exec_driver_sql('CREATE UNIQUE INDEX IF NOT EXISTS ix_node_xy ON node (X, Y)')
+        self.db.session.commit()
+        return True
 
 
     def get_edge_by_id(self, edge_id):
         """Fetches an edge by its ID."""
         return self.db.session.get(Edge, edge_id)
 
-    def add_shortest_path_result(self, algorithm, start_node_id, end_node_id, path, total_weight, steps, time):
+    @staticmethod
+    def shortest_path_row(algorithm, start_node_id, end_node_id, path, total_weight, steps, time, forward_steps=None, backward_steps=None, graph=None):
+        """Returns the column values of a shortest path result, encoding the path once."""
+        return {
+            'Algorithm': algorithm,
+            'StartNodeID': start_node_id,
+            'EndNodeID': end_node_id,
+            'Path': encode_path(path),
+            'TotalWeight': total_weight,
+            'Steps': steps,
+            'Time': time,
+            'ForwardSteps': forward_steps,
+            'BackwardSteps': backward_steps,
+            'Graph': graph
+        }
+
+    def add_shortest_path_result(self, algorithm, start_node_id, end_node_id, path, total_weight, steps, time, forward_steps=None, backward_steps=None, graph=None):
         """Adds a shortest path result to the database."""
-        result = ShortestPathResult(
-            Algorithm=algorithm,
-            StartNodeID=start_node_id,
-            EndNodeID=end_node_id,
-            Path=json.dumps(path),  
-            TotalWeight=total_weight,
-            Steps=steps,
-            Time=time
+        row = self.shortest_path_row(
+            algorithm, start_node_id, end_node_id, path, total_weight, steps, time, forward_steps, backward_steps, graph
         )
+        result = ShortestPathResult(**row)
         self.db.session.add(result)
+        self.db.session.flush()
+        self.update_statistics([row])
         self.db.session.commit()
         return result
 
+    def add_shortest_path_results(self, rows):
+        """Adds many results built by ``shortest_path_row`` in one bulk insert and commit."""
+        from sqlalchemy import insert
+
+        if not rows:
+            return 0
+        self.db.session.execute(insert(ShortestPathResult), rows)
+        self.update_statistics(rows)
+        self.db.session.commit()
+        return len(rows)
+
+    def update_statistics(self, rows):
+        """Folds result rows into the algorithm_statistics rollup without committing.
+
+        Called after the rows are inserted, so the write lock is already
+        held and concurrent writers cannot interleave their updates.
+        """
+        groups = {}
+        for row in rows:
+            groups.setdefault((row['Algorithm'], row.get('Graph') or ''), []).append(row)
+        for (algorithm, graph), group in groups.items():
+            record = self.db.session.get(AlgorithmStatistics, (algorithm, graph))
+            if record is None:
+                record = AlgorithmStatistics(Algorithm=algorithm, Graph=graph)
+                self.db.session.add(record)
+                summary = ResultSummary()
+            else:
+                summary = ResultSummary.from_record(record)
+            summary.add_rows(group)
+            summary.to_record(record)
+
+    def rebuild_statistics(self):
+        """Recomputes the algorithm_statistics rollup from every stored result."""
+        # A path of n nodes [[x,y],...] holds 2n - 1 commas, and "[]" none
+        rows = self.db.session.connection().exec_driver_sql(
+            'SELECT "Algorithm", coalesce("Graph", \'\'), "Steps", "Time", "TotalWeight", '
+            '(length("Path") - length(replace("Path", \',\', \'\')) + 1) / 2, "ForwardSteps", "BackwardSteps" '
+            'FROM shortest_path_result'
+        ).fetchall()
+        columns = ('Steps', 'Time', 'TotalWeight', 'PathLength', 'ForwardSteps', 'BackwardSteps')
+        groups = {}
+        for algorithm, graph, *values in rows:
+            group = groups.setdefault((algorithm, graph), {column: [] for column in columns})
+            for column, value in zip(columns, values):
+                group[column].append(value)
+
+        self.db.session.query(AlgorithmStatistics).delete()
+        for (algorithm, graph), group in groups.items():
+            summary = ResultSummary()
+            summary.add(group)
+            record = AlgorithmStatistics(Algorithm=algorithm, Graph=graph)
+            summary.to_record(record)
+            self.db.session.add(record)
+        self.db.session.commit()
+        return len(rows)
+
+    def migrate_statistics(self):
+        """Adds the step and Graph columns to an old result table and fills an empty rollup from its results."""
+        connection = self.db.session.connection()
+        columns = {row[1] for row in connection.exec_driver_sql('PRAGMA table_info(shortest_path_result)')}
+        migrated = False
+        for column, column_type in (('ForwardSteps', 'INTEGER'), ('BackwardSteps', 'INTEGER'), ('Graph', 'VARCHAR(255)')):
+            if column not in columns:
+                connection.exec_driver_sql(f'ALTER TABLE shortest_path_result ADD COLUMN {column} {column_type}')
+                migrated = True
+        has_results = connection.exec_driver_sql('SELECT 1 FROM shortest_path_result LIMIT 1').first() is not None
+        has_rollup = connection.exec_driver_sql('SELECT 1 FROM algorithm_statistics LIMIT 1').first() is not None
+        if has_results and not has_rollup:
+            self.rebuild_statistics()
+            migrated = True
+        self.db.session.commit()
+        return migrated
+
     def get_all_shortest_path_results(self):
         """Fetches all shortest path results from the database."""
         return ShortestPathResult.query.all()
     
-    def get_statistics(self):
-        from sqlalchemy.sql import func
-        from sqlalchemy.orm import aliased
-
-        results = (
-            self.db.session.query(
-                ShortestPathResult.Algorithm,
-                func.count(ShortestPathResult.ResultID).label("total_records"),
-                func.avg(ShortestPathResult.Steps).label("average_steps"),
-                func.avg(func.length(ShortestPathResult.Path) - func.length(func.replace(ShortestPathResult.Path, ',', '')) + 1).label("average_path_length"), 
-                func.avg(ShortestPathResult.Time).label("average_time"),
-                func.avg(ShortestPathResult.TotalWeight).label("average_weight")  
-            )
-            .group_by(ShortestPathResult.Algorithm)
-            .all()
-        )
+    def get_statistics(self, by_graph=False):
+        """Returns the statistics of every algorithm, read from the rollup.
 
-        statistics = [
-            {
-                "algorithm": result.Algorithm,
-                "total_records": result.total_records,
-                "average_steps": round(result.average_steps, 2) if result.average_steps else 0,
-                "average_path_length": round(result.average_path_length, 2) if result.average_path_length else 0,
-                "average_time": round(result.average_time, 4) if result.average_time else 0,
-                "average_weight": round(result.average_weight, 3) if result.average_weight else 0,  
-            }
-            for result in results
-        ]
+        With ``by_graph`` there is one entry per algorithm and graph,
+        otherwise the graphs of each algorithm are merged.
+        """
+        summaries = {}
+        for record in AlgorithmStatistics.query.order_by(AlgorithmStatistics.Algorithm, AlgorithmStatistics.Graph):
+            key = (record.Algorithm, record.Graph) if by_graph else (record.Algorithm,)
+            summary = ResultSummary.from_record(record)
+            if key in summaries:
+                summaries[key].merge(summary)
+            else:
+                summaries[key] = summary
 
+        statistics = []
+        for key, summary in summaries.items():
+            entry = {"algorithm": key[0]}
+            if by_graph:
+                entry["graph"] = key[1] or None
+            entry.update(summary.as_dict())
+            statistics.append(entry)
         return statistics
 
+    def get_statistics_version(self):
+        """Returns a version string that changes whenever the rollup does.
+
+        Every insert raises the newest result id, and rebuilding the rollup
+        after results were deleted changes its count, so two states of the
+        rollup do not share a version the way two equal counts could.
+        """
+        newest = self.db.session.execute(select(func.max(ShortestPathResult.ResultID))).scalar()
+        total = self.db.session.execute(select(func.sum(AlgorithmStatistics.Count))).scalar()
+        return f'{newest or 0}.{total or 0}'
+
     
 
 if __name__ == '__main__':
-    from app import db, app
+    from app import create_app, db
+    app = create_app()
     
-    import geopandas as gpd
     import json
     with app.app_context():
         db_manager = DatabaseManager(db)
 
-        gdf = gpd.read_file('./data/graph/complete_graph.geojson')
-
-        # 将 GeoDataFrame 转换为 GeoJSON 格式的字典
-        geojson_data = json.loads(gdf.to_json())
+        with open('./data/graph/complete_graph.geojson') as f:
+            geojson_data = json.load(f)
 
         # 插入网络图数据
         insert_network_data(geojson_data, db_manager)
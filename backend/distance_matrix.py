@@ -0,0 +1,249 @@
+import json
+import os
+import secrets
+
+import numpy as np
+
+from graph_bundle import bundle_lock
+
+# Bump when the layout of the saved matrices changes
+MATRIX_FORMAT_VERSION = 1
+
+# Floyd-Warshall does n^3 work whatever the number of edges, so it only
+# beats one Dijkstra per node on small graphs with many edges per node.
+FLOYD_WARSHALL_MAX_NODES = 1024
+FLOYD_WARSHALL_MIN_DENSITY = 0.05
+
+# Rows are updated in tiles of this many rows, once per block of as many
+# intermediate nodes, so that a tile stays in cache across the block.
+FLOYD_WARSHALL_TILE = 64
+
+# Number of columns computed per batch of Dijkstra searches
+DIJKSTRA_BATCH = 256
+
+
+def _initial_matrices(graph):
+    n = len(graph)
+    dist = np.full((n, n), np.inf)
+    next_hop = np.full((n, n), -1, dtype=np.int32)
+    sources = graph.edge_sources()
+    np.minimum.at(dist, (sources, graph.targets), graph.weights)
+    next_hop[sources, graph.targets] = graph.targets
+    diagonal = np.arange(n)
+    dist[diagonal, diagonal] = np.minimum(dist[diagonal, diagonal], 0.0)
+    next_hop[diagonal, diagonal] = diagonal
+    return dist, next_hop
+
+
+def floyd_warshall(graph, tile=FLOYD_WARSHALL_TILE):
+    """Returns the (dist, next_hop) matrices of a CSRGraph by tiled Floyd-Warshall.
+
+    For every block of intermediate nodes the rows of the block itself are
+    updated first, then the remaining rows tile by tile against them.
+    Raises ValueError when the graph has a negative weight cycle.
+    """
+    dist, next_hop = _initial_matrices(graph)
+    n = len(graph)
+
+    for block_start in range(0, n, tile):
+        block = range(block_start, min(block_start + tile, n))
+        tiles = [(block.start, block.stop)]
+        for start in range(0, n, tile):
+            if start != block.start:
+                tiles.append((start, min(start + tile, n)))
+
+        for start, stop in tiles:
+            rows = dist[start:stop]
+            row_hops = next_hop[start:stop]
+            for k in block:
+                via = rows[:, k, None] + dist[k]
+                better = via < rows
+                np.copyto(rows, via, where=better)
+                np.copyto(row_hops, np.broadcast_to(row_hops[:, k, None], row_hops.shape), where=better)
+
+    if (np.diagonal(dist) < 0).any():
+        raise ValueError("Graph contains a negative weight cycle")
+    return dist, next_hop
+
+
+def _shortest_paths(graph, indices, **kwargs):
+    """Runs scipy's Dijkstra from ``indices``, or Johnson's for negative weights."""
+    from scipy.sparse.csgraph import NegativeCycleError, shortest_path
+
+    method = 'J' if len(graph.weights) and graph.weights.min() < 0 else 'D'
+    try:
+        return shortest_path(graph.to_scipy(), method=method, indices=indices, **kwargs)
+    except NegativeCycleError:
+        raise ValueError("Graph contains a negative weight cycle")
+
+
+def dijkstra_columns(graph, columns):
+    """Returns the distances and next hops from every node to ``columns``.
+
+    Searches the reversed graph from each column: the predecessor of ``i``
+    on the reversed path from ``j`` is the node after ``i`` on the path
+    from ``i`` to ``j``. Johnson's algorithm is used for negative weights.
+    """
+    reverse = graph.reverse()
+    dist, predecessors = _shortest_paths(reverse, columns, return_predecessors=True)
+    next_hop = predecessors.astype(np.int32)
+    next_hop[next_hop < 0] = -1
+    next_hop[np.arange(len(columns)), columns] = columns
+    return dist.T, next_hop.T
+
+
+class DistanceMatrix:
+    """All-pairs shortest path distances over the node ids of a CSRGraph.
+
+    ``dist[i, j]`` is the distance from ``i`` to ``j`` (inf if unreachable)
+    and ``next_hop[i, j]`` the node after ``i`` on a shortest path to
+    ``j``, or -1. Loaded matrices are read-only memory maps.
+    """
+
+    def __init__(self, dist, next_hop, fingerprint, method):
+        self.dist = dist
+        self.next_hop = next_hop
+        self.fingerprint = fingerprint
+        self.method = method
+
+    def __len__(self):
+        return len(self.dist)
+
+    @property
+    def nbytes(self):
+        return self.dist.nbytes + self.next_hop.nbytes
+
+    def submatrix(self, sources, targets):
+        """Returns the distances between two sequences of node ids."""
+        return self.dist[np.ix_(sources, targets)]
+
+    def path(self, source, target):
+        """Returns the node ids of a shortest path, or [] if there is none."""
+        if self.next_hop[source, target] == -1:
+            return []
+        path = [source]
+        while path[-1] != target:
+            path.append(int(self.next_hop[path[-1], target]))
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """Memory-maps saved matrices, raising ValueError for other format versions."""
+        with open(f'{path}.json') as f:
+            meta = json.load(f)
+        if meta['format_version'] != MATRIX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported distance matrix format version {meta['format_version']}")
+        dist = np.load(f'{path}.dist.npy', mmap_mode='r')
+        next_hop = np.load(f'{path}.next.npy', mmap_mode='r')
+        return cls(dist, next_hop, meta['fingerprint'], meta['method'])
+
+
+def choose_method(graph):
+    """Picks 'floyd-warshall' for small dense graphs and 'dijkstra' otherwise."""
+    n = len(graph)
+    if n <= FLOYD_WARSHALL_MAX_NODES and graph.number_of_edges() >= FLOYD_WARSHALL_MIN_DENSITY * n * n:
+        return 'floyd-warshall'
+    return 'dijkstra'
+
+
+def build_distance_matrix(graph, path, method=None):
+    """Computes the all-pairs matrices of a CSRGraph into files at ``path``.
+
+    The matrices are written as ``<path>.dist.npy`` and ``<path>.next.npy``
+    straight into memory maps, so graphs whose matrices do not fit in
+    memory twice can still be processed, and are returned memory-mapped.
+    Builds of the same path are serialized across processes by
+    ``bundle_lock`` and each writes its own temporary files, so a file is
+    only ever replaced by a complete one.
+    """
+    with bundle_lock(path):
+        return _build_distance_matrix(graph, path, method)
+
+
+def _build_distance_matrix(graph, path, method=None):
+    method = method or choose_method(graph)
+    n = len(graph)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{secrets.token_hex(6)}.tmp'
+    try:
+        dist = np.lib.format.open_memmap(f'{tmp_path}.dist.npy', mode='w+', dtype=np.float64, shape=(n, n))
+        next_hop = np.lib.format.open_memmap(f'{tmp_path}.next.npy', mode='w+', dtype=np.int32, shape=(n, n))
+
+        if method == 'floyd-warshall':
+            dist[:], next_hop[:] = floyd_warshall(graph)
+        elif method == 'dijkstra':
+            for start in range(0, n, DIJKSTRA_BATCH):
+                columns = np.arange(start, min(start + DIJKSTRA_BATCH, n))
+                dist[:, columns], next_hop[:, columns] = dijkstra_columns(graph, columns)
+        else:
+            raise ValueError(f"Unknown distance matrix method: {method}")
+
+        dist.flush()
+        next_hop.flush()
+        del dist, next_hop
+        with open(f'{tmp_path}.json', 'w') as f:
+            json.dump({
+                'format_version': MATRIX_FORMAT_VERSION,
+                'fingerprint': graph.fingerprint(),
+                'method': method,
+            }, f)
+        os.replace(f'{tmp_path}.dist.npy', f'{path}.dist.npy')
+        os.replace(f'{tmp_path}.next.npy', f'{path}.next.npy')
+        os.replace(f'{tmp_path}.json', f'{path}.json')
+    finally:
+        for suffix in ('.dist.npy', '.next.npy', '.json'):
+            try:
+                os.remove(tmp_path + suffix)
+            except FileNotFoundError:
+                pass
+    return DistanceMatrix.load(path)
+
+
+def open_distance_matrix(graph, path, method=None):
+    """Loads the matrices of ``graph`` saved at ``path``, building them first when
+    they are missing or stale.
+
+    When several processes miss the same matrix, one builds it while the
+    others wait for the lock and then load what it wrote.
+    """
+    matrix = load_distance_matrix(path, graph)
+    if matrix is not None:
+        return matrix
+    with bundle_lock(path):
+        matrix = load_distance_matrix(path, graph)
+        if matrix is None:
+            matrix = _build_distance_matrix(graph, path, method)
+    return matrix
+
+
+def load_distance_matrix(path, graph):
+    """Loads the matrices saved at ``path`` if they were built from ``graph``.
+
+    Returns None when the files are missing, have another format version or
+    were built from a different version of the graph.
+    """
+    try:
+        matrix = DistanceMatrix.load(path)
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+    if matrix.fingerprint != graph.fingerprint():
+        return None
+    return matrix
+
+
+def distances_between(graph, sources, targets):
+    """Returns the distances from ``sources`` to ``targets`` without a matrix.
+
+    Runs one Dijkstra per distinct source, or when there are fewer distinct
+    targets one per target on the reversed graph as ``dijkstra_columns``
+    does, for graphs whose all-pairs matrix is not kept.
+    """
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    unique_sources, source_inverse = np.unique(sources, return_inverse=True)
+    unique_targets, target_inverse = np.unique(targets, return_inverse=True)
+    if len(unique_targets) < len(unique_sources):
+        columns = _shortest_paths(graph.reverse(), unique_targets)
+        return columns.T[np.ix_(sources, target_inverse)]
+    rows = _shortest_paths(graph, unique_sources)
+    return rows[np.ix_(source_inverse, targets)]
@@ -0,0 +1,174 @@
+import json
+from itertools import chain
+
+import numpy as np
+
+from csr_graph import CSRGraph
+
+# Node coordinates are rounded to this many decimals so that line ends
+# meeting at the same point become the same node.
+COORDINATE_PRECISION = 3
+
+
+def read_lines(path):
+    """Reads the LineStrings of a GeoJSON file into flat arrays.
+
+    Returns ``(coords, line_offsets, fids)`` where ``coords`` is an (M, 2)
+    array of every vertex, line ``i`` spans
+    ``coords[line_offsets[i]:line_offsets[i + 1]]`` and ``fids`` holds the
+    ``fid`` property of the feature each line came from.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    return lines_from_features(data['features'])
+
+
+def lines_from_features(features):
+    """Collects the LineString parts of GeoJSON features into flat arrays."""
+    parts = []
+    fids = []
+    for feature in features:
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') == 'LineString':
+            lines = [geometry['coordinates']]
+        elif geometry.get('type') == 'MultiLineString':
+            lines = geometry['coordinates']
+        else:
+            continue
+        fid = (feature.get('properties') or {}).get('fid')
+        for line in lines:
+            parts.append(line)
+            fids.append(fid)
+
+    lengths = np.fromiter((len(line) for line in parts), dtype=np.int64, count=len(parts))
+    line_offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=line_offsets[1:])
+    flat = np.fromiter(chain.from_iterable(chain.from_iterable(parts)), dtype=np.float64)
+    if len(flat) == 2 * line_offsets[-1]:
+        coords = flat.reshape(-1, 2)
+    else:
+        # Some vertices carry a Z value, keep only X and Y
+        coords = np.array([xy[:2] for line in parts for xy in line], dtype=np.float64).reshape(-1, 2)
+    return coords, line_offsets, fids
+
+
+def unique_rows(points):
+    """Returns the lexicographically sorted unique rows of an (M, 2) array
+    and the index of each input row in them.
+
+    Equivalent to ``np.unique(points, axis=0, return_inverse=True)`` but
+    sorts the two columns directly instead of comparing rows as bytes.
+    """
+    order = np.lexsort((points[:, 1], points[:, 0]))
+    ordered = points[order]
+    is_new = np.ones(len(ordered), dtype=bool)
+    is_new[1:] = (ordered[1:] != ordered[:-1]).any(axis=1)
+    inverse = np.empty(len(points), dtype=np.int64)
+    inverse[order] = np.cumsum(is_new) - 1
+    return ordered[is_new], inverse
+
+
+def build_edges(coords, line_offsets, precision=COORDINATE_PRECISION, endpoints_only=False, return_lines=False):
+    """Turns line vertices into deduplicated nodes and bidirectional edges.
+
+    Every pair of consecutive vertices becomes an edge weighted by the
+    distance between its rounded end points. With ``endpoints_only`` each
+    line becomes a single edge between its first and last vertex weighted
+    by the line's full length. ``precision=None`` keeps exact coordinates.
+
+    Returns ``(nodes, sources, targets, weights)`` with ``nodes`` sorted
+    lexicographically and edges sorted by (source, target). With
+    ``return_lines`` the index of the line each edge came from is
+    returned as a fifth array.
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    line_offsets = np.asarray(line_offsets, dtype=np.int64)
+
+    if precision is None:
+        nodes, inverse = unique_rows(coords)
+    else:
+        scale = 10.0 ** precision
+        keys, inverse = unique_rows(np.rint(coords * scale).astype(np.int64))
+        nodes = keys / scale
+
+    # Segment i joins vertex i and i + 1 unless vertex i ends a line
+    segment_mask = np.ones(max(len(coords) - 1, 0), dtype=bool)
+    line_ends = line_offsets[1:-1] - 1
+    segment_mask[line_ends[(line_ends >= 0) & (line_ends < len(segment_mask))]] = False
+
+    if endpoints_only:
+        vertex_xy = coords if precision is None else nodes[inverse]
+        segment_lengths = np.hypot(*np.diff(vertex_xy, axis=0).T) * segment_mask
+        starts = line_offsets[:-1]
+        stops = line_offsets[1:]
+        valid = stops - starts >= 2
+        starts, stops = starts[valid], stops[valid]
+        cumulative = np.concatenate(([0.0], np.cumsum(segment_lengths)))
+        u = inverse[starts]
+        v = inverse[stops - 1]
+        lengths = cumulative[stops - 1] - cumulative[starts]
+        lines = np.flatnonzero(valid)
+    else:
+        first = np.flatnonzero(segment_mask)
+        u = inverse[first]
+        v = inverse[first + 1]
+        lengths = np.hypot(*(nodes[v] - nodes[u]).T)
+        lines = np.searchsorted(line_offsets, first, side='right') - 1
+
+    sources = np.concatenate((u, v))
+    targets = np.concatenate((v, u))
+    weights = np.concatenate((lengths, lengths))
+    lines = np.concatenate((lines, lines))
+
+    keep = sources != targets
+    sources, targets, weights, lines = sources[keep], targets[keep], weights[keep], lines[keep]
+    # Duplicate segments keep their last occurrence, like networkx does
+    keys = sources.astype(np.int64) * len(nodes) + targets
+    order = np.lexsort((-np.arange(len(keys)), keys))
+    first_of_key = np.ones(len(order), dtype=bool)
+    first_of_key[1:] = keys[order][1:] != keys[order][:-1]
+    order = order[first_of_key]
+    if return_lines:
+        return nodes, sources[order], targets[order], weights[order], lines[order]
+    return nodes, sources[order], targets[order], weights[order]
+
+
+def build_csr_graph(coords, line_offsets, **kwargs):
+    """Builds a CSRGraph from line vertices, see ``build_edges``."""
+    nodes, sources, targets, weights = build_edges(coords, line_offsets, **kwargs)
+    return CSRGraph.from_edges(nodes, sources, targets, weights)
+
+
+def build_networkx_graph(coords, line_offsets, **kwargs):
+    """Builds a networkx DiGraph keyed by coordinate tuples, see ``build_edges``."""
+    import networkx as nx
+
+    nodes, sources, targets, weights = build_edges(coords, line_offsets, **kwargs)
+    node_tuples = [tuple(xy) for xy in nodes.tolist()]
+    G = nx.DiGraph()
+    G.add_weighted_edges_from(
+        (node_tuples[u], node_tuples[v], w)
+        for u, v, w in zip(sources.tolist(), targets.tolist(), weights.tolist())
+    )
+    return G
+
+
+def line_endpoints(coords, line_offsets):
+    """Returns the first and last vertex of every line as coordinate tuples."""
+    line_offsets = np.asarray(line_offsets)
+    valid = np.diff(line_offsets) > 0
+    starts = coords[line_offsets[:-1][valid]]
+    ends = coords[line_offsets[1:][valid] - 1]
+    return [tuple(xy) for xy in starts.tolist()], [tuple(xy) for xy in ends.tolist()]
+
+
+def load_graph(path, **kwargs):
+    """Reads a GeoJSON road network into a CSRGraph."""
+    coords, line_offsets, _ = read_lines(path)
+    return build_csr_graph(coords, line_offsets, **kwargs)
+
+
+def load_networkx_graph(path, **kwargs):
+    """Reads a GeoJSON road network into a networkx DiGraph."""
+    coords, line_offsets, _ = read_lines(path)
+    return build_networkx_graph(coords, line_offsets, **kwargs)
@@ -0,0 +1,206 @@
+import glob
+import hashlib
+import json
+import os
+import secrets
+from contextlib import contextmanager
+
+import numpy as np
+
+from csr_graph import CSRGraph
+from graph_builder import build_edges, read_lines
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Bump when the arrays or manifest of a bundle change
+BUNDLE_FORMAT_VERSION = 2
+
+GRAPH_ARRAYS = ('coords', 'offsets', 'targets', 'weights')
+REVERSE_ARRAYS = ('reverse_offsets', 'reverse_targets', 'reverse_weights')
+
+
+def file_sha1(path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_signature(path):
+    """Returns the size, mtime and hash identifying a version of a GeoJSON file."""
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': file_sha1(path)}
+
+
+def is_current(signature, path):
+    """Tells whether ``path`` is still the file ``signature`` was taken from.
+
+    Only hashes the file when its size matches but its mtime does not,
+    as after a checkout or copy.
+    """
+    stat = os.stat(path)
+    if stat.st_size != signature['size']:
+        return False
+    if stat.st_mtime_ns == signature['mtime_ns']:
+        return True
+    return file_sha1(path) == signature['sha1']
+
+
+def array_path(path, generation, name):
+    return f'{path}.{generation}.{name}.npy'
+
+
+@contextmanager
+def bundle_lock(path):
+    """Holds an exclusive lock on the bundle at ``path`` across processes.
+
+    Serializes compiles, so that one never removes the arrays of another
+    still being written. Without ``fcntl`` only the manifest swap protects
+    readers.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f'{path}.lock', 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def compile_graph_bundle(source_path, path):
+    """Builds the graph of a GeoJSON file and saves it as a bundle at ``path``.
+
+    The bundle holds the CSR arrays of the graph and of its reverse, the
+    line each edge came from and the ``fid`` of each line, one ``.npy``
+    file per array, plus a ``<path>.json`` manifest. Arrays are written
+    under a new generation and the manifest is replaced last, so readers
+    see either the old or the new bundle. Returns the graph.
+    """
+    with bundle_lock(path):
+        return _compile_graph_bundle(source_path, path)
+
+
+def _compile_graph_bundle(source_path, path):
+    signature = source_signature(source_path)
+    coords, line_offsets, fids = read_lines(source_path)
+    nodes, sources, targets, weights, lines = build_edges(coords, line_offsets, return_lines=True)
+    graph = CSRGraph.from_edges(nodes, sources, targets, weights)
+    # from_edges keeps the edges of each source in order, so do the lines
+    edge_lines = lines[np.argsort(sources, kind='stable')].astype(np.int32)
+    line_fids = np.array(['' if fid is None else str(fid) for fid in fids], dtype=np.str_)
+    reverse = graph.reverse()
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    generation = secrets.token_hex(6)
+    arrays = {
+        'coords': graph.coords, 'offsets': graph.offsets, 'targets': graph.targets, 'weights': graph.weights,
+        'reverse_offsets': reverse.offsets, 'reverse_targets': reverse.targets, 'reverse_weights': reverse.weights,
+        'edge_lines': edge_lines, 'line_fids': line_fids,
+    }
+    for name, array in arrays.items():
+        np.save(array_path(path, generation, name), array)
+    with open(f'{path}.tmp.json', 'w') as f:
+        json.dump({
+            'format_version': BUNDLE_FORMAT_VERSION,
+            'generation': generation,
+            'fingerprint': graph.fingerprint(),
+            'nodes': len(graph),
+            'edges': graph.number_of_edges(),
+            'source': signature,
+        }, f)
+    os.replace(f'{path}.tmp.json', f'{path}.json')
+
+    remove_stale_generations(path, generation)
+    return graph
+
+
+def remove_stale_generations(path, generation):
+    """Removes the array files of every generation but ``generation``.
+
+    Workers that still map an old generation keep reading it: an unlinked
+    file lives on until its last mapping is closed, so the kernel does the
+    reference counting and a crashed worker cannot leak it. Where open
+    files cannot be removed the files are left for the next compile.
+    """
+    prefix = os.path.basename(path) + '.'
+    for stale in glob.glob(glob.escape(path) + '.*.npy'):
+        # <graph id>.<generation>.<array>.npy, other graph ids may contain dots too
+        parts = os.path.basename(stale)[len(prefix):].split('.')
+        if len(parts) == 3 and parts[0] != generation:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+def read_manifest(path):
+    """Returns the manifest of the bundle at ``path``, or None if there is no readable one."""
+    try:
+        with open(f'{path}.json') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if manifest.get('format_version') != BUNDLE_FORMAT_VERSION:
+        return None
+    return manifest
+
+
+def load_graph_bundle(path, source_path, attempts=3):
+    """Memory-maps the graph bundle at ``path`` if it was compiled from the current ``source_path``.
+
+    Arrays are mapped read-only, so processes loading the same bundle share
+    its pages. Returns None when the bundle is missing or corrupted, has
+    another format version or was compiled from a different version of the
+    GeoJSON file.
+    """
+    for _ in range(attempts):
+        manifest = read_manifest(path)
+        if manifest is None or not is_current(manifest['source'], source_path):
+            return None
+        generation = manifest['generation']
+        try:
+            arrays = {name: np.load(array_path(path, generation, name), mmap_mode='r')
+                      for name in GRAPH_ARRAYS + REVERSE_ARRAYS}
+        except FileNotFoundError:
+            # Replaced by a newer compile since the manifest was read, read the new one
+            continue
+        except ValueError:
+            # A truncated or overwritten array file, so the bundle must be compiled again
+            return None
+        reverse = CSRGraph(arrays['coords'], *(arrays[name] for name in REVERSE_ARRAYS))
+        return CSRGraph(*(arrays[name] for name in GRAPH_ARRAYS), fingerprint=manifest['fingerprint'], reverse=reverse)
+    return None
+
+
+def open_graph_bundle(path, source_path):
+    """Memory-maps the bundle of ``source_path``, compiling it first when it is missing or stale.
+
+    When several processes miss the same bundle, one compiles it while the
+    others wait for the lock and then map what it wrote.
+    """
+    graph = load_graph_bundle(path, source_path)
+    if graph is not None:
+        return graph
+    with bundle_lock(path):
+        graph = load_graph_bundle(path, source_path)
+        if graph is None:
+            _compile_graph_bundle(source_path, path)
+            graph = load_graph_bundle(path, source_path)
+    return graph
+
+
+def load_feature_ids(path):
+    """Returns the ``fid`` of the line each edge of a bundled graph came from, aligned with its edges."""
+    manifest = read_manifest(path)
+    if manifest is None:
+        raise FileNotFoundError(f'{path}.json')
+    edge_lines = np.load(array_path(path, manifest['generation'], 'edge_lines'), mmap_mode='r')
+    line_fids = np.load(array_path(path, manifest['generation'], 'line_fids'), mmap_mode='r')
+    return line_fids[edge_lines]
@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Rough per-object costs of a networkx DiGraph keyed by coordinate tuples,
+# used when a graph does not report its own size.
+NX_BYTES_PER_NODE = 600
+NX_BYTES_PER_EDGE = 350
+
+
+def file_stamp(path):
+    """Returns the (mtime_ns, size) pair used to detect changes to a graph file."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def estimate_graph_bytes(graph):
+    """Estimates the memory held by a graph object."""
+    nbytes = getattr(graph, 'nbytes', None)
+    if nbytes is not None:
+        return nbytes
+    return graph.number_of_nodes() * NX_BYTES_PER_NODE + graph.number_of_edges() * NX_BYTES_PER_EDGE
+
+
+class GraphEntry:
+    def __init__(self, graph_id, graph, stamp, nbytes, build_time):
+        self.graph_id = graph_id
+        self.graph = graph
+        self.stamp = stamp
+        self.nbytes = nbytes
+        self.build_time = build_time
+        # Indexes computed from the graph by kind, counted in nbytes and
+        # evicted along with it, and the locks that serialize building them
+        self.indexes = {}
+        self.index_locks = {}
+
+
+class GraphRegistry:
+    """Process-wide cache of built graphs keyed by graph id.
+
+    Each graph is built once from its GeoJSON file and reused until the
+    file's mtime or size changes. Entries are evicted in least recently used
+    order once the summed size of the cached graphs, along with the indexes
+    kept by ``get_index``, exceeds ``max_bytes``.
+    """
+
+    def __init__(self, graph_dir, loader, max_bytes=512 * 1024 * 1024):
+        self.graph_dir = graph_dir
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.evictions = 0
+        self.build_time = 0.0
+
+    def path_for(self, graph_id):
+        """Returns the GeoJSON path of a graph id."""
+        return os.path.join(self.graph_dir, f'{graph_id}.geojson')
+
+    def get(self, graph_id):
+        """Returns the graph for ``graph_id``, building it if needed.
+
+        Raises FileNotFoundError when the graph file does not exist.
+        """
+        return self.get_entry(graph_id).graph
+
+    def get_entry(self, graph_id):
+        """Returns the cache entry for ``graph_id``, building it if needed."""
+        path = self.path_for(graph_id)
+        stamp = file_stamp(path)
+
+        with self._lock:
+            entry = self._entries.get(graph_id)
+            if entry is not None and entry.stamp == stamp:
+                self._entries.move_to_end(graph_id)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            build_lock = self._build_locks.setdefault(graph_id, threading.Lock())
+
+        # Build outside the registry lock so other graphs stay available;
+        # the per-graph lock stops concurrent requests building the same file.
+        with build_lock:
+            with self._lock:
+                entry = self._entries.get(graph_id)
+                if entry is not None and entry.stamp == stamp:
+                    self._entries.move_to_end(graph_id)
+                    return entry
+
+            start_time = time.perf_counter()
+            graph = self.loader(path)
+            build_time = time.perf_counter() - start_time
+            entry = GraphEntry(graph_id, graph, stamp, estimate_graph_bytes(graph), build_time)
+
+            with self._lock:
+                self.builds += 1
+                self.build_time += build_time
+                self._entries[graph_id] = entry
+                self._entries.move_to_end(graph_id)
+                self._evict()
+        return entry
+
+    def get_index(self, graph_id, graph, kind, compute):
+        """Returns the ``kind`` index of a cached graph, computed once by ``compute()``.
+
+        The index is kept on the graph's entry. Looking up an index already
+        computed takes no lock, and computing one only holds a lock for that
+        kind and graph, so builds never hold up requests for other indexes
+        or graphs. A None from ``compute`` is returned without being kept.
+        When ``graph`` is no longer the cached graph of ``graph_id``, as
+        after an eviction or a change of its file, the index is computed
+        without being kept.
+        """
+        with self._lock:
+            entry = self._entries.get(graph_id)
+        if entry is None or entry.graph is not graph:
+            return compute()
+        index = entry.indexes.get(kind)
+        if index is not None:
+            return index
+
+        with self._lock:
+            index_lock = entry.index_locks.setdefault(kind, threading.Lock())
+        with index_lock:
+            index = entry.indexes.get(kind)
+            if index is not None:
+                return index
+            index = compute()
+            if index is not None:
+                with self._lock:
+                    entry.indexes[kind] = index
+                    entry.nbytes += getattr(index, 'nbytes', 0)
+                    self._evict()
+        return index
+
+    def invalidate(self, graph_id=None):
+        """Drops one cached graph, or all of them when no id is given."""
+        with self._lock:
+            if graph_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(graph_id, None)
+
+    def _evict(self):
+        # The most recently used graph is always kept, even when it alone
+        # exceeds the budget.
+        total = sum(entry.nbytes for entry in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            total -= entry.nbytes
+            self.evictions += 1
+
+    def stats(self):
+        """Returns cache counters and the currently cached graphs."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0,
+                'builds': self.builds,
+                'evictions': self.evictions,
+                'build_time': round(self.build_time, 4),
+                'max_bytes': self.max_bytes,
+                'cached_bytes': sum(entry.nbytes for entry in self._entries.values()),
+                'graphs': [
+                    {
+                        'graph': entry.graph_id,
+                        'bytes': entry.nbytes,
+                        'build_time': round(entry.build_time, 4),
+                        'indexes': sorted(entry.indexes),
+                    }
+                    for entry in self._entries.values()
+                ],
+            }
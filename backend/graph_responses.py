@@ -0,0 +1,169 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+
+from graph_builder import read_lines
+from graph_registry import file_stamp
+from metrics import phase
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Decimals kept in slim responses, the precision the frontend rounds to
+SLIM_PRECISION = 3
+
+# Bodies are compressed once per file version, so spend the CPU on size
+GZIP_LEVEL = 9
+# Quality 11 takes minutes on large networks for a few percent
+BROTLI_QUALITY = 9
+
+
+def encode_json(data):
+    return json.dumps(data, separators=(',', ':')).encode()
+
+
+def slim_geojson(path, precision=SLIM_PRECISION):
+    """Returns the LineStrings of a GeoJSON file as a FeatureCollection of
+    bare geometries, coordinates rounded to ``precision`` decimals.
+
+    Properties and Z values are dropped and MultiLineStrings are split into
+    one feature per part, which is all the frontend draws.
+    """
+    coords, line_offsets, _ = read_lines(path)
+    vertices = np.round(coords, precision).tolist()
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {'type': 'Feature', 'properties': None,
+             'geometry': {'type': 'LineString', 'coordinates': vertices[start:end]}}
+            for start, end in zip(line_offsets[:-1].tolist(), line_offsets[1:].tolist())
+        ],
+    }
+
+
+def full_geojson(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+class EncodedResponse:
+    """A JSON body with its precompressed encodings and validators."""
+
+    def __init__(self, body, last_modified):
+        self.bodies = {'identity': body, 'gzip': gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)}
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.last_modified = last_modified
+        self.nbytes = sum(len(encoded) for encoded in self.bodies.values())
+
+    def etag_for(self, encoding):
+        """Returns the ETag of one encoding, distinct per encoding as each is a different byte sequence."""
+        return self.etag if encoding == 'identity' else f'{self.etag}-{encoding}'
+
+
+def stamp_time(stamp):
+    """Returns the mtime of a ``file_stamp`` as an aware datetime, to the second as HTTP dates are."""
+    return datetime.fromtimestamp(stamp[0] // 1_000_000_000, timezone.utc)
+
+
+class GraphResponseCache:
+    """Serialized /api/graph responses keyed by graph id and slim flag.
+
+    Each response is built and compressed once per version of its GeoJSON
+    file, detected by mtime and size like the GraphRegistry, and kept in
+    least recently used order while the summed size of its encodings stays
+    under ``max_bytes``; larger responses are rebuilt on every request.
+    The graph list is cached until the mtime of the directory changes.
+    """
+
+    def __init__(self, graph_dir, max_bytes=128 * 1024 * 1024):
+        self.graph_dir = graph_dir
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self._listing = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path_for(self, graph_id):
+        return os.path.join(self.graph_dir, f'{graph_id}.geojson')
+
+    def graph_list(self):
+        """Returns the response listing the graph ids."""
+        stat = os.stat(self.graph_dir)
+        stamp = (stat.st_mtime_ns, 0)
+        listing = self._listing
+        if listing is not None and listing[0] == stamp:
+            return listing[1]
+        graph_ids = sorted(os.path.splitext(filename)[0] for filename in os.listdir(self.graph_dir)
+                           if filename.endswith('.geojson'))
+        response = EncodedResponse(encode_json(graph_ids), stamp_time(stamp))
+        self._listing = (stamp, response)
+        return response
+
+    def get(self, graph_id, slim=False):
+        """Returns the response for a graph, building it if its file changed.
+
+        Raises FileNotFoundError when the graph file does not exist.
+        """
+        path = self.path_for(graph_id)
+        stamp = file_stamp(path)
+        key = (graph_id, slim)
+
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] == stamp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        with build_lock:
+            # Another request may have built it while this one waited
+            with self._lock:
+                cached = self._entries.get(key)
+                if cached is not None and cached[0] == stamp:
+                    return cached[1]
+            with phase('load'):
+                data = slim_geojson(path) if slim else full_geojson(path)
+            with phase('serialize'):
+                response = EncodedResponse(encode_json(data), stamp_time(stamp))
+            self._store(key, stamp, response)
+            return response
+
+    def _store(self, key, stamp, response):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1].nbytes
+            if response.nbytes > self.max_bytes:
+                return
+            self._entries[key] = (stamp, response)
+            self._bytes += response.nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'cached': len(self._entries),
+                'cached_bytes': self._bytes,
+            }
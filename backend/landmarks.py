@@ -0,0 +1,133 @@
+import json
+import os
+
+import numpy as np
+
+# Bump when the layout of the landmark distance table changes
+ALT_FORMAT_VERSION = 1
+
+DEFAULT_LANDMARK_COUNT = 8
+
+# Stands in for infinite distances so that bounds never become NaN: two
+# unreachable distances cancel to 0 and one gives a huge (valid) bound.
+UNREACHABLE = np.finfo(np.float64).max / 4
+
+
+def landmark_distances(graph, landmarks):
+    """Returns the (N, 2, K) table of distances from and to each landmark.
+
+    ``table[v, 0, k]`` is the distance from landmark ``k`` to node ``v`` and
+    ``table[v, 1, k]`` the distance from ``v`` back to the landmark.
+    Unreachable pairs hold ``UNREACHABLE``.
+    """
+    from scipy.sparse.csgraph import dijkstra
+
+    matrix = graph.to_scipy()
+    forward = dijkstra(matrix, directed=True, indices=landmarks)
+    backward = dijkstra(matrix.T.tocsr(), directed=True, indices=landmarks)
+    table = np.ascontiguousarray(np.stack((forward.T, backward.T), axis=1))
+    table[np.isinf(table)] = UNREACHABLE
+    return table
+
+
+def select_farthest_landmarks(graph, count, seed=0):
+    """Picks landmarks by farthest-point selection.
+
+    Starts from the node farthest from a seeded random node, then keeps
+    adding the node whose distance to the nearest chosen landmark is the
+    largest. Nodes that cannot be reached count as not covered yet.
+    """
+    from scipy.sparse.csgraph import dijkstra
+
+    matrix = graph.to_scipy()
+    rng = np.random.default_rng(seed)
+    start = int(rng.integers(len(graph)))
+    distances = dijkstra(matrix, directed=False, indices=start)
+    distances[np.isinf(distances)] = -1
+    landmarks = [int(np.argmax(distances))]
+    nearest = np.full(len(graph), np.inf)
+
+    while len(landmarks) < min(count, len(graph)):
+        distances = dijkstra(matrix, directed=False, indices=landmarks[-1])
+        nearest = np.minimum(nearest, distances)
+        candidates = np.where(np.isinf(nearest), np.finfo(np.float64).max, nearest)
+        candidates[landmarks] = -1
+        landmarks.append(int(np.argmax(candidates)))
+    return landmarks
+
+
+class LandmarkHeuristic:
+    """ALT heuristic: lower bounds from the triangle inequality over landmarks.
+
+    For a target ``t`` the distance from ``v`` is at least
+    ``d(L, t) - d(L, v)`` and ``d(v, L) - d(t, L)`` for every landmark ``L``.
+    The table can be a read-only memory map shared between processes.
+    """
+
+    def __init__(self, table, landmarks, fingerprint):
+        self.table = table
+        self.landmarks = landmarks
+        self.fingerprint = fingerprint
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+
+    def bind(self, graph, target):
+        """Returns the heuristic towards node id ``target`` as a function of node ids."""
+        rows = self.table.reshape(len(self.table), -1)
+        count = self.table.shape[2]
+        # Bound k is offset[k] + sign[k] * rows[v, k]: d(L, t) - d(L, v) for
+        # the first K columns and d(v, L) - d(t, L) for the last K.
+        offset = np.concatenate((self.table[target, 0], -self.table[target, 1]))
+        sign = np.concatenate((np.full(count, -1.0), np.ones(count)))
+
+        def potential(node):
+            bound = float((offset + sign * rows[node]).max())
+            return bound if bound > 0 else 0.0
+
+        return potential
+
+    def save(self, path):
+        """Writes the table as ``<path>.npy`` and its metadata as ``<path>.json``."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.save(f'{path}.tmp.npy', self.table)
+        os.replace(f'{path}.tmp.npy', f'{path}.npy')
+        with open(f'{path}.tmp.json', 'w') as f:
+            json.dump({
+                'format_version': ALT_FORMAT_VERSION,
+                'fingerprint': self.fingerprint,
+                'landmarks': self.landmarks,
+            }, f)
+        os.replace(f'{path}.tmp.json', f'{path}.json')
+
+    @classmethod
+    def load(cls, path):
+        """Memory-maps a saved table, raising ValueError for other format versions."""
+        with open(f'{path}.json') as f:
+            meta = json.load(f)
+        if meta['format_version'] != ALT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported landmark format version {meta['format_version']}")
+        table = np.load(f'{path}.npy', mmap_mode='r')
+        return cls(table, meta['landmarks'], meta['fingerprint'])
+
+
+def build_landmark_heuristic(graph, count=DEFAULT_LANDMARK_COUNT, seed=0):
+    """Selects landmarks for a CSRGraph and precomputes their distance table."""
+    landmarks = select_farthest_landmarks(graph, count, seed)
+    return LandmarkHeuristic(landmark_distances(graph, landmarks), landmarks, graph.fingerprint())
+
+
+def load_landmark_heuristic(path, graph):
+    """Loads the landmarks saved at ``path`` if they were built from ``graph``.
+
+    Returns None when the files are missing, have another format version or
+    were built from a different version of the graph.
+    """
+    try:
+        heuristic = LandmarkHeuristic.load(path)
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+    if heuristic.fingerprint != graph.fingerprint():
+        return None
+    return heuristic
@@ -0,0 +1,168 @@
+import contextvars
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Histogram, ProcessCollector, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Metrics of this app only, so importing it twice cannot register a metric twice
+REGISTRY = CollectorRegistry()
+ProcessCollector(registry=REGISTRY)
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Half decades from 1 to 10 million settled nodes
+SETTLED_BUCKETS = tuple(round(10 ** (i / 2)) for i in range(15))
+
+SEARCH_SECONDS = Histogram(
+    'falcon_search_seconds', 'Time taken by fresh shortest path searches',
+    ['algorithm', 'graph'], buckets=LATENCY_BUCKETS, registry=REGISTRY
+)
+SEARCH_SETTLED = Histogram(
+    'falcon_search_settled_nodes', 'Nodes settled by fresh shortest path searches',
+    ['algorithm', 'graph'], buckets=SETTLED_BUCKETS, registry=REGISTRY
+)
+PHASE_SECONDS = Histogram(
+    'falcon_request_phase_seconds', 'Time spent in each phase of a request',
+    ['endpoint', 'phase'], buckets=LATENCY_BUCKETS, registry=REGISTRY
+)
+
+
+class PhaseTimer:
+    """Accumulated durations of the named phases of one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def server_timing(self):
+        """Returns the phases and the total so far as a Server-Timing header value, in milliseconds."""
+        entries = [f'{name};dur={seconds * 1000:.3f}' for name, seconds in self.phases.items()]
+        entries.append(f'total;dur={(time.perf_counter() - self.start) * 1000:.3f}')
+        return ', '.join(entries)
+
+
+_current_timer = contextvars.ContextVar('phase_timer', default=None)
+
+
+def start_request():
+    """Starts the phase timer of the current request and returns the token ``end_request`` takes."""
+    return _current_timer.set(PhaseTimer())
+
+
+def current_timer():
+    return _current_timer.get()
+
+
+def end_request(token):
+    _current_timer.reset(token)
+
+
+class _Phase:
+    # A plain context manager, @contextmanager costs a generator per block
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.timer is not None:
+            phases = self.timer.phases
+            phases[self.name] = phases.get(self.name, 0.0) + time.perf_counter() - self.start
+
+
+def phase(name):
+    """Times a block as phase ``name`` of the current request, if there is one."""
+    return _Phase(_current_timer.get(), name)
+
+
+def observe_phases(endpoint, timer):
+    # Labelled by view function, without the blueprint name
+    if endpoint:
+        endpoint = endpoint.rpartition('.')[2]
+    for name, seconds in timer.phases.items():
+        PHASE_SECONDS.labels(endpoint, name).observe(seconds)
+
+
+def observe_search(algorithm, graph, seconds, settled):
+    SEARCH_SECONDS.labels(algorithm, graph).observe(seconds)
+    SEARCH_SETTLED.labels(algorithm, graph).observe(settled)
+
+
+class CacheCollector:
+    """Exposes the counters the graph registry, route cache, result writer,
+    graph response cache and search executor already keep, read when
+    scraped so requests do not pay for them."""
+
+    def __init__(self, graph_registry, route_cache, result_writer, graph_responses, search_executor):
+        self.graph_registry = graph_registry
+        self.route_cache = route_cache
+        self.result_writer = result_writer
+        self.graph_responses = graph_responses
+        self.search_executor = search_executor
+
+    def collect(self):
+        graphs = self.graph_registry.stats()
+        lookups = CounterMetricFamily('falcon_graph_cache_lookups', 'Graph cache lookups', labels=['result'])
+        lookups.add_metric(['hit'], graphs['hits'])
+        lookups.add_metric(['miss'], graphs['misses'])
+        yield lookups
+        yield CounterMetricFamily('falcon_graph_builds', 'Graphs built from GeoJSON', value=graphs['builds'])
+        yield CounterMetricFamily('falcon_graph_build_seconds', 'Time spent building graphs', value=graphs['build_time'])
+        yield CounterMetricFamily('falcon_graph_cache_evictions', 'Graphs evicted from the cache', value=graphs['evictions'])
+        yield GaugeMetricFamily('falcon_graph_cache_bytes', 'Memory held by cached graphs', value=graphs['cached_bytes'])
+
+        routes = self.route_cache.stats()
+        lookups = CounterMetricFamily('falcon_route_cache_lookups', 'Route cache lookups', labels=['result'])
+        lookups.add_metric(['memory_hit'], routes['memory_hits'])
+        lookups.add_metric(['disk_hit'], routes['disk_hits'])
+        lookups.add_metric(['miss'], routes['misses'])
+        yield lookups
+        yield CounterMetricFamily('falcon_route_cache_evictions', 'Routes evicted from memory', value=routes['evictions'])
+        yield GaugeMetricFamily('falcon_route_cache_bytes', 'Memory held by cached routes', value=routes['cached_bytes'])
+
+        writer = self.result_writer.stats()
+        rows = CounterMetricFamily('falcon_result_rows', 'Shortest path results handled by the writer', labels=['state'])
+        rows.add_metric(['written'], writer['written'])
+        rows.add_metric(['dropped'], writer['dropped'])
+        yield rows
+        yield CounterMetricFamily('falcon_result_write_seconds', 'Time spent inserting result batches', value=writer['write_time'])
+        yield GaugeMetricFamily('falcon_result_queue_rows', 'Results waiting to be written', value=writer['queued'])
+
+        responses = self.graph_responses.stats()
+        lookups = CounterMetricFamily('falcon_graph_response_cache_lookups', 'Graph response cache lookups', labels=['result'])
+        lookups.add_metric(['hit'], responses['hits'])
+        lookups.add_metric(['miss'], responses['misses'])
+        yield lookups
+        yield CounterMetricFamily('falcon_graph_response_cache_evictions', 'Graph responses evicted from the cache', value=responses['evictions'])
+        yield GaugeMetricFamily('falcon_graph_response_cache_bytes', 'Memory held by cached graph responses', value=responses['cached_bytes'])
+
+        executor = self.search_executor.stats()
+        jobs = CounterMetricFamily('falcon_search_jobs', 'Searches handed to the search executor', labels=['result'])
+        for result in ('completed', 'failed', 'rejected', 'timed_out', 'cancelled'):
+            jobs.add_metric([result], executor[result])
+        yield jobs
+        yield GaugeMetricFamily('falcon_search_jobs_running', 'Searches running in executor processes', value=executor['running'])
+        yield GaugeMetricFamily('falcon_search_jobs_queued', 'Searches waiting for an executor process', value=executor['queued'])
+
+
+_cache_collector = None
+
+
+def register_cache_collector(graph_registry, route_cache, result_writer, graph_responses, search_executor):
+    """Exposes the caches of the latest app created, replacing those of an earlier one."""
+    global _cache_collector
+    if _cache_collector is not None:
+        REGISTRY.unregister(_cache_collector)
+    _cache_collector = CacheCollector(graph_registry, route_cache, result_writer, graph_responses, search_executor)
+    REGISTRY.register(_cache_collector)
+
+
+def latest():
+    """Returns the Prometheus text exposition of every metric and its content type."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
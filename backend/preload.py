@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+
+
+def preload_graph_ids(setting, graph_dir):
+    """Returns the graph ids named by a GRAPH_PRELOAD setting.
+
+    The setting lists graph ids separated by commas; ``*`` stands for every
+    GeoJSON file in ``graph_dir``.
+    """
+    graph_ids = []
+    for graph_id in (part.strip() for part in setting.split(',')):
+        if graph_id == '*':
+            graph_ids.extend(sorted(
+                os.path.splitext(filename)[0] for filename in os.listdir(graph_dir) if filename.endswith('.geojson')
+            ))
+        elif graph_id:
+            graph_ids.append(graph_id)
+    return list(dict.fromkeys(graph_ids))
+
+
+class GraphPreloader:
+    """Warms graphs in a background thread so that early requests find them cached.
+
+    ``warm(graph_id)`` is called for each graph in turn. A graph that fails
+    to load is reported and skipped; preloading is finished once every
+    graph was tried.
+    """
+
+    def __init__(self, graph_ids, warm):
+        self.graph_ids = list(graph_ids)
+        self.warm = warm
+        self.loaded = {}
+        self.failed = {}
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if not self.graph_ids:
+            self._done.set()
+            return
+        self._thread = threading.Thread(target=self._run, name='graph-preload', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        for graph_id in self.graph_ids:
+            start_time = time.perf_counter()
+            try:
+                self.warm(graph_id)
+            except Exception as e:
+                print(f"Preloading {graph_id} failed: {e}")
+                self.failed[graph_id] = str(e)
+            else:
+                self.loaded[graph_id] = round(time.perf_counter() - start_time, 3)
+                print(f"Preloaded {graph_id} in {self.loaded[graph_id]:.2f}s")
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """Blocks until preloading is finished, or ``timeout`` passes; returns whether it finished."""
+        return self._done.wait(timeout)
+
+    def status(self):
+        """Returns whether preloading is finished, the seconds each graph took
+        and the graphs still pending or failed."""
+        loaded = dict(self.loaded)
+        failed = dict(self.failed)
+        return {
+            'ready': self._done.is_set(),
+            'loaded': loaded,
+            'failed': failed,
+            'pending': [graph_id for graph_id in self.graph_ids if graph_id not in loaded and graph_id not in failed],
+        }
@@ -0,0 +1,121 @@
+import atexit
+import queue
+import threading
+import time
+
+from database_manager import DatabaseManager
+
+
+class ResultWriter:
+    """Writes shortest path results to the database from a background thread.
+
+    Requests only queue a row; the writer thread inserts queued rows in one
+    bulk insert once ``max_batch`` rows are waiting or the oldest has
+    waited ``max_delay`` seconds. A full queue blocks producers. The thread
+    starts on the first submitted row and queued rows are written when the
+    process exits.
+    """
+
+    def __init__(self, app, db, max_batch=500, max_delay=1.0, max_queue=100000):
+        self.app = app
+        self.db = db
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._batch_written = threading.Condition()
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.write_time = 0.0
+
+    def submit(self, **result):
+        """Queues one result, taking the arguments of ``add_shortest_path_result``."""
+        self._start()
+        self._queue.put(DatabaseManager.shortest_path_row(**result))
+        self.submitted += 1
+
+    def flush(self, timeout=None):
+        """Blocks until every row submitted so far has been written."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def stop(self, timeout=None):
+        """Writes the queued rows and stops the writer thread."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def wait_for_batch(self, batches, timeout=None):
+        """Blocks until more than ``batches`` batches were written, or ``timeout`` passes."""
+        with self._batch_written:
+            return self._batch_written.wait_for(lambda: self.batches > batches, timeout)
+
+    def stats(self):
+        return {
+            'submitted': self.submitted,
+            'written': self.written,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'write_time': round(self.write_time, 4),
+            'queued': self._queue.qsize(),
+        }
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name='result-writer', daemon=True)
+                thread.start()
+                atexit.register(self.stop)
+                self._thread = thread
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = 'timeout'
+
+            if isinstance(item, dict):
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.max_delay
+                if len(batch) < self.max_batch:
+                    continue
+
+            self._write(batch)
+            batch = []
+            deadline = None
+            if item is None:
+                return
+            if isinstance(item, threading.Event):
+                item.set()
+
+    def _write(self, batch):
+        if not batch:
+            return
+        start_time = time.perf_counter()
+        with self.app.app_context():
+            try:
+                DatabaseManager(self.db).add_shortest_path_results(batch)
+                self.written += len(batch)
+                self.batches += 1
+                self.write_time += time.perf_counter() - start_time
+            except Exception as e:
+                # Losing history rows must not take the writer down with them
+                self.db.session.rollback()
+                self.dropped += len(batch)
+                print(f"Dropped {len(batch)} shortest path results: {e}")
+        with self._batch_written:
+            self._batch_written.notify_all()
@@ -0,0 +1,144 @@
+import os
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from utils import StepTrace
+
+
+def route_key(fingerprint, algorithm, source, target, trace):
+    """Returns the cache key of a route on one version of a graph.
+
+    The key holds everything the response depends on: the graph, the
+    algorithm, both endpoints and the trace mode deciding which steps come
+    back.
+    """
+    return f'{fingerprint}|{algorithm}|{source[0]!r},{source[1]!r}|{target[0]!r},{target[1]!r}|{trace}'
+
+
+def encode_result(result):
+    """Pickles a ``run_algorithm`` result, keeping the attributes of its StepTrace."""
+    name, steps, path, total_weight, time_taken = result
+    return pickle.dumps((
+        name, steps.mode, list(steps), steps.settled, steps.forward_settled, steps.backward_settled,
+        path, total_weight, time_taken,
+    ), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def decode_result(blob):
+    """Rebuilds a ``run_algorithm`` result pickled by ``encode_result``."""
+    name, mode, records, settled, forward_settled, backward_settled, path, total_weight, time_taken = pickle.loads(blob)
+    steps = StepTrace(mode, records)
+    steps.settled = settled
+    steps.forward_settled = forward_settled
+    steps.backward_settled = backward_settled
+    return name, steps, path, total_weight, time_taken
+
+
+class RouteCache:
+    """Memoizes route results keyed by ``route_key``.
+
+    Results are held pickled in an in-process LRU whose summed size stays
+    under ``max_bytes``; results larger than the budget are not kept in
+    memory. With a ``db_path`` every result is also written to a SQLite
+    file that outlives the process and is shared between workers, and
+    results found there are promoted to memory. Keys embed the graph
+    fingerprint, so results for an edited graph are never served.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, db_path=None):
+        self.max_bytes = max_bytes
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS route_cache (key TEXT PRIMARY KEY, value BLOB NOT NULL)')
+            self._db.commit()
+
+    def get(self, key):
+        """Returns the cached result for ``key``, or None."""
+        with self._lock:
+            blob = self._entries.get(key)
+            if blob is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return decode_result(blob)
+
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute('SELECT value FROM route_cache WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                blob = bytes(row[0])
+                with self._lock:
+                    self.disk_hits += 1
+                    self._store(key, blob)
+                return decode_result(blob)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, result):
+        """Caches a ``run_algorithm`` result under ``key``."""
+        blob = encode_result(result)
+        with self._lock:
+            self._store(key, blob)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute('INSERT OR REPLACE INTO route_cache (key, value) VALUES (?, ?)', (key, blob))
+                self._db.commit()
+
+    def _store(self, key, blob):
+        if len(blob) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous)
+        self._entries[key] = blob
+        self._bytes += len(blob)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def clear(self):
+        """Drops every cached result, on disk as well."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute('DELETE FROM route_cache')
+                self._db.commit()
+
+    def stats(self):
+        """Returns hit counters and the size of both tiers."""
+        disk_entries = None
+        if self._db is not None:
+            with self._db_lock:
+                disk_entries = self._db.execute('SELECT COUNT(*) FROM route_cache').fetchone()[0]
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_ratio': round(hits / lookups, 4) if lookups else 0,
+                'memory_hit_ratio': round(self.memory_hits / lookups, 4) if lookups else 0,
+                'evictions': self.evictions,
+                'max_bytes': self.max_bytes,
+                'cached_bytes': self._bytes,
+                'memory_entries': len(self._entries),
+                'disk_entries': disk_entries,
+            }
@@ -0,0 +1,146 @@
+import multiprocessing
+import threading
+import time
+
+
+class Overloaded(Exception):
+    """Raised when every process is busy and the queue of waiting jobs is full."""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a job did not finish before its deadline."""
+
+
+class Cancelled(Exception):
+    """Raised when a job was given up because its caller went away."""
+
+
+def parse_deadlines(text):
+    """Parses ``"Algorithm=seconds,..."`` into a dict of per-algorithm deadlines."""
+    deadlines = {}
+    for item in text.split(','):
+        name, _, seconds = item.rpartition('=')
+        if name.strip():
+            deadlines[name.strip()] = float(seconds)
+    return deadlines
+
+
+def _run_job(conn, fn, args):
+    try:
+        message = ('ok', fn(*args))
+    except Exception as e:
+        message = ('error', e)
+    conn.send(message)
+    conn.close()
+
+
+class SearchExecutor:
+    """Runs expensive searches in forked processes so they cannot stall the server.
+
+    Each job gets its own forked process, which inherits the cached graphs
+    instead of receiving a copy, and at most ``processes`` run at once.
+    Up to ``max_queue`` more jobs wait for a process; beyond that ``run``
+    raises Overloaded straight away. A job still running at its deadline,
+    or whose caller reports it is no longer wanted, is terminated. Where
+    fork is not available jobs run in the calling thread, without
+    deadlines or cancellation.
+    """
+
+    def __init__(self, processes=1, max_queue=16, poll_interval=0.05):
+        self.processes = processes
+        self.max_queue = max_queue
+        self.poll_interval = poll_interval
+        self._slots = threading.BoundedSemaphore(processes)
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._running = 0
+        self._forking = 'fork' in multiprocessing.get_all_start_methods()
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.cancelled = 0
+
+    def run(self, fn, args=(), deadline=None, cancelled=None):
+        """Returns ``fn(*args)`` computed in a forked process.
+
+        ``fn`` and its result are not pickled on the way in, but the result
+        is sent back through a pipe, so it must pickle. Exceptions raised by
+        ``fn`` are raised again here. Raises Overloaded when the job cannot
+        be queued, DeadlineExceeded once ``deadline`` seconds have passed,
+        waiting included, and Cancelled as soon as ``cancelled()`` is true.
+        """
+        with self._lock:
+            if self._admitted >= self.processes + self.max_queue:
+                self.rejected += 1
+                raise Overloaded()
+            self._admitted += 1
+        try:
+            end = None if deadline is None else time.monotonic() + deadline
+            while not self._slots.acquire(timeout=self.poll_interval):
+                self._check(end, cancelled)
+            try:
+                with self._lock:
+                    self._running += 1
+                if not self._forking:
+                    result = fn(*args)
+                else:
+                    result = self._run_forked(fn, args, end, cancelled)
+                with self._lock:
+                    self.completed += 1
+                return result
+            finally:
+                with self._lock:
+                    self._running -= 1
+                self._slots.release()
+        finally:
+            with self._lock:
+                self._admitted -= 1
+
+    def _check(self, end, cancelled):
+        if end is not None and time.monotonic() >= end:
+            with self._lock:
+                self.timed_out += 1
+            raise DeadlineExceeded()
+        if cancelled is not None and cancelled():
+            with self._lock:
+                self.cancelled += 1
+            raise Cancelled()
+
+    def _run_forked(self, fn, args, end, cancelled):
+        context = multiprocessing.get_context('fork')
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_run_job, args=(sender, fn, args), daemon=True)
+        process.start()
+        sender.close()
+        try:
+            while True:
+                if receiver.poll(self.poll_interval):
+                    try:
+                        status, value = receiver.recv()
+                    except EOFError:
+                        status, value = 'error', RuntimeError(f"Search process exited with code {process.exitcode}")
+                    if status == 'error':
+                        with self._lock:
+                            self.failed += 1
+                        raise value
+                    return value
+                self._check(end, cancelled)
+        finally:
+            receiver.close()
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'processes': self.processes,
+                'running': self._running,
+                'queued': self._admitted - self._running,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'cancelled': self.cancelled,
+            }
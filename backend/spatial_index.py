@@ -0,0 +1,81 @@
+import math
+
+import numpy as np
+
+
+class SpatialIndex:
+    """Nearest node and nearest edge lookups over the coordinates of a CSRGraph.
+
+    Nodes are indexed by a KD-tree built up front. Edges are indexed by an
+    STRtree over one segment per connected node pair, built on first use
+    since it is much larger.
+    """
+
+    def __init__(self, graph):
+        from scipy.spatial import cKDTree
+
+        self.graph = graph
+        self.node_tree = cKDTree(graph.coords)
+        self._segments = None
+        self._segment_tree = None
+
+    def nearest_nodes(self, points, max_distance=math.inf):
+        """Returns the id of the nearest node to each point and its distance.
+
+        Points farther than ``max_distance`` from every node get id -1 and
+        an infinite distance.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        distances, ids = self.node_tree.query(points)
+        too_far = distances > max_distance
+        ids = np.where(too_far, -1, ids)
+        distances = np.where(too_far, np.inf, distances)
+        return ids, distances
+
+    def _edge_index(self):
+        if self._segment_tree is None:
+            import shapely
+
+            sources = self.graph.edge_sources()
+            targets = self.graph.targets
+            # One segment per node pair, whichever direction its edges run
+            pairs = np.unique(np.stack((np.minimum(sources, targets), np.maximum(sources, targets)), axis=1), axis=0)
+            self._segments = pairs
+            self._segment_tree = shapely.STRtree(shapely.linestrings(self.graph.coords[pairs]))
+        return self._segments, self._segment_tree
+
+    def nearest_edges(self, points, max_distance=math.inf):
+        """Returns the nearest point on the nearest edge to each point.
+
+        Returns ``(u, v, snapped, distances)``: the node ids at either end of
+        the segment, the projected points and their distances. Points
+        farther than ``max_distance`` from every edge get ids -1, NaN
+        positions and an infinite distance.
+        """
+        import shapely
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        segments, tree = self._edge_index()
+        u = np.full(len(points), -1)
+        v = np.full(len(points), -1)
+        snapped = np.full((len(points), 2), np.nan)
+        distances = np.full(len(points), np.inf)
+        if len(points) == 0 or len(segments) == 0:
+            return u, v, snapped, distances
+
+        query_max = None if math.isinf(max_distance) else max_distance
+        (point_index, segment_index), _ = tree.query_nearest(
+            shapely.points(points), max_distance=query_max, return_distance=True, all_matches=False
+        )
+        a = self.graph.coords[segments[segment_index, 0]]
+        b = self.graph.coords[segments[segment_index, 1]]
+        ab = b - a
+        length2 = (ab * ab).sum(axis=1)
+        t = np.divide(((points[point_index] - a) * ab).sum(axis=1), length2, out=np.zeros(len(a)), where=length2 > 0)
+        projected = a + np.clip(t, 0.0, 1.0)[:, None] * ab
+
+        u[point_index] = segments[segment_index, 0]
+        v[point_index] = segments[segment_index, 1]
+        snapped[point_index] = projected
+        distances[point_index] = np.hypot(*(projected - points[point_index]).T)
+        return u, v, snapped, distances
@@ -0,0 +1,217 @@
+import json
+import math
+
+import numpy as np
+
+# Columns summarized by count, sum, min and max
+SUMMARY_COLUMNS = ('Steps', 'Time', 'TotalWeight', 'PathLength')
+# Columns only set by some algorithms, averaged over the rows that have them
+PARTIAL_COLUMNS = ('ForwardSteps', 'BackwardSteps')
+# Columns whose percentiles are reported
+SKETCH_COLUMNS = ('Steps', 'Time')
+
+PERCENTILES = (50, 95, 99)
+
+# Relative error of the reported percentiles
+SKETCH_ALPHA = 0.01
+# Values at or below this fall in the zero bucket
+SKETCH_MIN_VALUE = 1e-9
+
+
+def path_node_count(path):
+    """Returns the number of nodes of a path encoded by ``encode_path``."""
+    # A path of n nodes [[x,y],...] holds 2n - 1 commas
+    commas = path.count(',')
+    return 0 if commas == 0 else (commas + 1) // 2
+
+
+class QuantileSketch:
+    """Streaming quantiles of non-negative values, after DDSketch.
+
+    Values are counted in logarithmic buckets, bucket ``k`` holding the
+    values in ``(gamma^(k-1), gamma^k]``, so any quantile is returned within
+    a relative error of ``alpha`` whatever the number of values. Sketches
+    with the same ``alpha`` merge by adding their bucket counts.
+    """
+
+    def __init__(self, alpha=SKETCH_ALPHA, buckets=None, zero_count=0):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.buckets = dict(buckets or {})
+        self.zero_count = zero_count
+
+    @property
+    def count(self):
+        return self.zero_count + sum(self.buckets.values())
+
+    def add_many(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        positive = values[values > SKETCH_MIN_VALUE]
+        self.zero_count += len(values) - len(positive)
+        keys, counts = np.unique(np.ceil(np.log(positive) / math.log(self.gamma)).astype(np.int64), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def merge(self, other):
+        if other.alpha != self.alpha:
+            raise ValueError("Cannot merge sketches with different accuracies")
+        self.zero_count += other.zero_count
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def quantile(self, q):
+        """Returns the ``q`` quantile (0 <= q <= 1), or None when empty."""
+        count = self.count
+        if count == 0:
+            return None
+        rank = q * (count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                # The midpoint of the bucket, in relative terms
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_json(self):
+        return json.dumps({'alpha': self.alpha, 'zero': self.zero_count, 'buckets': sorted(self.buckets.items())}, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, text):
+        if not text:
+            return cls()
+        data = json.loads(text)
+        return cls(data['alpha'], {key: count for key, count in data['buckets']}, data['zero'])
+
+
+def _round(value, digits):
+    # No digits rounds to an int
+    return None if value is None else round(value, digits or None)
+
+
+def _clamp(value, low, high):
+    # The exact extremes beat the bucket midpoints near them
+    return None if value is None else min(max(value, low), high)
+
+
+class ResultSummary:
+    """Count, sum, min, max and percentile sketches of shortest path results.
+
+    Summaries are what the algorithm_statistics rollup stores per
+    algorithm and graph: they are updated with each inserted batch of
+    results and merged to report an algorithm over every graph.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.sums = {column: 0.0 for column in SUMMARY_COLUMNS}
+        self.mins = {column: None for column in SUMMARY_COLUMNS}
+        self.maxes = {column: None for column in SUMMARY_COLUMNS}
+        self.partial_sums = {column: 0.0 for column in PARTIAL_COLUMNS}
+        self.partial_counts = {column: 0 for column in PARTIAL_COLUMNS}
+        self.sketches = {column: QuantileSketch() for column in SKETCH_COLUMNS}
+
+    def add(self, columns):
+        """Adds results given as a dict of column name to sequence of values."""
+        count = len(columns['Time'])
+        if count == 0:
+            return
+        self.count += count
+        for column in SUMMARY_COLUMNS:
+            values = np.asarray(columns[column], dtype=np.float64)
+            self._extend(column, float(values.sum()), float(values.min()), float(values.max()))
+        for column in PARTIAL_COLUMNS:
+            values = [value for value in columns[column] if value is not None]
+            self.partial_sums[column] += float(sum(values))
+            self.partial_counts[column] += len(values)
+        for column in SKETCH_COLUMNS:
+            self.sketches[column].add_many(columns[column])
+
+    def add_rows(self, rows):
+        """Adds result rows built by ``DatabaseManager.shortest_path_row``."""
+        columns = {column: [] for column in SUMMARY_COLUMNS + PARTIAL_COLUMNS}
+        for row in rows:
+            columns['Steps'].append(row['Steps'])
+            columns['Time'].append(row['Time'])
+            columns['TotalWeight'].append(row['TotalWeight'])
+            columns['PathLength'].append(path_node_count(row['Path']))
+            columns['ForwardSteps'].append(row['ForwardSteps'])
+            columns['BackwardSteps'].append(row['BackwardSteps'])
+        self.add(columns)
+
+    def merge(self, other):
+        self.count += other.count
+        for column in SUMMARY_COLUMNS:
+            self._extend(column, other.sums[column], other.mins[column], other.maxes[column])
+        for column in PARTIAL_COLUMNS:
+            self.partial_sums[column] += other.partial_sums[column]
+            self.partial_counts[column] += other.partial_counts[column]
+        for column in SKETCH_COLUMNS:
+            self.sketches[column].merge(other.sketches[column])
+
+    def _extend(self, column, total, low, high):
+        self.sums[column] += total
+        if low is not None:
+            self.mins[column] = low if self.mins[column] is None else min(self.mins[column], low)
+        if high is not None:
+            self.maxes[column] = high if self.maxes[column] is None else max(self.maxes[column], high)
+
+    @classmethod
+    def from_record(cls, record):
+        """Reads the summary stored in an AlgorithmStatistics row."""
+        summary = cls()
+        summary.count = record.Count
+        for column in SUMMARY_COLUMNS:
+            summary.sums[column] = getattr(record, f'{column}Sum')
+            summary.mins[column] = getattr(record, f'{column}Min')
+            summary.maxes[column] = getattr(record, f'{column}Max')
+        for column in PARTIAL_COLUMNS:
+            summary.partial_sums[column] = getattr(record, f'{column}Sum')
+            summary.partial_counts[column] = getattr(record, f'{column}Count')
+        for column in SKETCH_COLUMNS:
+            summary.sketches[column] = QuantileSketch.from_json(getattr(record, f'{column}Sketch'))
+        return summary
+
+    def to_record(self, record):
+        """Stores the summary in an AlgorithmStatistics row."""
+        record.Count = self.count
+        for column in SUMMARY_COLUMNS:
+            setattr(record, f'{column}Sum', self.sums[column])
+            setattr(record, f'{column}Min', self.mins[column])
+            setattr(record, f'{column}Max', self.maxes[column])
+        for column in PARTIAL_COLUMNS:
+            setattr(record, f'{column}Sum', self.partial_sums[column])
+            setattr(record, f'{column}Count', self.partial_counts[column])
+        for column in SKETCH_COLUMNS:
+            setattr(record, f'{column}Sketch', self.sketches[column].to_json())
+
+    def average(self, column):
+        if column in PARTIAL_COLUMNS:
+            count = self.partial_counts[column]
+            return self.partial_sums[column] / count if count else None
+        return self.sums[column] / self.count if self.count else 0
+
+    def as_dict(self):
+        """Returns the figures reported by /api/statistics; times are in seconds."""
+        statistics = {
+            "total_records": self.count,
+            "average_steps": round(self.average('Steps'), 2),
+            "average_path_length": round(self.average('PathLength'), 2),
+            "average_time": round(self.average('Time'), 4),
+            "average_weight": round(self.average('TotalWeight'), 3),
+            "average_forward_steps": _round(self.average('ForwardSteps'), 2),
+            "average_backward_steps": _round(self.average('BackwardSteps'), 2),
+            "min_steps": _round(self.mins['Steps'], 0),
+            "max_steps": _round(self.maxes['Steps'], 0),
+            "min_time": _round(self.mins['Time'], 6),
+            "max_time": _round(self.maxes['Time'], 6),
+            "min_weight": _round(self.mins['TotalWeight'], 3),
+            "max_weight": _round(self.maxes['TotalWeight'], 3),
+        }
+        for percentile in PERCENTILES:
+            for column, key, digits in (('Steps', 'steps', 0), ('Time', 'time', 6)):
+                value = _clamp(self.sketches[column].quantile(percentile / 100), self.mins[column], self.maxes[column])
+                statistics[f"p{percentile}_{key}"] = _round(value, digits)
+        return statistics
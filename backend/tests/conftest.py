@@ -0,0 +1,103 @@
+import math
+import os
+import sys
+
+import networkx as nx
+import numpy as np
+import pytest
+
+# The backend modules import each other by name, as when run from backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from csr_graph import CSRGraph
+
+
+def random_road_graph(n_nodes, seed=0, one_way=0.15, neighbors=4):
+    """Returns a CSRGraph of random points joined to their nearest neighbours.
+
+    Edge weights are at least the straight-line distance, so the Euclidean
+    heuristic stays admissible, and a ``one_way`` fraction of the segments
+    only runs in one direction.
+    """
+    from scipy.spatial import cKDTree
+
+    rng = np.random.default_rng(seed)
+    points = np.round(rng.uniform(0.0, 1000.0, (n_nodes, 2)), 3)
+    points = np.unique(points, axis=0)
+    _, nearest = cKDTree(points).query(points, k=neighbors + 1)
+    pairs = np.sort(np.stack((np.repeat(np.arange(len(points)), neighbors), nearest[:, 1:].ravel()), axis=1), axis=1)
+    pairs = np.unique(pairs, axis=0)
+    # One-way segments run either way
+    flip = rng.random(len(pairs)) < 0.5
+    pairs[flip] = pairs[flip, ::-1]
+    sources, targets = pairs.T
+    lengths = np.hypot(*(points[sources] - points[targets]).T)
+    weights = lengths * rng.uniform(1.0, 1.5, len(lengths))
+    both = rng.random(len(sources)) >= one_way
+    return CSRGraph.from_edges(
+        points,
+        np.concatenate((sources, targets[both])),
+        np.concatenate((targets, sources[both])),
+        np.concatenate((weights, weights[both]))
+    )
+
+
+def networkx_distance(nx_graph, source, target):
+    """Returns the shortest path distance networkx finds, inf when unreachable."""
+    try:
+        return nx.dijkstra_path_length(nx_graph, source, target)
+    except nx.NetworkXNoPath:
+        return math.inf
+
+
+def path_weight(nx_graph, path):
+    """Returns the weight of a coordinate path, failing on a missing edge."""
+    return sum(nx_graph[u][v]['weight'] for u, v in zip(path, path[1:]))
+
+
+def assert_matches_networkx(nx_graph, pairs, search):
+    """Checks the route ``search(source, target)`` finds for every pair against networkx.
+
+    ``search`` returns the path as coordinates, empty when the target is
+    unreachable, and its total weight or None when it reports none.
+    """
+    for source, target in pairs:
+        path, weight = search(source, target)
+        expected = networkx_distance(nx_graph, source, target)
+        if expected == math.inf:
+            assert path == []
+            continue
+        assert path[0] == source and path[-1] == target
+        assert path_weight(nx_graph, path) == pytest.approx(expected)
+        if weight is not None:
+            assert weight == pytest.approx(expected)
+
+
+def random_node_pairs(graph, count, seed=0):
+    """Returns ``count`` random (source, target) coordinate pairs of a graph."""
+    rng = np.random.default_rng(seed)
+    ids = rng.integers(0, len(graph), (count, 2))
+    return [(graph.node(s), graph.node(t)) for s, t in ids.tolist()]
+
+
+@pytest.fixture(scope='module')
+def road_graph():
+    return random_road_graph(300, seed=1)
+
+
+@pytest.fixture(scope='module')
+def road_networkx(road_graph):
+    return road_graph.to_networkx()
+
+
+@pytest.fixture
+def client(tmp_path):
+    """Returns a test client of an app with its database in a temporary directory."""
+    from app import create_app
+
+    app = create_app({
+        'TESTING': True,
+        'GRAPH_BUNDLE_COMPILE': False,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'performance.db'}",
+    })
+    return app.test_client()
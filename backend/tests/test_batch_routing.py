@@ -0,0 +1,71 @@
+import math
+
+import pytest
+
+import app as server
+from batch_routing import iter_batch_routes
+from conftest import assert_matches_networkx, random_node_pairs
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_matches_networkx(road_graph, road_networkx, processes):
+    # Enough distinct sources to be spread over forked workers
+    pairs = random_node_pairs(road_graph, 60)
+    id_pairs = [(road_graph.index_of(s), road_graph.index_of(t)) for s, t in pairs]
+    routes = {index: (weight, path) for group in iter_batch_routes(road_graph, id_pairs, processes) for index, weight, path in group}
+    assert sorted(routes) == list(range(len(pairs)))
+    # Unreachable targets have an infinite weight and no path
+    assert all((weight == math.inf) == (path == []) for weight, path in routes.values())
+    by_pair = {pair: routes[index] for index, pair in enumerate(pairs)}
+    assert_matches_networkx(road_networkx, pairs, lambda source, target: (
+        road_graph.nodes_of(by_pair[source, target][1]), by_pair[source, target][0]
+    ))
+
+
+def graph_nodes(ids):
+    G = server.graph_registry.get('graph_test1')
+    return [list(node) for node in G.nodes_of(ids)]
+
+
+def test_endpoint_routes_every_pair(client):
+    a, b, c = graph_nodes([0, 5, 17])
+    response = client.post('/api/shortest-path-batch/graph_test1', json={'pairs': [[a, b], [a, c], [c, a]], 'paths': False})
+    assert response.status_code == 200
+    assert [result['index'] for result in response.json['results']] == [0, 1, 2]
+    assert response.json['sources'] == 2
+
+
+@pytest.mark.parametrize('pairs, index', [
+    ([['s']], 0),
+    ([[[0, 0]]], 0),
+    ([[[0, 0], [1, 1]], [[0, 0], [1, 1], [2, 2]]], 1),
+    ([[[0, 0], [1]]], 0),
+    ([[[0, 0], [1, 'a']]], 0),
+    ([[[0, 0], [True, 1]]], 0),
+    (['ab'], 0),
+])
+def test_endpoint_names_malformed_pairs(client, pairs, index):
+    response = client.post('/api/shortest-path-batch/graph_test1', json={'pairs': pairs})
+    assert response.status_code == 400
+    assert response.json['error'] == f'Pair {index} is not [[x, y], [x, y]]'
+
+
+@pytest.mark.parametrize('body', [{}, [], {'pairs': {}}, {'pairs': 'ab'}])
+def test_endpoint_rejects_bodies_without_pairs(client, body):
+    response = client.post('/api/shortest-path-batch/graph_test1', json=body)
+    assert response.status_code == 400
+
+
+def test_endpoint_rejects_too_many_pairs_and_unknown_nodes(client):
+    a, b = graph_nodes([0, 5])
+    client.application.config['BATCH_ROUTING_MAX_PAIRS'] = 1
+    response = client.post('/api/shortest-path-batch/graph_test1', json={'pairs': [[a, b], [b, a]]})
+    assert response.status_code == 400
+    assert response.json['max_pairs'] == 1
+
+    far = [-1e9, -1e9]
+    response = client.post('/api/shortest-path-batch/graph_test1', json={'pairs': [[a, far]]})
+    assert response.status_code == 400
+    assert response.json['nodes'] == [far]
+    response = client.post('/api/shortest-path-batch/no_such_graph', json={'pairs': [[a, b]]})
+    assert response.status_code == 404
@@ -0,0 +1,99 @@
+import math
+
+import networkx as nx
+import numpy as np
+import pytest
+
+from conftest import path_weight, random_node_pairs, random_road_graph
+from csr_graph import CSRGraph
+from utils import bellman_ford_relaxations, bellman_ford_with_steps
+
+METHODS = ['rounds', 'spfa', 'numpy']
+
+
+def reweighted(graph, seed=0):
+    """Returns ``graph`` with weights shifted by a random node potential.
+
+    Every cycle keeps its weight, so there is no negative cycle, while
+    many single edges become negative.
+    """
+    potential = np.random.default_rng(seed).uniform(0.0, 200.0, len(graph))
+    weights = graph.weights + potential[graph.edge_sources()] - potential[graph.targets]
+    return CSRGraph(graph.coords, graph.offsets, graph.targets, weights)
+
+
+def with_negative_cycle(graph, reachable):
+    """Returns ``graph`` plus a two-node cycle of weight -2.
+
+    The cycle is entered from node 0 when ``reachable``, otherwise it is a
+    separate component.
+    """
+    # Right of every coordinate of the graph, so the node order is kept
+    cycle = np.array([[2000.0, 0.0], [2001.0, 0.0]])
+    n = len(graph)
+    sources = [n, n + 1] + ([0] if reachable else [])
+    targets = [n + 1, n] + ([n] if reachable else [])
+    return CSRGraph.from_edges(
+        np.concatenate((graph.coords, cycle)),
+        np.concatenate((graph.edge_sources(), sources)),
+        np.concatenate((graph.targets, targets)),
+        np.concatenate((graph.weights, [-1.0, -1.0] + ([1.0] if reachable else [])))
+    )
+
+
+def distances(graph, source, method):
+    distance = [math.inf] * len(graph)
+    distance[source] = 0
+    predecessor = [-1] * len(graph)
+    for _ in bellman_ford_relaxations(graph, source, distance, predecessor, method):
+        pass
+    return distance
+
+
+@pytest.fixture(scope='module')
+def negative_graph():
+    graph = reweighted(random_road_graph(120, seed=6))
+    assert (graph.weights < 0).any()
+    return graph
+
+
+@pytest.fixture(scope='module')
+def negative_networkx(negative_graph):
+    return negative_graph.to_networkx()
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_distances_match_networkx(negative_graph, negative_networkx, method):
+    for source in (0, 41, 97):
+        expected = nx.single_source_bellman_ford_path_length(negative_networkx, negative_graph.node(source))
+        distance = distances(negative_graph, source, method)
+        for node, length in enumerate(distance):
+            assert length == pytest.approx(expected.get(negative_graph.node(node), math.inf))
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_paths_match_networkx(negative_graph, negative_networkx, method):
+    for source, target in random_node_pairs(negative_graph, 20, seed=2):
+        _, path, length, _ = bellman_ford_with_steps(negative_graph, source, target, trace='none', method=method)
+        if not nx.has_path(negative_networkx, source, target):
+            assert path == [] and length == math.inf
+            continue
+        expected = nx.bellman_ford_path_length(negative_networkx, source, target)
+        assert length == pytest.approx(expected)
+        assert path[0] == source and path[-1] == target
+        assert path_weight(negative_networkx, path) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_detects_reachable_negative_cycle(negative_graph, method):
+    graph = with_negative_cycle(negative_graph, reachable=True)
+    assert nx.negative_edge_cycle(graph.to_networkx())
+    with pytest.raises(ValueError, match='negative weight cycle'):
+        distances(graph, 0, method)
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_ignores_unreachable_negative_cycle(negative_graph, method):
+    graph = with_negative_cycle(negative_graph, reachable=False)
+    assert nx.negative_edge_cycle(graph.to_networkx())
+    assert distances(graph, 0, method)[:len(negative_graph)] == pytest.approx(distances(negative_graph, 0, method))
@@ -0,0 +1,23 @@
+import pytest
+
+from conftest import assert_matches_networkx, random_node_pairs
+from utils import bidirectional_astar_with_steps, bidirectional_dijkstra_with_steps
+
+
+@pytest.mark.parametrize('search', [bidirectional_dijkstra_with_steps, bidirectional_astar_with_steps])
+def test_matches_networkx(road_graph, road_networkx, search):
+    assert_matches_networkx(road_networkx, random_node_pairs(road_graph, 100),
+                            lambda source, target: (search(road_graph, source, target, trace='none')[1], None))
+
+
+@pytest.mark.parametrize('search', [bidirectional_dijkstra_with_steps, bidirectional_astar_with_steps])
+def test_counts_settled_nodes_per_direction(road_graph, search):
+    source, target = random_node_pairs(road_graph, 1, seed=3)[0]
+    steps, _, _ = search(road_graph, source, target, trace='visited')
+    assert steps.settled == len(steps) == steps.forward_settled + steps.backward_settled
+
+
+def test_source_is_target(road_graph):
+    node = road_graph.node(7)
+    _, path, _ = bidirectional_dijkstra_with_steps(road_graph, node, node)
+    assert path == [node]
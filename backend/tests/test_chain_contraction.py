@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+import app as server
+from chain_contraction import contract_chains
+from conftest import assert_matches_networkx, networkx_distance, path_weight
+from csr_graph import CSRGraph
+from graph_builder import build_csr_graph
+from landmarks import build_landmark_heuristic
+
+
+def polyline_graph(side=8, points=4, one_way=0.05, seed=0):
+    """Returns a grid of streets drawn as polylines with ``points`` vertices
+    between crossings, plus a ring, a loop and two parallel chains between
+    the same crossings, with a ``one_way`` fraction of edges dropped."""
+    rng = np.random.default_rng(seed)
+    lines = []
+    steps = np.linspace(0.0, 1.0, points + 2)[:, None]
+    for i in range(side):
+        for j in range(side):
+            corner = np.array([i, j], dtype=float) * 100
+            for step in ((100, 0), (0, 100)):
+                if i * 100 + step[0] < side * 100 and j * 100 + step[1] < side * 100:
+                    line = corner + steps * step
+                    line[1:-1] += rng.uniform(-10, 10, (points, 2))
+                    lines.append(line)
+    angles = np.linspace(0, 2 * np.pi, 12)[:, None]
+    lines.append(np.hstack((np.cos(angles), np.sin(angles))) * 30 + [2000, 2000])
+    lines.append(np.array([[0, 0], [-40, -20], [-40, 20], [0, 0]], dtype=float))
+    lines.append(np.array([[0, 100], [-30, 130], [-30, 170], [0, 200]], dtype=float))
+    lines.append(np.array([[0, 100], [-60, 130], [-60, 170], [0, 200]], dtype=float))
+
+    coords = np.concatenate(lines)
+    line_offsets = np.concatenate(([0], np.cumsum([len(line) for line in lines])))
+    graph = build_csr_graph(coords, line_offsets)
+    keep = rng.random(graph.number_of_edges()) >= one_way
+    return CSRGraph.from_edges(graph.coords, graph.edge_sources()[keep], graph.targets[keep], graph.weights[keep])
+
+
+@pytest.fixture(scope='module')
+def graph():
+    return polyline_graph()
+
+
+@pytest.fixture(scope='module')
+def nx_graph(graph):
+    return graph.to_networkx()
+
+
+@pytest.fixture(scope='module')
+def contraction(graph):
+    return contract_chains(graph)
+
+
+@pytest.fixture(scope='module')
+def pairs(graph, contraction):
+    # Endpoints inside chains, at junctions and twice inside the same chain
+    rng = np.random.default_rng(1)
+    interior = np.flatnonzero(contraction.chain_of >= 0)
+    junctions = np.flatnonzero(contraction.chain_of < 0)
+    ids = [(int(a), int(b)) for a, b in rng.choice(interior, (30, 2))]
+    ids += [(int(a), int(b)) for a, b in zip(rng.choice(interior, 15), rng.choice(junctions, 15))]
+    ids += [(int(b), int(a)) for a, b in zip(rng.choice(interior, 15), rng.choice(junctions, 15))]
+    for chain in rng.choice(len(contraction.chain_offsets) - 1, 10):
+        nodes = contraction.chain_nodes[contraction.chain_offsets[chain] + 1:contraction.chain_offsets[chain + 1] - 1]
+        if len(nodes) >= 2:
+            ids += [(int(nodes[0]), int(nodes[-1])), (int(nodes[-1]), int(nodes[0]))]
+    return [(graph.node(a), graph.node(b)) for a, b in ids]
+
+
+def test_core_keeps_junctions_only(graph, contraction):
+    assert 0 < contraction.junctions < len(graph)
+    core_nodes = np.flatnonzero(np.diff(contraction.core.offsets) > 0)
+    assert (contraction.chain_of[core_nodes] < 0).all()
+    assert contraction.nbytes > contraction.core.nbytes
+
+
+@pytest.mark.parametrize('algorithm', [name for name in server.CONTRACTED_ALGORITHMS if name != 'A* (Manhattan)'])
+def test_contracted_searches_match_networkx(graph, nx_graph, contraction, pairs, algorithm):
+    index = build_landmark_heuristic(graph) if algorithm == 'A* (ALT)' else None
+    assert_matches_networkx(nx_graph, pairs, lambda source, target: (
+        server.run_algorithm(graph, algorithm, source, target, 'none', index, contraction)[2:4]
+    ))
+
+
+def test_contracted_search_settles_fewer_nodes(graph, contraction):
+    source, target = graph.node(0), graph.node(len(graph) - 1)
+    full = server.run_algorithm(graph, 'Dijkstra', source, target, 'none')
+    contracted = server.run_algorithm(graph, 'Dijkstra', source, target, 'none', None, contraction)
+    assert contracted[3] == pytest.approx(full[3])
+    assert contracted[1].settled < full[1].settled
+
+
+@pytest.mark.parametrize('trace', ['visited', 'frontier', 'full'])
+def test_expanded_traces_cover_every_reached_node_once(graph, nx_graph, contraction, pairs, trace):
+    source, target = pairs[0][0], graph.node(len(graph) - 1)
+    steps = server.run_algorithm(graph, 'Dijkstra', source, target, trace, None, contraction)[1]
+    nodes = [record[0] for record in steps]
+    assert len(nodes) == len(set(nodes))
+    assert steps.settled <= len(nodes)
+    for record in steps:
+        assert record[1] == pytest.approx(networkx_distance(nx_graph, source, record[0]))
+        if trace == 'full':
+            path = record[2]
+            assert path[0] == source and path[-1] == record[0]
+            assert path_weight(nx_graph, path) == pytest.approx(record[1])
+        elif trace == 'frontier':
+            assert all(nx_graph.has_node(node) for node in record[2])
+
+
+def test_expanded_relaxations_are_edges(graph, nx_graph, contraction, pairs):
+    source, target = pairs[0][0], graph.node(len(graph) - 1)
+    steps = server.run_algorithm(graph, 'BellmanFord', source, target, 'visited', None, contraction)[1]
+    assert steps
+    for u, v, cost in steps:
+        assert nx_graph.has_edge(u, v)
+        assert cost >= networkx_distance(nx_graph, source, v) - 1e-9
@@ -0,0 +1,44 @@
+import pytest
+
+import app as server
+from conftest import assert_matches_networkx, networkx_distance, path_weight, random_node_pairs, random_road_graph
+from contraction_hierarchy import build_contraction_hierarchy, load_contraction_hierarchy
+from utils import contraction_hierarchy_with_steps
+
+
+@pytest.fixture(scope='module')
+def hierarchy(road_graph):
+    return build_contraction_hierarchy(road_graph)
+
+
+def test_matches_networkx(road_graph, road_networkx, hierarchy):
+    # Shortcuts must be unpacked into edges of the original graph
+    assert_matches_networkx(road_networkx, random_node_pairs(road_graph, 100), lambda source, target: (
+        contraction_hierarchy_with_steps(road_graph, hierarchy, source, target, trace='none')[1], None
+    ))
+
+
+def test_query_distance_matches_unpacked_path(road_graph, road_networkx, hierarchy):
+    for source, target in random_node_pairs(road_graph, 20, seed=5):
+        distance, path = hierarchy.query(road_graph.index_of(source), road_graph.index_of(target))
+        assert distance == pytest.approx(networkx_distance(road_networkx, source, target))
+        if path:
+            assert path_weight(road_networkx, road_graph.nodes_of(path)) == pytest.approx(distance)
+
+
+def test_saved_hierarchy_only_loads_for_its_graph(road_graph, hierarchy, tmp_path):
+    path = str(tmp_path / 'graph.ch.npz')
+    hierarchy.save(path)
+    loaded = load_contraction_hierarchy(path, road_graph)
+    assert loaded is not None and loaded.nbytes == hierarchy.nbytes
+    assert load_contraction_hierarchy(path, random_road_graph(300, seed=2)) is None
+    assert load_contraction_hierarchy(str(tmp_path / 'missing.ch.npz'), road_graph) is None
+
+
+def test_missing_hierarchy_answers_503(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(server, 'ch_path', lambda graph_id: str(tmp_path / f'{graph_id}.ch.npz'))
+    G = server.graph_registry.get('graph_test1')
+    source, target = (f'{x},{y}' for x, y in G.nodes_of([0, len(G) - 1]))
+    response = client.get(f'/api/shortest-path/graph_test1/Contraction Hierarchies/{source}/{target}?cache=0')
+    assert response.status_code == 503
+    assert 'build_ch.py' in response.json['error']
@@ -0,0 +1,147 @@
+import sqlite3
+
+import pytest
+
+from app import create_app
+from database import db
+from database_manager import DatabaseManager
+
+# Tables as created before any of the migrated columns existed
+BASELINE_SCHEMA = '''
+CREATE TABLE node (
+    "NodeID" INTEGER NOT NULL PRIMARY KEY,
+    "Name" VARCHAR(255) NOT NULL,
+    "Coordinates" VARCHAR(255) NOT NULL
+);
+CREATE TABLE edge (
+    "EdgeID" INTEGER NOT NULL PRIMARY KEY,
+    "SourceNodeID" INTEGER NOT NULL REFERENCES node ("NodeID"),
+    "DestinationNodeID" INTEGER NOT NULL REFERENCES node ("NodeID"),
+    "Distance" FLOAT NOT NULL,
+    "Bidirectional" BOOLEAN NOT NULL
+);
+CREATE TABLE shortest_path_result (
+    "ResultID" INTEGER NOT NULL PRIMARY KEY,
+    "Algorithm" VARCHAR(255) NOT NULL,
+    "StartNodeID" INTEGER NOT NULL REFERENCES node ("NodeID"),
+    "EndNodeID" INTEGER NOT NULL REFERENCES node ("NodeID"),
+    "Path" TEXT NOT NULL,
+    "TotalWeight" FLOAT NOT NULL,
+    "Steps" INTEGER NOT NULL,
+    "Time" FLOAT NOT NULL
+);
+'''
+
+
+def baseline_database(path, nodes, edges, results):
+    with sqlite3.connect(path) as connection:
+        connection.executescript(BASELINE_SCHEMA)
+        connection.executemany('INSERT INTO node VALUES (?, ?, ?)', [(i, f'Node_{i}', text) for i, text in nodes])
+        connection.executemany('INSERT INTO edge ("SourceNodeID", "DestinationNodeID", "Distance", "Bidirectional") '
+                               'VALUES (?, ?, ?, 1)', edges)
+        connection.executemany('INSERT INTO shortest_path_result ("Algorithm", "StartNodeID", "EndNodeID", "Path", '
+                               '"TotalWeight", "Steps", "Time") VALUES (?, ?, ?, ?, ?, ?, ?)', results)
+
+
+def migrated_app(path):
+    return create_app({'TESTING': True, 'GRAPH_BUNDLE_COMPILE': False, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+
+
+@pytest.fixture
+def baseline_path(tmp_path):
+    path = tmp_path / 'performance.db'
+    baseline_database(
+        path,
+        nodes=[(1, '0.0,0.0'), (2, '3.0,4.0')],
+        edges=[(1, 2, 5.0)],
+        results=[('Dijkstra', 1, 2, '[[0.0,0.0],[3.0,4.0]]', 5.0, 2, 0.001),
+                 ('Dijkstra', 2, 1, '[[3.0,4.0],[0.0,0.0]]', 5.0, 4, 0.003)],
+    )
+    return path
+
+
+def test_baseline_results_are_rolled_up(baseline_path):
+    app = migrated_app(baseline_path)
+    with app.app_context():
+        statistics, = DatabaseManager(db).get_statistics()
+    assert statistics['algorithm'] == 'Dijkstra'
+    assert statistics['total_records'] == 2
+    assert statistics['average_steps'] == 3
+    assert statistics['average_path_length'] == 2
+    assert statistics['average_forward_steps'] is None
+
+
+def test_baseline_database_takes_new_results(baseline_path):
+    app = migrated_app(baseline_path)
+    with app.app_context():
+        db_manager = DatabaseManager(db)
+        db_manager.add_shortest_path_results([DatabaseManager.shortest_path_row(
+            'Bidirectional Dijkstra', 1, 2, [(0.0, 0.0), (3.0, 4.0)], 5.0, 3, 0.002,
+            forward_steps=2, backward_steps=1, graph='graph_test1'
+        )])
+        statistics = db_manager.get_statistics(by_graph=True)
+    assert [(entry['algorithm'], entry['graph'], entry['total_records']) for entry in statistics] == [
+        ('Bidirectional Dijkstra', 'graph_test1', 1), ('Dijkstra', None, 2)
+    ]
+    assert statistics[0]['average_forward_steps'] == 2
+
+
+def test_migrations_run_once(baseline_path):
+    migrated_app(baseline_path)
+    app = migrated_app(baseline_path)
+    with app.app_context():
+        db_manager = DatabaseManager(db)
+        assert not db_manager.migrate_node_coordinates()
+        assert not db_manager.migrate_statistics()
+        assert db_manager.get_statistics()[0]['total_records'] == 2
+
+
+def node_table(app):
+    with app.app_context():
+        connection = db.session.connection()
+        nodes = connection.exec_driver_sql('SELECT "NodeID", "X", "Y" FROM node ORDER BY "NodeID"').fetchall()
+        edges = connection.exec_driver_sql('SELECT "SourceNodeID", "DestinationNodeID" FROM edge ORDER BY "EdgeID"').fetchall()
+        results = connection.exec_driver_sql(
+            'SELECT "StartNodeID", "EndNodeID" FROM shortest_path_result ORDER BY "ResultID"'
+        ).fetchall()
+        indexes = {row[1]: row[2] for row in connection.exec_driver_sql('PRAGMA index_list(node)')}
+    return [tuple(row) for row in nodes], [tuple(row) for row in edges], [tuple(row) for row in results], indexes
+
+
+def test_duplicate_nodes_are_merged_before_the_unique_index(tmp_path):
+    path = tmp_path / 'performance.db'
+    baseline_database(
+        path,
+        nodes=[(1, '0.0,0.0'), (2, '3.0,4.0'), (3, '0.0,0.0'), (4, '3.0,4.0'), (5, '3.0,4.0'), (6, '6.0,8.0')],
+        edges=[(1, 2, 5.0), (3, 4, 5.0), (5, 6, 5.0)],
+        results=[('Dijkstra', 3, 6, '[[0.0,0.0],[3.0,4.0],[6.0,8.0]]', 10.0, 3, 0.001)],
+    )
+    app = migrated_app(path)
+
+    nodes, edges, results, indexes = node_table(app)
+    assert nodes == [(1, 0.0, 0.0), (2, 3.0, 4.0), (6, 6.0, 8.0)]
+    assert edges == [(1, 2), (1, 2), (2, 6)]
+    assert results == [(1, 6)]
+    # Unique
+    assert indexes['ix_node_xy'] == 1
+
+    with app.app_context():
+        db_manager = DatabaseManager(db)
+        assert db_manager.get_node_ids() == {(0.0, 0.0): 1, (3.0, 4.0): 2, (6.0, 8.0): 6}
+        graph = db_manager.load_csr_graph()
+        assert len(graph) == 3
+
+
+def test_interrupted_migration_is_finished(tmp_path):
+    # Columns added and filled by an earlier start that failed on the index
+    path = tmp_path / 'performance.db'
+    baseline_database(path, nodes=[(1, '0.0,0.0'), (2, '0.0,0.0'), (3, '1.0,1.0')], edges=[(2, 3, 1.5)], results=[])
+    with sqlite3.connect(path) as connection:
+        connection.execute('ALTER TABLE node ADD COLUMN X FLOAT')
+        connection.execute('ALTER TABLE node ADD COLUMN Y FLOAT')
+        connection.execute('UPDATE node SET X = 0.0, Y = 0.0 WHERE "NodeID" IN (1, 2)')
+
+    nodes, edges, _, indexes = node_table(migrated_app(path))
+    assert nodes == [(1, 0.0, 0.0), (3, 1.0, 1.0)]
+    assert edges == [(1, 3)]
+    assert 'ix_node_xy' in indexes
@@ -0,0 +1,159 @@
+import math
+import multiprocessing
+import os
+
+import networkx as nx
+import numpy as np
+import pytest
+
+import app as server
+from conftest import random_road_graph
+from csr_graph import CSRGraph
+from distance_matrix import (
+    build_distance_matrix, dijkstra_columns, distances_between, floyd_warshall, load_distance_matrix,
+    open_distance_matrix
+)
+
+
+@pytest.fixture(scope='module')
+def small_graph():
+    return random_road_graph(100, seed=4)
+
+
+@pytest.fixture(scope='module')
+def expected(small_graph):
+    """All-pairs distances by networkx, indexed by node id."""
+    nx_graph = small_graph.to_networkx()
+    dist = np.full((len(small_graph), len(small_graph)), np.inf)
+    for source, lengths in nx.all_pairs_dijkstra_path_length(nx_graph):
+        for target, length in lengths.items():
+            dist[small_graph.index_of(source), small_graph.index_of(target)] = length
+    return dist
+
+
+def assert_next_hops_follow_shortest_paths(graph, dist, next_hop):
+    for i in range(0, len(graph), 7):
+        for j in range(len(graph)):
+            if dist[i, j] == math.inf:
+                assert next_hop[i, j] == -1
+                continue
+            node, total = i, 0.0
+            while node != j:
+                following = int(next_hop[node, j])
+                total += graph.edge_weight(node, following)
+                node = following
+            assert total == pytest.approx(dist[i, j])
+
+
+@pytest.mark.parametrize('tile', [16, 37, 1024])
+def test_tiled_floyd_warshall_matches_networkx(small_graph, expected, tile):
+    dist, next_hop = floyd_warshall(small_graph, tile=tile)
+    np.testing.assert_allclose(dist, expected)
+    assert_next_hops_follow_shortest_paths(small_graph, dist, next_hop)
+
+
+def test_floyd_warshall_rejects_negative_cycles():
+    coords = [(0.0, 0.0), (1.0, 0.0), (2.0, 0.0)]
+    graph = CSRGraph.from_edges(coords, [0, 1, 2], [1, 2, 0], [1.0, -3.0, 1.0])
+    with pytest.raises(ValueError):
+        floyd_warshall(graph)
+
+
+def test_dijkstra_columns_match_networkx(small_graph, expected):
+    columns = np.array([0, 5, 42, 99])
+    dist, next_hop = dijkstra_columns(small_graph, columns)
+    np.testing.assert_allclose(dist, expected[:, columns])
+    full_dist = np.full_like(expected, np.inf)
+    full_dist[:, columns] = dist
+    full_next_hop = np.full(expected.shape, -1, dtype=np.int32)
+    full_next_hop[:, columns] = next_hop
+    assert_next_hops_follow_shortest_paths(small_graph, full_dist, full_next_hop)
+
+
+@pytest.mark.parametrize('sources, targets', [([3, 3, 8, 50, 61], [9, 70]), ([9, 70], [3, 3, 8, 50, 61])])
+def test_distances_between_search_from_the_smaller_side(small_graph, expected, sources, targets):
+    np.testing.assert_allclose(distances_between(small_graph, sources, targets), expected[np.ix_(sources, targets)])
+
+
+@pytest.mark.parametrize('method', ['floyd-warshall', 'dijkstra'])
+def test_built_matrix_only_loads_for_its_graph(small_graph, expected, method, tmp_path):
+    path = str(tmp_path / 'graph.dm')
+    matrix = build_distance_matrix(small_graph, path, method)
+    assert matrix.method == method
+    np.testing.assert_allclose(matrix.submatrix([1, 2], [3, 4]), expected[np.ix_([1, 2], [3, 4])])
+    assert load_distance_matrix(path, small_graph) is not None
+    assert load_distance_matrix(path, random_road_graph(100, seed=5)) is None
+
+
+
+def test_concurrent_builds_leave_a_complete_matrix(small_graph, expected, tmp_path):
+    path = str(tmp_path / 'graph.dm')
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=build_distance_matrix, args=(small_graph, path, 'dijkstra')) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert all(worker.exitcode == 0 for worker in workers)
+    matrix = load_distance_matrix(path, small_graph)
+    np.testing.assert_allclose(matrix.submatrix(range(10), range(10)), expected[:10, :10])
+    assert not [name for name in os.listdir(tmp_path) if '.tmp' in name]
+
+
+def test_open_distance_matrix_builds_only_when_missing_or_stale(small_graph, tmp_path, monkeypatch):
+    import distance_matrix
+
+    path = str(tmp_path / 'graph.dm')
+    builds = []
+    build = distance_matrix._build_distance_matrix
+    monkeypatch.setattr(distance_matrix, '_build_distance_matrix', lambda *args: builds.append(1) or build(*args))
+    open_distance_matrix(small_graph, path)
+    open_distance_matrix(small_graph, path)
+    assert len(builds) == 1
+    open_distance_matrix(random_road_graph(100, seed=5), path)
+    assert len(builds) == 2
+
+
+@pytest.fixture
+def matrix_client(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(server, 'matrix_path', lambda graph_id: str(tmp_path / f'{graph_id}.dm'))
+    return client
+
+
+def graph_nodes(ids):
+    G = server.graph_registry.get('graph_test1')
+    return [list(node) for node in G.nodes_of(ids)]
+
+
+@pytest.mark.parametrize('max_nodes, method', [(10 ** 6, 'matrix'), (0, 'dijkstra')])
+def test_endpoint_methods_agree(matrix_client, max_nodes, method):
+    matrix_client.application.config['DISTANCE_MATRIX_MAX_NODES'] = max_nodes
+    nodes = graph_nodes([0, 5, 17])
+    response = matrix_client.post('/api/distance-matrix/graph_test1', json={'sources': nodes, 'targets': nodes[:2]})
+    assert response.status_code == 200
+    assert response.json['method'] == method
+    G = server.graph_registry.get('graph_test1')
+    expected = distances_between(G, [0, 5, 17], [0, 5])
+    assert response.json['distances'] == [[round(d, 3) if d < math.inf else None for d in row] for row in expected.tolist()]
+
+
+@pytest.mark.parametrize('body', [{}, {'sources': [[0, 0]]}, {'nodes': [['a', 'b']]}, {'nodes': 5}])
+def test_endpoint_rejects_malformed_node_lists(matrix_client, body):
+    response = matrix_client.post('/api/distance-matrix/graph_test1', json=body)
+    assert response.status_code == 400
+
+
+def test_endpoint_rejects_too_many_cells(matrix_client):
+    matrix_client.application.config['DISTANCE_MATRIX_MAX_CELLS'] = 3
+    response = matrix_client.post('/api/distance-matrix/graph_test1', json={'nodes': graph_nodes([0, 1])})
+    assert response.status_code == 400
+    assert response.json['max_cells'] == 3
+
+
+def test_endpoint_rejects_unknown_nodes_and_graphs(matrix_client):
+    far = [[-1e9, -1e9]]
+    response = matrix_client.post('/api/distance-matrix/graph_test1', json={'sources': far, 'targets': graph_nodes([0])})
+    assert response.status_code == 400
+    assert response.json['nodes'] == far
+    response = matrix_client.post('/api/distance-matrix/no_such_graph', json={'nodes': far})
+    assert response.status_code == 404
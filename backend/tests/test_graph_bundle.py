@@ -0,0 +1,194 @@
+import glob
+import json
+import mmap
+import multiprocessing
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+import app as server
+from app import create_app
+from graph_builder import load_graph
+from graph_bundle import (
+    BUNDLE_FORMAT_VERSION, array_path, compile_graph_bundle, load_graph_bundle, open_graph_bundle, read_manifest
+)
+from utils import dijkstra_with_steps
+
+GRAPH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'graph')
+
+
+@pytest.fixture
+def source_path(tmp_path):
+    """Returns a copy of graph_test1's GeoJSON the test may edit."""
+    path = tmp_path / 'graph_test1.geojson'
+    shutil.copy(os.path.join(GRAPH_DIR, 'graph_test1.geojson'), path)
+    return str(path)
+
+
+@pytest.fixture
+def bundle(tmp_path):
+    return str(tmp_path / 'bundle' / 'graph_test1')
+
+
+def generations(bundle):
+    return {os.path.basename(path).split('.')[1] for path in glob.glob(f'{bundle}.*.npy')}
+
+
+def add_road(source_path):
+    with open(source_path) as f:
+        geojson = json.load(f)
+    geojson['features'].append({
+        'type': 'Feature',
+        'properties': {},
+        'geometry': {'type': 'LineString', 'coordinates': [[0.0, 0.0], [1.0, 1.0]]},
+    })
+    with open(source_path, 'w') as f:
+        json.dump(geojson, f)
+
+
+def route(graph):
+    _, path, _ = dijkstra_with_steps(graph, graph.node(0), graph.node(len(graph) - 1), trace='none')
+    return path
+
+
+def is_mapped(array):
+    """Tells whether ``array`` is a view of a memory-mapped file."""
+    while array is not None:
+        if isinstance(array, (np.memmap, mmap.mmap)):
+            return True
+        array = getattr(array, 'base', None)
+    return False
+
+
+def assert_same_graph(graph, expected):
+    assert graph.fingerprint() == expected.fingerprint()
+    for name in ('coords', 'offsets', 'targets', 'weights'):
+        np.testing.assert_array_equal(getattr(graph, name), getattr(expected, name))
+
+
+def test_bundle_maps_the_graph_of_its_source(source_path, bundle):
+    compile_graph_bundle(source_path, bundle)
+    graph = load_graph_bundle(bundle, source_path)
+    assert is_mapped(graph.coords)
+    assert_same_graph(graph, load_graph(source_path))
+    assert_same_graph(graph.reverse(), load_graph(source_path).reverse())
+
+
+def test_readers_keep_their_generation_across_a_swap(source_path, bundle):
+    compile_graph_bundle(source_path, bundle)
+    reader = load_graph_bundle(bundle, source_path)
+    old_generation = read_manifest(bundle)['generation']
+    expected = route(reader)
+
+    # compile_graph_bundle takes bundle_lock, swaps the manifest and removes the old arrays
+    compile_graph_bundle(source_path, bundle)
+    new_generation = read_manifest(bundle)['generation']
+    assert new_generation != old_generation
+    assert generations(bundle) == {new_generation}
+
+    assert route(reader) == expected
+    assert_same_graph(reader, load_graph_bundle(bundle, source_path))
+
+
+def test_stale_bundle_is_recompiled(source_path, bundle):
+    compile_graph_bundle(source_path, bundle)
+    generation = read_manifest(bundle)['generation']
+    add_road(source_path)
+
+    assert load_graph_bundle(bundle, source_path) is None
+    graph = open_graph_bundle(bundle, source_path)
+    assert read_manifest(bundle)['generation'] != generation
+    assert_same_graph(graph, load_graph(source_path))
+
+
+def test_touched_source_with_the_same_content_is_current(source_path, bundle):
+    compile_graph_bundle(source_path, bundle)
+    stat = os.stat(source_path)
+    os.utime(source_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert load_graph_bundle(bundle, source_path) is not None
+
+
+def corrupt_manifest(bundle):
+    with open(f'{bundle}.json', 'w') as f:
+        f.write('{"format_version": ')
+
+
+def old_format(bundle):
+    manifest = read_manifest(bundle)
+    manifest['format_version'] = BUNDLE_FORMAT_VERSION - 1
+    with open(f'{bundle}.json', 'w') as f:
+        json.dump(manifest, f)
+
+
+def missing_array(bundle):
+    os.remove(array_path(bundle, read_manifest(bundle)['generation'], 'targets'))
+
+
+def truncated_array(bundle):
+    path = array_path(bundle, read_manifest(bundle)['generation'], 'weights')
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) // 2)
+
+
+def overwritten_array(bundle):
+    with open(array_path(bundle, read_manifest(bundle)['generation'], 'coords'), 'wb') as f:
+        f.write(b'not an array')
+
+
+@pytest.mark.parametrize('damage', [corrupt_manifest, old_format, missing_array, truncated_array, overwritten_array])
+def test_damaged_bundle_is_recompiled(source_path, bundle, damage):
+    compile_graph_bundle(source_path, bundle)
+    damage(bundle)
+
+    assert load_graph_bundle(bundle, source_path) is None
+    graph = open_graph_bundle(bundle, source_path)
+    assert_same_graph(graph, load_graph(source_path))
+    assert generations(bundle) == {read_manifest(bundle)['generation']}
+
+
+def test_concurrent_opens_compile_once(source_path, bundle, tmp_path, monkeypatch):
+    import graph_bundle
+
+    # Forked workers inherit the patch and record each compile in a file
+    compiles = tmp_path / 'compiles'
+    compile_bundle = graph_bundle._compile_graph_bundle
+
+    def counted_compile(*args):
+        with open(compiles, 'a') as f:
+            f.write('compile\n')
+        return compile_bundle(*args)
+
+    monkeypatch.setattr(graph_bundle, '_compile_graph_bundle', counted_compile)
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=open_graph_bundle, args=(bundle, source_path)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert all(worker.exitcode == 0 for worker in workers)
+    # Later openers found the first compile current and left it alone
+    assert compiles.read_text() == 'compile\n'
+    assert len(generations(bundle)) == 1
+    assert not os.path.exists(f'{bundle}.tmp.json')
+    assert_same_graph(load_graph_bundle(bundle, source_path), load_graph(source_path))
+
+
+def test_app_compiles_and_maps_bundles(tmp_path, source_path, monkeypatch):
+    bundle_dir = tmp_path / 'bundle'
+    monkeypatch.setattr(server, 'bundle_path', lambda graph_id: str(bundle_dir / graph_id))
+    client = create_app({
+        'TESTING': True,
+        'GRAPH_BUNDLE_COMPILE': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'performance.db'}",
+    }).test_client()
+    monkeypatch.setattr(server.graph_registry, 'graph_dir', str(tmp_path))
+
+    G = server.graph_registry.get('graph_test1')
+    assert is_mapped(G.coords)
+    assert read_manifest(str(bundle_dir / 'graph_test1')) is not None
+    (x1, y1), (x2, y2) = G.node(0), G.node(len(G) - 1)
+    response = client.get(f'/api/shortest-path/graph_test1/Dijkstra/{x1},{y1}/{x2},{y2}')
+    assert response.status_code == 200
+    assert response.get_json()['path'] == [list(node) for node in route(load_graph(source_path))]
@@ -0,0 +1,70 @@
+import threading
+
+from graph_registry import GraphRegistry
+
+
+class Graph:
+    nbytes = 100
+
+
+class Index:
+    nbytes = 1000
+
+
+def registry(tmp_path, graph_ids, max_bytes=10 ** 9):
+    for graph_id in graph_ids:
+        (tmp_path / f'{graph_id}.geojson').write_text('{}')
+    return GraphRegistry(str(tmp_path), lambda path: Graph(), max_bytes=max_bytes)
+
+
+def test_index_is_computed_once_and_counted(tmp_path):
+    graphs = registry(tmp_path, ['a'])
+    graph = graphs.get('a')
+    before = graphs.get_entry('a').nbytes
+    calls = []
+    for _ in range(3):
+        index = graphs.get_index('a', graph, 'kind', lambda: calls.append(1) or Index())
+    assert len(calls) == 1
+    assert graphs.get_entry('a').nbytes == before + index.nbytes
+    assert graphs.stats()['graphs'][0]['indexes'] == ['kind']
+
+
+def test_missing_index_is_not_kept(tmp_path):
+    graphs = registry(tmp_path, ['a'])
+    graph = graphs.get('a')
+    assert graphs.get_index('a', graph, 'kind', lambda: None) is None
+    assert graphs.get_index('a', graph, 'kind', Index) is not None
+
+
+def test_indexes_are_evicted_with_their_graph(tmp_path):
+    graphs = registry(tmp_path, ['a', 'b'], max_bytes=1500)
+    graph = graphs.get('a')
+    index = graphs.get_index('a', graph, 'kind', Index)
+    graphs.get('b')
+    graphs.get_index('b', graphs.get('b'), 'kind', Index)
+    assert [entry['graph'] for entry in graphs.stats()['graphs']] == ['b']
+    # A graph no longer cached gets its index computed again, without keeping it
+    assert graphs.get_index('a', graph, 'kind', Index) is not index
+
+
+def test_build_does_not_block_other_indexes(tmp_path):
+    graphs = registry(tmp_path, ['a', 'b'])
+    a, b = graphs.get('a'), graphs.get('b')
+    started, release = threading.Event(), threading.Event()
+
+    def slow_build():
+        started.set()
+        release.wait(5)
+        return Index()
+
+    builder = threading.Thread(target=graphs.get_index, args=('a', a, 'slow', slow_build))
+    builder.start()
+    started.wait(5)
+    try:
+        # Both return while the slow build still holds its lock
+        assert graphs.get_index('a', a, 'fast', Index) is not None
+        assert graphs.get_index('b', b, 'slow', Index) is not None
+        assert builder.is_alive()
+    finally:
+        release.set()
+        builder.join()
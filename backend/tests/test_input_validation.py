@@ -0,0 +1,83 @@
+import pytest
+
+import app as server
+
+BAD_TEXT_NODES = ['1', '1,2,3', 'nan,nan', 'inf,0', 'a,b', ',']
+BAD_JSON_NODES = [[1], [1, 2, 3], [float('nan'), 0], [1, 'a'], [True, 1], '1,2', None]
+BAD_SNAP_DISTANCES = ['nan', 'inf', '-1', 'far']
+
+
+@pytest.fixture
+def nodes(client):
+    G = server.graph_registry.get('graph_test1')
+    return [list(node) for node in G.nodes_of([0, len(G) - 1])]
+
+
+def text(node):
+    return f'{node[0]},{node[1]}'
+
+
+@pytest.mark.parametrize('endpoint', ['shortest-path', 'shortest-path-stream'])
+@pytest.mark.parametrize('bad', BAD_TEXT_NODES)
+def test_route_endpoints_reject_malformed_nodes(client, nodes, endpoint, bad):
+    good = text(nodes[0])
+    for source, target in ((bad, good), (good, bad)):
+        response = client.get(f'/api/{endpoint}/graph_test1/Dijkstra/{source}/{target}')
+        assert response.status_code == 400
+        assert 'error' in response.json
+
+
+@pytest.mark.parametrize('bad', BAD_TEXT_NODES)
+def test_distance_matrix_get_rejects_malformed_nodes(client, nodes, bad):
+    response = client.get(f'/api/distance-matrix/graph_test1?sources={bad}&targets={text(nodes[0])}')
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('bad', BAD_JSON_NODES)
+def test_distance_matrix_post_rejects_malformed_nodes(client, nodes, bad):
+    response = client.post('/api/distance-matrix/graph_test1', json={'sources': [nodes[0], bad], 'targets': nodes})
+    assert response.status_code == 400
+
+
+def test_distance_matrix_post_rejects_nan_literals(client, nodes):
+    # json.dumps writes NaN, which Flask parses back into a float
+    response = client.post('/api/distance-matrix/graph_test1', data='{"nodes": [[NaN, NaN]]}', content_type='application/json')
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('bad', BAD_TEXT_NODES)
+def test_snap_get_rejects_malformed_points(client, nodes, bad):
+    response = client.get(f'/api/snap/graph_test1?points={text(nodes[0])};{bad}')
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('bad', BAD_JSON_NODES)
+def test_snap_post_rejects_malformed_points(client, nodes, bad):
+    response = client.post('/api/snap/graph_test1', json={'points': [nodes[0], bad]})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('bad', BAD_SNAP_DISTANCES)
+def test_every_endpoint_rejects_bad_snap_distances(client, nodes, bad):
+    query = f'snap_distance={bad}'
+    source, target = text(nodes[0]), text(nodes[1])
+    responses = [
+        client.get(f'/api/shortest-path/graph_test1/Dijkstra/{source}/{target}?{query}'),
+        client.get(f'/api/shortest-path-stream/graph_test1/Dijkstra/{source}/{target}?{query}'),
+        client.post(f'/api/shortest-path-batch/graph_test1?{query}', json={'pairs': [nodes]}),
+        client.post(f'/api/distance-matrix/graph_test1?{query}', json={'nodes': nodes}),
+        client.get(f'/api/snap/graph_test1?points={source}&{query}'),
+    ]
+    assert [response.status_code for response in responses] == [400] * len(responses)
+
+
+def test_valid_requests_still_snap(client, nodes):
+    off = [nodes[0][0] + 1, nodes[0][1]]
+    response = client.get(f'/api/snap/graph_test1?points={text(off)}&snap_distance=5')
+    assert response.status_code == 200
+    assert response.json['results'][0]['node'] == nodes[0]
+    response = client.get(f'/api/snap/graph_test1?points={text(off)}&snap_distance=0.5')
+    assert response.json['results'][0]['node'] is None
+    response = client.get(f'/api/shortest-path/graph_test1/Dijkstra/{text(off)}/{text(nodes[1])}?trace=none&snap_distance=5')
+    assert response.status_code == 200
+    assert response.json['source'] == nodes[0]
@@ -0,0 +1,33 @@
+import networkx as nx
+import pytest
+
+from conftest import assert_matches_networkx, random_node_pairs, random_road_graph
+from landmarks import build_landmark_heuristic, load_landmark_heuristic
+from utils import astar_with_steps
+
+
+@pytest.fixture(scope='module')
+def heuristic(road_graph):
+    return build_landmark_heuristic(road_graph)
+
+
+def test_matches_networkx(road_graph, road_networkx, heuristic):
+    assert_matches_networkx(road_networkx, random_node_pairs(road_graph, 100), lambda source, target: (
+        astar_with_steps(road_graph, source, target, heuristic=heuristic, trace='none')[1], None
+    ))
+
+
+def test_bounds_are_admissible(road_graph, road_networkx, heuristic):
+    target = road_graph.node(11)
+    distances = nx.single_source_dijkstra_path_length(road_networkx.reverse(), target)
+    potential = heuristic.bind(road_graph, 11)
+    for node, distance in distances.items():
+        assert potential(road_graph.index_of(node)) <= distance + 1e-9
+
+
+def test_saved_landmarks_only_load_for_their_graph(road_graph, heuristic, tmp_path):
+    path = str(tmp_path / 'graph.alt')
+    heuristic.save(path)
+    loaded = load_landmark_heuristic(path, road_graph)
+    assert loaded is not None and loaded.landmarks == heuristic.landmarks
+    assert load_landmark_heuristic(path, random_road_graph(300, seed=2)) is None
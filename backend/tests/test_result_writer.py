@@ -0,0 +1,91 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import textwrap
+import threading
+
+from database import ShortestPathResult, db
+from result_writer import ResultWriter
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def result(index):
+    return dict(
+        algorithm='Dijkstra', start_node_id='[0.0, 0.0]', end_node_id=f'[{index}.0, 0.0]',
+        path=[(0.0, 0.0), (float(index), 0.0)], total_weight=float(index), steps=index, time=0.001, graph='graph_test1'
+    )
+
+
+def stored_results(app):
+    with app.app_context():
+        return db.session.query(ShortestPathResult).count()
+
+
+def test_stop_writes_every_queued_row(client):
+    app = client.application
+    # Neither the batch size nor the delay is reached before stop()
+    writer = ResultWriter(app, db, max_batch=10000, max_delay=60.0)
+    submitters = [
+        threading.Thread(target=lambda start=start: [writer.submit(**result(start + i)) for i in range(250)])
+        for start in range(0, 1000, 250)
+    ]
+    for submitter in submitters:
+        submitter.start()
+    for submitter in submitters:
+        submitter.join()
+    writer.stop()
+
+    assert stored_results(app) == 1000
+    stats = writer.stats()
+    assert (stats['submitted'], stats['written'], stats['dropped'], stats['batches']) == (1000, 1000, 0, 1)
+
+
+def test_flush_writes_rows_before_the_delay(client):
+    app = client.application
+    writer = ResultWriter(app, db, max_batch=10000, max_delay=60.0)
+    for i in range(3):
+        writer.submit(**result(i))
+    writer.flush(timeout=10)
+    assert stored_results(app) == 3
+    writer.stop()
+
+
+def test_full_batches_are_written_without_waiting(client):
+    app = client.application
+    writer = ResultWriter(app, db, max_batch=2, max_delay=60.0)
+    batches = writer.batches
+    for i in range(4):
+        writer.submit(**result(i))
+    assert writer.wait_for_batch(batches + 1, timeout=10)
+    assert stored_results(app) == 4
+    writer.stop()
+
+
+def test_rows_are_written_when_the_process_exits(tmp_path):
+    db_path = tmp_path / 'performance.db'
+    script = textwrap.dedent(f"""
+        from app import create_app
+        import app as server
+
+        create_app({{'SQLALCHEMY_DATABASE_URI': 'sqlite:///{db_path}', 'RESULT_WRITER_DELAY': 60.0}})
+        for i in range(5):
+            server.result_writer.submit(
+                algorithm='Dijkstra', start_node_id='[0.0, 0.0]', end_node_id='[1.0, 0.0]',
+                path=[(0.0, 0.0), (1.0, 0.0)], total_weight=1.0, steps=i, time=0.001
+            )
+    """)
+    subprocess.run([sys.executable, '-c', script], cwd=BACKEND_DIR, check=True, capture_output=True, timeout=60)
+
+    with sqlite3.connect(db_path) as connection:
+        assert connection.execute('SELECT COUNT(*) FROM shortest_path_result').fetchone()[0] == 5
+        assert connection.execute('SELECT "Count" FROM algorithm_statistics').fetchone()[0] == 5
+
+
+def test_database_uses_wal(client):
+    with client.application.app_context():
+        connection = db.session.connection()
+        assert connection.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        # 1 is NORMAL
+        assert connection.exec_driver_sql('PRAGMA synchronous').scalar() == 1
@@ -0,0 +1,129 @@
+import json
+import shutil
+
+import pytest
+
+import app as server
+from conftest import random_node_pairs
+from route_cache import RouteCache, encode_result, route_key
+from utils import calculate_total_weight, dijkstra_with_steps
+
+
+@pytest.fixture(scope='module')
+def results(road_graph):
+    """Three Dijkstra results on the road graph, keyed by route_key."""
+    results = {}
+    for source, target in random_node_pairs(road_graph, 3, seed=4):
+        steps, path, time_taken = dijkstra_with_steps(road_graph, source, target, trace='visited')
+        key = route_key(road_graph.fingerprint(), 'Dijkstra', source, target, 'visited')
+        results[key] = ('Dijkstra', steps, path, calculate_total_weight(road_graph, path), time_taken)
+    return results
+
+
+def assert_same_result(cached, result):
+    assert encode_result(cached) == encode_result(result)
+
+
+def test_evicts_least_recently_used(results):
+    (first, a), (second, b), (third, c) = results.items()
+    cache = RouteCache(max_bytes=len(encode_result(a)) + len(encode_result(b)) + 1)
+    cache.put(first, a)
+    cache.put(second, b)
+    # Using the first result makes the second the least recently used
+    assert_same_result(cache.get(first), a)
+    cache.put(third, c)
+    assert cache.get(second) is None
+    assert_same_result(cache.get(first), a)
+    assert_same_result(cache.get(third), c)
+    assert cache.stats()['evictions'] == 1
+
+
+def test_does_not_keep_results_over_the_budget_in_memory(results):
+    key, result = next(iter(results.items()))
+    cache = RouteCache(max_bytes=len(encode_result(result)) - 1)
+    cache.put(key, result)
+    assert cache.get(key) is None
+    assert cache.stats()['cached_bytes'] == 0
+
+
+def test_evicted_results_come_back_from_disk(results, tmp_path):
+    (first, a), (second, b) = list(results.items())[:2]
+    cache = RouteCache(max_bytes=len(encode_result(b)), db_path=str(tmp_path / 'routes.db'))
+    cache.put(first, a)
+    cache.put(second, b)
+    assert_same_result(cache.get(first), a)
+    stats = cache.stats()
+    assert stats['disk_hits'] == 1 and stats['disk_entries'] == 2
+
+
+def test_disk_tier_survives_a_restart(results, tmp_path):
+    db_path = str(tmp_path / 'routes.db')
+    cache = RouteCache(db_path=db_path)
+    for key, result in results.items():
+        cache.put(key, result)
+
+    restarted = RouteCache(db_path=db_path)
+    for key, result in results.items():
+        assert_same_result(restarted.get(key), result)
+    assert restarted.stats()['disk_hits'] == len(results)
+
+    restarted.clear()
+    assert RouteCache(db_path=db_path).get(next(iter(results))) is None
+
+
+def test_key_covers_every_input_of_the_response():
+    keys = {
+        route_key('fingerprint', 'Dijkstra', (1.0, 2.0), (3.0, 4.0), 'full'),
+        route_key('other', 'Dijkstra', (1.0, 2.0), (3.0, 4.0), 'full'),
+        route_key('fingerprint', 'A* (Euclidean)', (1.0, 2.0), (3.0, 4.0), 'full'),
+        route_key('fingerprint', 'Dijkstra', (3.0, 4.0), (1.0, 2.0), 'full'),
+        route_key('fingerprint', 'Dijkstra', (1.0, 2.0), (3.0, 4.0), 'visited'),
+    }
+    assert len(keys) == 5
+
+
+@pytest.fixture
+def graph_client(client, monkeypatch, tmp_path):
+    """Returns a client whose graph_test1 is a copy the test may edit."""
+    shutil.copy(server.graph_registry.path_for('graph_test1'), tmp_path / 'graph_test1.geojson')
+    monkeypatch.setattr(server.graph_registry, 'graph_dir', str(tmp_path))
+    return client
+
+
+@pytest.fixture
+def endpoints(graph_client):
+    G = server.graph_registry.get('graph_test1')
+    return G.node(0), G.node(len(G) - 1)
+
+
+def route(client, endpoints, trace='visited'):
+    (x1, y1), (x2, y2) = endpoints
+    response = client.get(f'/api/shortest-path/graph_test1/Dijkstra/{x1},{y1}/{x2},{y2}?trace={trace}')
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_endpoint_caches_trace_modes_apart(graph_client, endpoints):
+    assert not route(graph_client, endpoints, 'visited')['cached']
+    assert route(graph_client, endpoints, 'visited')['cached']
+    assert not route(graph_client, endpoints, 'none')['cached']
+    assert route(graph_client, endpoints, 'none')['steps'] == []
+
+
+def test_endpoint_misses_after_the_graph_changes(graph_client, endpoints, tmp_path):
+    first = route(graph_client, endpoints)
+    assert not first['cached'] and route(graph_client, endpoints)['cached']
+
+    # Add a road away from the route, which changes the graph fingerprint
+    path = tmp_path / 'graph_test1.geojson'
+    geojson = json.loads(path.read_text())
+    geojson['features'].append({
+        'type': 'Feature',
+        'properties': {},
+        'geometry': {'type': 'LineString', 'coordinates': [[0.0, 0.0], [1.0, 1.0]]},
+    })
+    path.write_text(json.dumps(geojson))
+
+    second = route(graph_client, endpoints)
+    assert not second['cached']
+    assert second['path'] == first['path']
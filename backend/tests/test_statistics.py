@@ -0,0 +1,104 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import app as server
+from database import ShortestPathResult, db
+from database_manager import DatabaseManager
+from statistics_rollup import SKETCH_ALPHA, QuantileSketch
+
+
+def submit_result(algorithm='Dijkstra', steps=10, time_taken=0.01):
+    server.result_writer.submit(
+        algorithm=algorithm, start_node_id='[0.0, 0.0]', end_node_id='[1.0, 1.0]', path=[(0.0, 0.0), (1.0, 1.0)],
+        total_weight=1.5, steps=steps, time=time_taken, graph='graph_test1'
+    )
+
+
+def test_unchanged_statistics_answer_304(client):
+    submit_result()
+    first = client.get('/api/statistics')
+    assert first.status_code == 200 and first.get_json()[0]['total_records'] == 1
+    etag = first.headers['ETag']
+
+    assert client.get('/api/statistics', headers={'If-None-Match': etag}).status_code == 304
+    # Grouping by graph is another representation
+    assert client.get('/api/statistics?by=graph', headers={'If-None-Match': etag}).status_code == 200
+
+    submit_result()
+    changed = client.get('/api/statistics', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    assert changed.get_json()[0]['total_records'] == 2
+
+
+def test_version_changes_when_a_rebuild_keeps_the_count(client):
+    submit_result()
+    submit_result()
+    server.result_writer.flush()
+    with client.application.app_context():
+        db_manager = DatabaseManager(db)
+        version = db_manager.get_statistics_version()
+        # Deleting a result and recording another leaves the count at two
+        db.session.query(ShortestPathResult).filter(ShortestPathResult.ResultID == 1).delete()
+        db_manager.rebuild_statistics()
+        db_manager.add_shortest_path_results([DatabaseManager.shortest_path_row(
+            'Dijkstra', '[0.0, 0.0]', '[1.0, 1.0]', [(0.0, 0.0)], 0.0, 1, 0.001, graph='graph_test1'
+        )])
+        assert db_manager.get_statistics()[0]['total_records'] == 2
+        assert db_manager.get_statistics_version() != version
+
+
+def test_long_poll_wakes_up_on_new_results(client):
+    submit_result()
+    etag = client.get('/api/statistics').headers['ETag']
+
+    responses = []
+    poll = threading.Thread(target=lambda: responses.append(
+        client.application.test_client().get('/api/statistics?wait=10', headers={'If-None-Match': etag})
+    ))
+    start = time.monotonic()
+    poll.start()
+    time.sleep(0.3)
+    assert not responses
+    submit_result()
+    poll.join(10)
+
+    assert time.monotonic() - start < 5
+    response, = responses
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+    assert response.get_json()[0]['total_records'] == 2
+
+
+def test_long_poll_answers_304_when_the_wait_is_over(client):
+    submit_result()
+    etag = client.get('/api/statistics').headers['ETag']
+    start = time.monotonic()
+    response = client.get('/api/statistics?wait=0.5', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert time.monotonic() - start >= 0.5
+
+
+@pytest.mark.parametrize('q', [0.01, 0.25, 0.5, 0.95, 0.99])
+def test_sketch_quantiles_within_relative_error(q):
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(mean=-4.0, sigma=2.0, size=20000)
+    sketch = QuantileSketch()
+    sketch.add_many(values)
+    # The sketch answers with the value of rank floor(q * (n - 1))
+    expected = np.quantile(values, q, method='lower')
+    assert sketch.quantile(q) == pytest.approx(expected, rel=SKETCH_ALPHA)
+
+
+def test_merged_sketches_match_one_sketch_of_all_values():
+    rng = np.random.default_rng(1)
+    parts = [rng.exponential(100.0, 5000), rng.uniform(0.0, 10.0, 3000), np.zeros(500)]
+    merged = QuantileSketch()
+    for part in parts:
+        sketch = QuantileSketch()
+        sketch.add_many(part)
+        merged.merge(QuantileSketch.from_json(sketch.to_json()))
+    values = np.concatenate(parts)
+    for q in (0.05, 0.5, 0.99):
+        assert merged.quantile(q) == pytest.approx(np.quantile(values, q, method='lower'), rel=SKETCH_ALPHA)
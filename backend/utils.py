@@ -1,135 +1,628 @@
-import networkx as nx
-import geopandas as gpd
 import heapq
 import math
 import random
 import time
-
-def dijkstra_with_steps(graph, start, end):
-    start_time = time.time()
-    queue = [(0, start, [])]
-    seen = set()
-    min_dist = {start: 0}
-    steps = []
-    final_path = []
+from collections import deque
+
+import numpy as np
+
+from csr_graph import as_csr_graph
+
+# How much of the search a step trace records: nothing, each settled node
+# with its distance, settled nodes with the neighbors they pushed onto the
+# frontier, or settled nodes with their full path from the source.
+TRACE_MODES = ('none', 'visited', 'frontier', 'full')
+
+class StepTrace(list):
+    """Step records of one search plus the number of nodes it settled.
+
+    ``settled`` is counted in every trace mode, so callers that only need
+    the step count can pass ``trace='none'`` and skip recording entirely.
+    """
+
+    def __init__(self, mode='full', records=()):
+        if mode not in TRACE_MODES:
+            raise ValueError(f"Unknown trace mode: {mode}")
+        super().__init__(records)
+        self.mode = mode
+        self.settled = 0
+        self.forward_settled = None
+        self.backward_settled = None
+
+def node_id(graph, coord):
+    """Returns the id of the node at ``coord``, raising KeyError if absent."""
+    i = graph.index_of(coord)
+    if i is None:
+        raise KeyError(coord)
+    return i
+
+def reconstruct_path(predecessor, target):
+    """Walks a predecessor table back from ``target`` to the search source."""
+    path = []
+    node = target
+    while node != -1:
+        path.append(node)
+        node = predecessor[node]
+    path.reverse()
+    return path
+
+def best_first_search(graph, source, target, steps, potential=None):
+    """Settles nodes of a CSRGraph in order of distance until ``target`` is settled.
+
+    With a ``potential`` (a function of a node id) nodes are ordered by
+    distance plus potential instead, which is A*. Records settled nodes in
+    ``steps`` according to its trace mode and returns the distance and
+    predecessor tables.
+    """
+    n = len(graph)
+    offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+    dist = [math.inf] * n
+    predecessor = [-1] * n
+    seen = bytearray(n)
+    mode = steps.mode
+    record = steps.append
+
+    dist[source] = 0
+    queue = [(0 if potential is None else potential(source), source)]
+    settled = 0
 
     while queue:
-        (cost, node, path) = heapq.heappop(queue)
-        
-        if node in seen:
+        _, node = heapq.heappop(queue)
+
+        if seen[node]:
             continue
-        
-        seen.add(node)
-        path = path + [node]
-        steps.append((node, cost, path))
-        
-        if node == end:
-            final_path = path
+
+        seen[node] = 1
+        settled += 1
+        cost = dist[node]
+
+        if node == target:
+            if mode == 'visited':
+                record((node, cost))
+            elif mode == 'frontier':
+                record((node, cost, []))
+            elif mode == 'full':
+                record((node, cost, reconstruct_path(predecessor, node)))
             break
-        
-        for neighbor, data in graph[node].items():
-            if neighbor in seen:
-                continue
-            prev_cost = min_dist.get(neighbor, float('inf'))
-            new_cost = cost + data['weight']
-            if new_cost < prev_cost:
-                min_dist[neighbor] = new_cost
-                heapq.heappush(queue, (new_cost, neighbor, path))
-    
-    end_time = time.time()
-    return steps, final_path, end_time - start_time
 
-def bellman_ford_with_steps(graph, start, end):
-    start_time = time.time()
-    steps = []
-    distance = {node: float('inf') for node in graph}
-    distance[start] = 0
-    predecessor = {node: None for node in graph}
-
-    for _ in range(len(graph) - 1):
-        for node in graph:
-            for neighbor, data in graph[node].items():
-                if distance[node] + data['weight'] < distance[neighbor]:
-                    distance[neighbor] = distance[node] + data['weight']
-                    predecessor[neighbor] = node
-                    steps.append((node, neighbor, distance[neighbor]))
+        frontier = [] if mode == 'frontier' else None
+        lo, hi = offsets[node], offsets[node + 1]
+        for neighbor, weight in zip(targets[lo:hi].tolist(), weights[lo:hi].tolist()):
+            if seen[neighbor]:
+                continue
+            new_cost = cost + weight
+            if new_cost < dist[neighbor]:
+                dist[neighbor] = new_cost
+                predecessor[neighbor] = node
+                if potential is None:
+                    heapq.heappush(queue, (new_cost, neighbor))
+                else:
+                    heapq.heappush(queue, (new_cost + potential(neighbor), neighbor))
+                if frontier is not None:
+                    frontier.append(neighbor)
+
+        if mode == 'visited':
+            record((node, cost))
+        elif mode == 'frontier':
+            record((node, cost, frontier))
+        elif mode == 'full':
+            record((node, cost, reconstruct_path(predecessor, node)))
+
+    steps.settled = settled
+    return dist, predecessor
+
+def shortest_path_tree(graph, source, targets):
+    """Settles nodes of a CSRGraph in order of distance until every target is settled.
+
+    Settles nodes in the same order as ``best_first_search`` does, so the
+    paths it finds match single-target searches. Returns the distance and
+    predecessor tables and the number of settled nodes.
+    """
+    n = len(graph)
+    offsets, edge_targets, weights = graph.offsets, graph.targets, graph.weights
+    dist = [math.inf] * n
+    predecessor = [-1] * n
+    seen = bytearray(n)
+    remaining = set(targets)
+
+    dist[source] = 0
+    queue = [(0, source)]
+    settled = 0
+
+    while queue and remaining:
+        _, node = heapq.heappop(queue)
+
+        if seen[node]:
+            continue
 
-    # Check for negative weight cycles
-    for node in graph:
-        for neighbor, data in graph[node].items():
-            if distance[node] + data['weight'] < distance[neighbor]:
-                raise ValueError("Graph contains a negative weight cycle")
+        seen[node] = 1
+        settled += 1
+        remaining.discard(node)
+        cost = dist[node]
 
-    # Reconstruct path
-    path = []
-    current = end
-    while current is not None:
-        path.insert(0, current)
-        current = predecessor[current]
+        lo, hi = offsets[node], offsets[node + 1]
+        for neighbor, weight in zip(edge_targets[lo:hi].tolist(), weights[lo:hi].tolist()):
+            if seen[neighbor]:
+                continue
+            new_cost = cost + weight
+            if new_cost < dist[neighbor]:
+                dist[neighbor] = new_cost
+                predecessor[neighbor] = node
+                heapq.heappush(queue, (new_cost, neighbor))
+
+    return dist, predecessor, settled
+
+def format_steps(graph, steps):
+    """Returns a copy of a step trace with node ids replaced by coordinates."""
+    node = graph.node
+    if steps.mode == 'visited':
+        records = [(node(n), cost) for n, cost in steps]
+    elif steps.mode in ('frontier', 'full'):
+        records = [(node(n), cost, graph.nodes_of(nodes)) for n, cost, nodes in steps]
+    else:
+        records = []
+    formatted = StepTrace(steps.mode, records)
+    formatted.settled = steps.settled
+    formatted.forward_settled = steps.forward_settled
+    formatted.backward_settled = steps.backward_settled
+    return formatted
+
+def dijkstra_with_steps(graph, start, end, trace='full'):
+    graph = as_csr_graph(graph)
+    steps = StepTrace(trace)
+    start_time = time.perf_counter()
+    source = node_id(graph, start)
+    target = node_id(graph, end)
+
+    dist, predecessor = best_first_search(graph, source, target, steps)
+    path = reconstruct_path(predecessor, target) if dist[target] < math.inf else []
+
+    end_time = time.perf_counter()
+    return format_steps(graph, steps), graph.nodes_of(path), end_time - start_time
+
+# Bellman-Ford variants: full rounds over every edge, a queue of nodes
+# whose distance changed (SPFA), or rounds as NumPy array operations.
+BELLMAN_FORD_METHODS = ('rounds', 'spfa', 'numpy')
+
+def _relax_rounds(graph, source, distance, predecessor):
+    """Relaxes every edge per round, stopping after a round without changes."""
+    offsets = graph.offsets.tolist()
+    targets = graph.targets.tolist()
+    weights = graph.weights.tolist()
+    n = len(graph)
+
+    for _ in range(n):
+        changed = False
+        for node in range(n):
+            node_distance = distance[node]
+            if node_distance == math.inf:
+                continue
+            relaxed = []
+            for e in range(offsets[node], offsets[node + 1]):
+                neighbor = targets[e]
+                new_distance = node_distance + weights[e]
+                if new_distance < distance[neighbor]:
+                    distance[neighbor] = new_distance
+                    predecessor[neighbor] = node
+                    relaxed.append((node, neighbor, new_distance))
+            if relaxed:
+                changed = True
+                yield relaxed
+        if not changed:
+            return
+    # Without negative cycles the n-th round cannot improve anything
+    raise ValueError("Graph contains a negative weight cycle")
+
+def _relax_queue(graph, source, distance, predecessor):
+    """SPFA: only relaxes the out-edges of nodes whose distance changed.
+
+    A path found with ``n`` or more edges must repeat a node, which only
+    happens when it runs through a negative cycle.
+    """
+    offsets = graph.offsets.tolist()
+    targets = graph.targets.tolist()
+    weights = graph.weights.tolist()
+    n = len(graph)
+    hops = [0] * n
+    queued = [False] * n
+    queue = deque([source])
+    queued[source] = True
 
-    end_time = time.time()
-    return steps, path, distance[end], end_time - start_time
+    while queue:
+        node = queue.popleft()
+        queued[node] = False
+        node_distance = distance[node]
+        relaxed = []
+        for e in range(offsets[node], offsets[node + 1]):
+            neighbor = targets[e]
+            new_distance = node_distance + weights[e]
+            if new_distance < distance[neighbor]:
+                distance[neighbor] = new_distance
+                predecessor[neighbor] = node
+                hops[neighbor] = hops[node] + 1
+                if hops[neighbor] >= n:
+                    raise ValueError("Graph contains a negative weight cycle")
+                relaxed.append((node, neighbor, new_distance))
+                if not queued[neighbor]:
+                    queued[neighbor] = True
+                    queue.append(neighbor)
+        if relaxed:
+            yield relaxed
+
+def _relax_numpy(graph, source, distance, predecessor):
+    """Runs Bellman-Ford rounds as array operations over the edge arrays.
+
+    Each round relaxes the edges leaving nodes improved by the previous
+    round against the previous distances and keeps the best candidate per
+    target, so ``distance`` and ``predecessor`` are only written at the end.
+    """
+    offsets = graph.offsets
+    sources = graph.edge_sources()
+    targets = graph.targets
+    weights = graph.weights
+    n = len(graph)
+    dist = np.array(distance, dtype=np.float64)
+    pred = np.array(predecessor, dtype=np.int64)
+    active = np.array([source], dtype=np.int64)
+
+    for _ in range(n):
+        # Concatenated out-edge ranges of the active nodes
+        counts = offsets[active + 1] - offsets[active]
+        ends = np.cumsum(counts)
+        edges = np.arange(ends[-1] if len(ends) else 0) + np.repeat(offsets[active] - (ends - counts), counts)
+        candidates = dist[sources[edges]] + weights[edges]
+        improving = candidates < dist[targets[edges]]
+        edges, candidates = edges[improving], candidates[improving]
+        if len(edges) == 0:
+            break
+        # Best candidate per target: sort by target, then by distance
+        edge_targets = targets[edges]
+        order = np.lexsort((candidates, edge_targets))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = edge_targets[order][1:] != edge_targets[order][:-1]
+        order = order[first]
+        improved = edge_targets[order]
+        dist[improved] = candidates[order]
+        pred[improved] = sources[edges[order]]
+        active = improved.astype(np.int64)
+        yield list(zip(pred[improved].tolist(), improved.tolist(), dist[improved].tolist()))
+    else:
+        raise ValueError("Graph contains a negative weight cycle")
+
+    distance[:] = dist.tolist()
+    predecessor[:] = pred.tolist()
+
+def bellman_ford_relaxations(graph, source, distance, predecessor, method='numpy'):
+    """Yields batches of ``(node, neighbor, cost)`` improvements from ``source``.
+
+    ``distance`` and ``predecessor`` are lists over node ids that hold the
+    final result once the generator is exhausted. Raises ValueError when a
+    negative weight cycle is reachable from ``source``.
+    """
+    relax = {'rounds': _relax_rounds, 'spfa': _relax_queue, 'numpy': _relax_numpy}.get(method)
+    if relax is None:
+        raise ValueError(f"Unknown Bellman-Ford method: {method}")
+    return relax(graph, source, distance, predecessor)
+
+def bellman_ford_with_steps(graph, start, end, trace='full', method='numpy'):
+    graph = as_csr_graph(graph)
+    steps = StepTrace(trace)
+    start_time = time.perf_counter()
+    source = node_id(graph, start)
+    target = node_id(graph, end)
+    tracing = trace != 'none'
+
+    relaxations = 0
+    distance = [math.inf] * len(graph)
+    distance[source] = 0
+    predecessor = [-1] * len(graph)
+
+    for relaxed in bellman_ford_relaxations(graph, source, distance, predecessor, method):
+        relaxations += len(relaxed)
+        if tracing:
+            steps.extend(relaxed)
+
+    path = reconstruct_path(predecessor, target) if distance[target] < math.inf else []
+
+    end_time = time.perf_counter()
+    steps[:] = [(graph.node(node), graph.node(neighbor), dist) for node, neighbor, dist in steps]
+    steps.settled = relaxations
+    return steps, graph.nodes_of(path), distance[target], end_time - start_time
 
 def floyd_warshall_with_steps(graph):
-    start_time = time.time()
-    dist = {u: {v: float('inf') for v in graph} for u in graph}
-    next_node = {u: {v: None for v in graph} for u in graph}
+    graph = as_csr_graph(graph)
+    start_time = time.perf_counter()
+    n = len(graph)
+    dist = [[math.inf] * n for _ in range(n)]
+    next_node = [[None] * n for _ in range(n)]
     steps = []
 
-    for u in graph:
+    for u in range(n):
         dist[u][u] = 0
-        for v, data in graph[u].items():
-            dist[u][v] = data['weight']
+        targets, weights = graph.neighbors(u)
+        for v, weight in zip(targets, weights):
+            dist[u][v] = weight
             next_node[u][v] = v
 
-    for k in graph:
-        for i in graph:
-            for j in graph:
-                if dist[i][k] + dist[k][j] < dist[i][j]:
-                    dist[i][j] = dist[i][k] + dist[k][j]
+    for k in range(n):
+        dist_k = dist[k]
+        for i in range(n):
+            dist_i = dist[i]
+            dist_ik = dist_i[k]
+            if dist_ik == math.inf:
+                continue
+            for j in range(n):
+                if dist_ik + dist_k[j] < dist_i[j]:
+                    dist_i[j] = dist_ik + dist_k[j]
                     next_node[i][j] = next_node[i][k]
-                    steps.append((i, j, dist[i][j]))
-
-    end_time = time.time()
+                    steps.append((i, j, dist_i[j]))
+
+    end_time = time.perf_counter()
+    nodes = graph.nodes_of(range(n))
+    steps = [(nodes[i], nodes[j], d) for i, j, d in steps]
+    dist = {nodes[i]: dict(zip(nodes, row)) for i, row in enumerate(dist)}
+    next_node = {
+        nodes[i]: {nodes[j]: (None if k is None else nodes[k]) for j, k in enumerate(row)}
+        for i, row in enumerate(next_node)
+    }
     return steps, dist, next_node, end_time - start_time
 
-def astar_with_steps(graph, start, end, heuristic=None):
-    start_time = time.time()
+def contraction_hierarchy_with_steps(graph, hierarchy, start, end, trace='full'):
+    graph = as_csr_graph(graph)
+    steps = StepTrace(trace)
+    start_time = time.perf_counter()
+    source = node_id(graph, start)
+    target = node_id(graph, end)
+
+    settled_nodes = []
+    _, path = hierarchy.query(source, target, settled_nodes)
+
+    end_time = time.perf_counter()
+    # Nodes settled in the hierarchy have no road network path of their own,
+    # so the frontier and full modes record them without one.
+    if trace == 'visited':
+        steps.extend((node, cost) for node, cost, _ in settled_nodes)
+    elif trace in ('frontier', 'full'):
+        steps.extend((node, cost, []) for node, cost, _ in settled_nodes)
+    steps.settled = len(settled_nodes)
+    steps.backward_settled = sum(side for _, _, side in settled_nodes)
+    steps.forward_settled = steps.settled - steps.backward_settled
+    return format_steps(graph, steps), graph.nodes_of(path), end_time - start_time
+
+def heuristic_potential(graph, heuristic, end, target):
+    """Turns a heuristic into a function of node ids estimating the distance to ``target``.
+
+    ``heuristic`` is either a function of two coordinates, like
+    ``euclidean_heuristic``, or an object with a ``bind(graph, target)``
+    method such as a landmark heuristic.
+    """
+    if hasattr(heuristic, 'bind'):
+        return heuristic.bind(graph, target)
+    xs = graph.coords[:, 0]
+    ys = graph.coords[:, 1]
+    return lambda node: heuristic((float(xs[node]), float(ys[node])), end)
+
+def astar_with_steps(graph, start, end, heuristic=None, trace='full'):
+    graph = as_csr_graph(graph)
+    steps = StepTrace(trace)
+    start_time = time.perf_counter()
+    source = node_id(graph, start)
+    target = node_id(graph, end)
+
+    potential = None if heuristic is None else heuristic_potential(graph, heuristic, end, target)
+
+    dist, predecessor = best_first_search(graph, source, target, steps, potential)
+    path = reconstruct_path(predecessor, target) if dist[target] < math.inf else []
+
+    end_time = time.perf_counter()
+    return format_steps(graph, steps), graph.nodes_of(path), end_time - start_time
+
+def bidirectional_search(graph, source, target, steps, potential=None):
+    """Runs a forward search from ``source`` and a backward search from ``target``.
+
+    ``potential`` is an optional pair of functions of a node id estimating
+    the distance to ``target`` and from ``source``. Each direction uses half
+    their difference, which keeps the two searches consistent with each
+    other (bidirectional A*). The search stops once the smallest keys of
+    both queues add up to at least the best meeting distance found.
+
+    Returns the best distance, the meeting node and the forward and backward
+    predecessor tables. ``steps`` gets ``forward_settled`` and
+    ``backward_settled`` counts.
+    """
+    n = len(graph)
+    mode = steps.mode
+    record = steps.append
+    if potential is None:
+        forward_potential = backward_potential = lambda node: 0
+    else:
+        to_target, from_source = potential
+        forward_potential = lambda node: (to_target(node) - from_source(node)) / 2
+        backward_potential = lambda node: (from_source(node) - to_target(node)) / 2
+
+    dist = ([math.inf] * n, [math.inf] * n)
+    predecessor = ([-1] * n, [-1] * n)
+    seen = (bytearray(n), bytearray(n))
+    graphs = (graph, graph.reverse())
+    potentials = (forward_potential, backward_potential)
+    settled = [0, 0]
+
+    dist[0][source] = 0
+    dist[1][target] = 0
+    queues = ([(forward_potential(source), source)], [(backward_potential(target), target)])
+    best = 0 if source == target else math.inf
+    meeting_node = source
+
+    while True:
+        # Drop entries of already settled nodes so the queue tops are exact
+        for side in (0, 1):
+            queue, side_seen = queues[side], seen[side]
+            while queue and side_seen[queue[0][1]]:
+                heapq.heappop(queue)
+        if not queues[0] or not queues[1] or queues[0][0][0] + queues[1][0][0] >= best:
+            break
+
+        # Advance whichever search has the smaller key
+        side = 0 if queues[0][0][0] <= queues[1][0][0] else 1
+        _, node = heapq.heappop(queues[side])
+        side_dist, other_dist = dist[side], dist[1 - side]
+        side_seen, side_predecessor = seen[side], predecessor[side]
+
+        side_seen[node] = 1
+        settled[side] += 1
+        cost = side_dist[node]
+
+        frontier = [] if mode == 'frontier' else None
+        side_potential = potentials[side]
+        side_graph = graphs[side]
+        lo, hi = side_graph.offsets[node], side_graph.offsets[node + 1]
+        for neighbor, weight in zip(side_graph.targets[lo:hi].tolist(), side_graph.weights[lo:hi].tolist()):
+            new_cost = cost + weight
+            if new_cost + other_dist[neighbor] < best:
+                best = new_cost + other_dist[neighbor]
+                meeting_node = neighbor
+            if side_seen[neighbor]:
+                continue
+            if new_cost < side_dist[neighbor]:
+                side_dist[neighbor] = new_cost
+                side_predecessor[neighbor] = node
+                heapq.heappush(queues[side], (new_cost + side_potential(neighbor), neighbor))
+                if frontier is not None:
+                    frontier.append(neighbor)
+
+        if mode == 'visited':
+            record((node, cost))
+        elif mode == 'frontier':
+            record((node, cost, frontier))
+        elif mode == 'full':
+            record((node, cost, reconstruct_path(side_predecessor, node)))
+
+    steps.settled = settled[0] + settled[1]
+    steps.forward_settled, steps.backward_settled = settled
+    return best, meeting_node, predecessor[0], predecessor[1]
+
+def join_bidirectional_path(meeting_node, forward_predecessor, backward_predecessor):
+    """Joins the forward path to ``meeting_node`` with the backward path from it."""
+    path = reconstruct_path(forward_predecessor, meeting_node)
+    node = backward_predecessor[meeting_node]
+    while node != -1:
+        path.append(node)
+        node = backward_predecessor[node]
+    return path
+
+def bidirectional_dijkstra_with_steps(graph, start, end, trace='full'):
+    graph = as_csr_graph(graph)
+    steps = StepTrace(trace)
+    start_time = time.perf_counter()
+    source = node_id(graph, start)
+    target = node_id(graph, end)
+
+    best, meeting_node, forward_predecessor, backward_predecessor = bidirectional_search(graph, source, target, steps)
+    path = join_bidirectional_path(meeting_node, forward_predecessor, backward_predecessor) if best < math.inf else []
+
+    end_time = time.perf_counter()
+    return format_steps(graph, steps), graph.nodes_of(path), end_time - start_time
+
+def bidirectional_astar_with_steps(graph, start, end, heuristic=None, trace='full'):
+    graph = as_csr_graph(graph)
+    steps = StepTrace(trace)
+    start_time = time.perf_counter()
     if heuristic is None:
-        heuristic = lambda u, v: 0
-    
-    queue = [(0, start, [])]
-    seen = set()
-    min_dist = {start: 0}
-    steps = []
-    final_path = []
+        # The potentials must be consistent, which the Manhattan distance is not
+        heuristic = euclidean_heuristic
+    source = node_id(graph, start)
+    target = node_id(graph, end)
+
+    xs = graph.coords[:, 0]
+    ys = graph.coords[:, 1]
+    potential = (
+        lambda node: heuristic((float(xs[node]), float(ys[node])), end),
+        lambda node: heuristic(start, (float(xs[node]), float(ys[node]))),
+    )
+    best, meeting_node, forward_predecessor, backward_predecessor = bidirectional_search(graph, source, target, steps, potential)
+    path = join_bidirectional_path(meeting_node, forward_predecessor, backward_predecessor) if best < math.inf else []
+
+    end_time = time.perf_counter()
+    return format_steps(graph, steps), graph.nodes_of(path), end_time - start_time
+
+def iter_best_first_search(graph, start, end, heuristic=None, relaxations=False):
+    """Generator variant of Dijkstra (or A* with a ``heuristic``).
+
+    Yields ``('settle', node, cost)`` as each node is settled and, with
+    ``relaxations``, ``('relax', node, neighbor, cost)`` for every improved
+    distance. Finishes with ``('done', path, total_weight, settled)``. The
+    search only advances while the consumer pulls events, and closing the
+    generator abandons it.
+    """
+    graph = as_csr_graph(graph)
+    source = node_id(graph, start)
+    target = node_id(graph, end)
+    potential = None if heuristic is None else heuristic_potential(graph, heuristic, end, target)
+    n = len(graph)
+    offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+    node_coord = graph.node
+    dist = [math.inf] * n
+    predecessor = [-1] * n
+    seen = bytearray(n)
+
+    dist[source] = 0
+    queue = [(0 if potential is None else potential(source), source)]
+    settled = 0
 
     while queue:
-        (cost, node, path) = heapq.heappop(queue)
-        
-        if node in seen:
+        _, node = heapq.heappop(queue)
+
+        if seen[node]:
             continue
-        
-        seen.add(node)
-        path = path + [node]
-        steps.append((node, cost, path))
-        
-        if node == end:
-            final_path = path
+
+        seen[node] = 1
+        settled += 1
+        cost = dist[node]
+        yield ('settle', node_coord(node), cost)
+
+        if node == target:
             break
-        
-        for neighbor, data in graph[node].items():
-            if neighbor in seen:
+
+        lo, hi = offsets[node], offsets[node + 1]
+        for neighbor, weight in zip(targets[lo:hi].tolist(), weights[lo:hi].tolist()):
+            if seen[neighbor]:
                 continue
-            prev_cost = min_dist.get(neighbor, float('inf'))
-            new_cost = cost + data['weight']
-            if new_cost < prev_cost:
-                min_dist[neighbor] = new_cost
-                priority = new_cost + heuristic(neighbor, end)
-                heapq.heappush(queue, (priority, neighbor, path))
-    
-    end_time = time.time()
-    return steps, final_path, end_time - start_time
+            new_cost = cost + weight
+            if new_cost < dist[neighbor]:
+                dist[neighbor] = new_cost
+                predecessor[neighbor] = node
+                heapq.heappush(queue, (new_cost if potential is None else new_cost + potential(neighbor), neighbor))
+                if relaxations:
+                    yield ('relax', node_coord(node), node_coord(neighbor), new_cost)
+
+    if dist[target] < math.inf:
+        yield ('done', graph.nodes_of(reconstruct_path(predecessor, target)), dist[target], settled)
+    else:
+        yield ('done', [], math.inf, settled)
+
+def iter_bellman_ford(graph, start, end, method='numpy'):
+    """Generator variant of Bellman-Ford.
+
+    Yields ``('relax', node, neighbor, cost)`` for every improved distance
+    and finishes with ``('done', path, total_weight, relaxations)``.
+    """
+    graph = as_csr_graph(graph)
+    source = node_id(graph, start)
+    target = node_id(graph, end)
+    node_coord = graph.node
+
+    relaxations = 0
+    distance = [math.inf] * len(graph)
+    distance[source] = 0
+    predecessor = [-1] * len(graph)
+
+    for relaxed in bellman_ford_relaxations(graph, source, distance, predecessor, method):
+        relaxations += len(relaxed)
+        for node, neighbor, cost in relaxed:
+            yield ('relax', node_coord(node), node_coord(neighbor), cost)
+
+    path = reconstruct_path(predecessor, target) if distance[target] < math.inf else []
+    yield ('done', graph.nodes_of(path), distance[target], relaxations)
 
 def manhattan_heuristic(u, v):
     x1, y1 = u
@@ -142,15 +635,14 @@ def euclidean_heuristic(u, v):
     return math.sqrt((x2 - x1)**2 + (y2 - y1)**2)
 
 def calculate_total_weight(graph, path):
+    graph = as_csr_graph(graph)
     total_weight = 0
-    for i in range(1, len(path)):
-        node = path[i-1]
-        next_node = path[i]
-        edge_weight = graph[node][next_node]['weight']
-        total_weight += edge_weight
+    ids = [node_id(graph, node) for node in path]
+    for i in range(1, len(ids)):
+        total_weight += graph.edge_weight(ids[i - 1], ids[i])
     return total_weight
 
-def generate_random_point_pairs(starts, ends, num_pairs=1000):
+def generate_random_point_pairs(starts, ends, num_pairs=1000, seed=None):
     '''
     Randomly generate a specified number of point pairs with different start and end points
     
@@ -158,6 +650,7 @@ def generate_random_point_pairs(starts, ends, num_pairs=1000):
     starts (list): List of start points
     ends (list): List of end points
     num_pairs (int): Number of point pairs to generate, default is 1000
+    seed (int): Seed of the random choices, for the same pairs on every run
     
     Return:
     A tuple containing lists of start points and end points
@@ -166,13 +659,14 @@ def generate_random_point_pairs(starts, ends, num_pairs=1000):
     if len(starts) < num_pairs or len(ends) < num_pairs:
         raise ValueError('Input list length must be at least the number of point pairs.')
     
-    start_indices = random.sample(range(len(starts)), num_pairs)
-    end_indices = random.sample(range(len(ends)), num_pairs)
+    rng = random.Random(seed)
+    start_indices = rng.sample(range(len(starts)), num_pairs)
+    end_indices = rng.sample(range(len(ends)), num_pairs)
 
     # Ensure start and end points are different
     for i in range(num_pairs):
         while starts[start_indices[i]] == ends[end_indices[i]]:
-            end_indices[i] = random.choice(range(len(ends)))
+            end_indices[i] = rng.choice(range(len(ends)))
 
     start_pairs = [starts[idx] for idx in start_indices]
     end_pairs = [ends[idx] for idx in end_indices]
@@ -181,142 +675,23 @@ def generate_random_point_pairs(starts, ends, num_pairs=1000):
 
 
 def insert_network_data(data, db_manager):
-    """Parses and inserts network data into the database."""
-    nodes = {}  
-    edges = []  
-
-    for feature in data['features']:
-        properties = feature['properties']
-        geometry = feature['geometry']
-
-        coordinates = geometry['coordinates']
-
-        for idx, coord in enumerate(coordinates):
-            coord_str = f"{coord[0]},{coord[1]}" 
-            if coord_str not in nodes:
-                node = db_manager.add_node(name=f"Node_{len(nodes) + 1}", coordinates=coord_str)
-                nodes[coord_str] = node.NodeID
-
-            if idx == 0:
-                continue
+    """Parses and inserts network data into the database.
 
-            source = nodes[f"{coordinates[idx - 1][0]},{coordinates[idx - 1][1]}"]
-            destination = nodes[coord_str]
-            distance = properties['length']  
-            bidirectional = True  
+    Each edge is weighted by the ``length`` property of its feature, or by
+    its segment length when a feature has none.
+    """
+    from graph_builder import lines_from_features
 
-            edges.append((source, destination, distance, bidirectional))
+    features = [feature for feature in data['features']
+                if (feature.get('geometry') or {}).get('type') in ('LineString', 'MultiLineString')]
+    coords, line_offsets, _ = lines_from_features(features)
 
-    print(f"Inserted {len(nodes)} nodes")
-
-    for edge in edges:
-        db_manager.add_edge(
-            source_node_id=edge[0],
-            destination_node_id=edge[1],
-            distance=edge[2],
-            bidirectional=edge[3]
-        )
-
-
-if __name__ == '__main__':
-    G = nx.DiGraph()
-    edges = []
-    
-    starts = []
-    ends = []
-
-    gdf = gpd.read_file('./data/graph/complete_graph.geojson')
-
-    for _, row in gdf.iterrows():
-        geom = row.geometry
-
-        if geom.geom_type == 'LineString':
-            start_node = tuple(geom.coords[0])
-            end_node = tuple(geom.coords[-1])
-            length = geom.length
-            edges.append((start_node, end_node, length))
-            edges.append((end_node, start_node, length))
-
-            starts.append(start_node)
-            ends.append(end_node)
-        else:
-            raise ValueError(f"Unexpected geometry type: {geom.geom_type}")
-        
-    G.add_weighted_edges_from(edges)
-    
-    start_pairs, end_pairs = generate_random_point_pairs(starts,ends)
-    
-    # Initialize total steps, paths, time, weight variables for each algorithm
-    dijkstra_steps_sum = 0
-    dijkstra_time_sum = 0
-    dijkstra_total_weight_sum = 0
-    astar_steps_sum = 0
-    astar_time_sum = 0
-    astar_total_weight_sum = 0
-    astar_steps2_sum = 0
-    astar_time2_sum = 0
-    astar_total_weight2_sum = 0
-    bellman_ford_steps_sum = 0
-    bellman_ford_time_sum = 0
-    bellman_ford_total_weight_sum = 0
-    floyd_warshall_steps_sum = 0
-    floyd_warshall_time_sum = 0
-    floyd_warshall_total_weight_sum = 0
-
-    '''
-    start_node = (462555.702, 89140.515)
-    end_node = (463122.297, 88799.614)
-    '''
+    lengths = []
+    for feature in features:
+        geometry = feature['geometry']
+        parts = 1 if geometry['type'] == 'LineString' else len(geometry['coordinates'])
+        length = (feature.get('properties') or {}).get('length')
+        lengths.extend([math.nan if length is None else length] * parts)
 
-    for i in range(1000):
-        start_node = start_pairs[i]
-        end_node = end_pairs[i]
-
-        # Dijkstra
-        dijkstra_steps, dijkstra_path, dijkstra_time = dijkstra_with_steps(G, start_node, end_node)
-        dijkstra_total_weight = calculate_total_weight(G, dijkstra_path)
-        dijkstra_steps_sum += len(dijkstra_steps)
-        dijkstra_total_weight_sum += dijkstra_total_weight
-        dijkstra_time_sum += dijkstra_time
-        
-        # A* (Manhattan)
-        astar_steps, astar_path, astar_time = astar_with_steps(G, start_node, end_node, heuristic=manhattan_heuristic)
-        astar_total_weight = calculate_total_weight(G, astar_path)
-        astar_steps_sum += len(astar_steps)
-        astar_total_weight_sum += astar_total_weight
-        astar_time_sum += astar_time
-
-        # A* (Euclidean)
-        astar_steps2, astar_path2, astar_time2 = astar_with_steps(G, start_node, end_node, heuristic=euclidean_heuristic)
-        astar_total_weight2 = calculate_total_weight(G, astar_path2)
-        astar_steps2_sum += len(astar_steps2)
-        astar_total_weight2_sum += astar_total_weight2
-        astar_time2_sum += astar_time2
-        '''
-        # Bellman-Ford
-        bellman_ford_steps, bellman_ford_path, bellman_ford_total_weight, bellman_ford_time = bellman_ford_with_steps(G, start_node, end_node)
-        bellman_ford_steps_sum += len(bellman_ford_steps)
-        bellman_ford_total_weight_sum += bellman_ford_total_weight
-        bellman_ford_time_sum += bellman_ford_time
-
-        # Floyd-Warshall
-        floyd_warshall_steps, floyd_warshall_dist, floyd_warshall_next_node, floyd_warshall_time = floyd_warshall_with_steps(G)
-        floyd_warshall_total_weight = floyd_warshall_dist[start_node][end_node]
-        floyd_warshall_steps_sum += len(floyd_warshall_steps)
-        floyd_warshall_total_weight_sum += floyd_warshall_total_weight
-        floyd_warshall_time_sum += floyd_warshall_time
-        '''
-
-    print(f"Dijkstra Steps: {dijkstra_steps_sum/1000}")
-    print(f"Dijkstra Total Weight: {dijkstra_total_weight_sum/1000}")
-    print(f"Dijkstra Time: {dijkstra_time_sum/1000}")
-
-    print(f"A* (Manhattan) Steps: {astar_steps_sum/1000}")
-    print(f"A* (Manhattan) Total Weight: {astar_total_weight_sum/1000}")
-    print(f"A* (Manhattan) Time: {astar_time_sum/1000}")
-
-    print(f"A* (Euclidean) Steps: {astar_steps2_sum/1000}")
-    print(f"A* (Euclidean) Total Weight: {astar_total_weight2_sum/1000}")
-    print(f"A* (Euclidean) Time: {astar_time2_sum/1000}")
-    
-    
\ No newline at end of file
+    node_count, edge_count = db_manager.import_network(coords, line_offsets, lengths)
+    print(f"Inserted {node_count} nodes and {edge_count} edges")
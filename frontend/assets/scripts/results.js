@@ -181,7 +181,7 @@ function setAlgorithmTitles(params) {
 
 async function fetchGraph(graphId) {
     try {
-        const response = await fetch(`/api/graph/${graphId}`);
+        const response = await fetch(`/api/graph/${graphId}?slim=1`);
         if (!response.ok) {
             throw new Error('Graph not found');
         }
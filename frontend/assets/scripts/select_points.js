@@ -15,7 +15,7 @@ fetch('/api/graph')
 document.getElementById('graphSelect').addEventListener('change', function() {
     const graphId = this.value;
     if (graphId) {
-        fetch(`/api/graph/${graphId}`)
+        fetch(`/api/graph/${graphId}?slim=1`)
             .then(response => response.json())
             .then(graph => {
                 drawGraph(graph);
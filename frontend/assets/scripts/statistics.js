@@ -1,36 +1,68 @@
-
 document.addEventListener('DOMContentLoaded', function () {
     const statisticsTableBody = document.querySelector('#statisticsTable tbody');
 
+    // The server holds each request until new results are recorded, up to this many seconds
+    const LONG_POLL_SECONDS = 25;
+    const RETRY_DELAY = 5000;
+
+    let etag = null;
+
+    function formatMs(seconds) {
+        return seconds !== null ? (seconds * 1000).toFixed(3) : '-';
+    }
+
+    function formatPercentiles(stat, metric, format) {
+        return [50, 95, 99].map(p => format(stat[`p${p}_${metric}`])).join(' / ');
+    }
+
+    function renderStatistics(statistics) {
+        statisticsTableBody.innerHTML = '';
+
+        statistics.forEach(stat => {
+            const row = document.createElement('tr');
+            row.innerHTML = `
+                <td>${stat.algorithm}</td>
+                <td>${stat.total_records}</td>
+                <td>${stat.average_steps}</td>
+                <td>${formatPercentiles(stat, 'steps', value => value !== null ? value : '-')}</td>
+                <td>${stat.average_forward_steps !== null ? `${stat.average_forward_steps} / ${stat.average_backward_steps}` : '-'}</td>
+                <td>${stat.average_path_length}</td>
+                <td>${formatMs(stat.average_time)}</td>
+                <td>${formatPercentiles(stat, 'time', formatMs)}</td>
+                <td>${stat.average_weight}</td>
+            `;
+            statisticsTableBody.appendChild(row);
+        });
+    }
+
     async function fetchAndUpdateStatistics() {
         try {
-            const response = await fetch('/api/statistics');
+            // Send the version we have; the server answers 304 while it is current
+            const headers = etag ? { 'If-None-Match': etag } : {};
+            const response = await fetch(`/api/statistics?wait=${etag ? LONG_POLL_SECONDS : 0}`, { headers, cache: 'no-store' });
+            if (response.status === 304) {
+                return true;
+            }
             if (!response.ok) {
                 throw new Error('Failed to fetch statistics');
             }
 
-            const statistics = await response.json();
-
-            statisticsTableBody.innerHTML = '';
-
-            statistics.forEach(stat => {
-                const row = document.createElement('tr');
-                row.innerHTML = `
-                    <td>${stat.algorithm}</td>
-                    <td>${stat.total_records}</td>
-                    <td>${stat.average_steps}</td>
-                    <td>${stat.average_path_length}</td>
-                    <td>${stat.average_time}</td>
-                    <td>${stat.average_weight}</td>
-                `;
-                statisticsTableBody.appendChild(row);
-            });
+            etag = response.headers.get('ETag');
+            renderStatistics(await response.json());
+            return true;
         } catch (error) {
             console.error('Error fetching statistics:', error);
+            return false;
         }
     }
 
-    fetchAndUpdateStatistics();
+    async function pollStatistics() {
+        while (true) {
+            if (!await fetchAndUpdateStatistics()) {
+                await new Promise(resolve => setTimeout(resolve, RETRY_DELAY));
+            }
+        }
+    }
 
-    setInterval(fetchAndUpdateStatistics, 5000);
+    pollStatistics();
 });